@@ -1,37 +1,39 @@
 import os
-import traceback
-from subprocess import check_output
-
-try:
-    VERSION = __import__("pkg_resources").get_distribution("inference").version
-except Exception:
-    VERSION = "unknown"
+from functools import lru_cache
 
 # fix is in the works see: https://github.com/mpdavis/python-jose/pull/207
 import warnings
 
 warnings.filterwarnings("ignore", message="int_from_bytes is deprecated")
 
-# sometimes we pull version info before inference is totally installed
-try:
-    from inference.project.models import Project  # noqa lgtm[py/unused-import]
-
-
-except Exception:
-    traceback.print_exc()
+# written at build time, e.g. `git rev-parse HEAD > app/BUILD`, such that no checkout is needed at runtime
+BUILD_FILE = os.path.join(os.path.dirname(__file__), "BUILD")
 
 
 def _get_git_revision(path):
-    if not os.path.exists(os.path.join(path, ".git")):
-        return None
+    """Reads the revision of the checkout from the .git directory, without running git."""
+    git_dir = os.path.join(path, ".git")
     try:
-        revision = check_output(["git", "rev-parse", "HEAD"], cwd=path, env=os.environ)
-    except Exception:
-        # binary didn't exist, wasn't on path, etc
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            # detached head
+            return head
+        ref = head[len("ref: "):]
+        try:
+            with open(os.path.join(git_dir, ref)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            with open(os.path.join(git_dir, "packed-refs")) as f:
+                for line in f:
+                    if line.rstrip().endswith(" " + ref):
+                        return line.split(" ", 1)[0]
+    except OSError:
         return None
-    return revision.decode("utf-8").strip()
+    return None
 
 
+@lru_cache(maxsize=None)
 def get_revision():
     """
     :returns: Revision number of this branch/checkout, if available. None if
@@ -39,19 +41,36 @@ def get_revision():
     """
     if "INFERENCE_BUILD" in os.environ:
         return os.environ["INFERENCE_BUILD"]
+    if os.path.exists(BUILD_FILE):
+        with open(BUILD_FILE) as f:
+            return f.read().strip() or None
     package_dir = os.path.dirname(__file__)
-    checkout_dir = os.path.normpath(os.path.join(package_dir, os.pardir, os.pardir))
-    path = os.path.join(checkout_dir)
-    if os.path.exists(path):
-        return _get_git_revision(path)
-    return None
+    checkout_dir = os.path.normpath(os.path.join(package_dir, os.pardir))
+    return _get_git_revision(checkout_dir)
+
+
+@lru_cache(maxsize=None)
+def _get_package_version():
+    # importlib.metadata is much cheaper to import than pkg_resources
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("inference")
+    except PackageNotFoundError:
+        return "unknown"
 
 
 def get_version():
-    if __build__:
-        return f"{__version__}.{__build__}"
-    return __version__
+    build = get_revision()
+    if build:
+        return f"{_get_package_version()}.{build}"
+    return _get_package_version()
 
 
-__version__ = VERSION
-__build__ = get_revision()
+def __getattr__(name):
+    # the version and revision are only looked up when first asked for
+    if name in ("VERSION", "__version__"):
+        return _get_package_version()
+    if name == "__build__":
+        return get_revision()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
+import hmac
 from typing import List, Optional
 
-from fastapi import APIRouter
-from pydantic import BaseModel
-from starlette.responses import JSONResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from pydantic import BaseModel, confloat
+from starlette.responses import PlainTextResponse, Response
 
-from .project.views import router as project_router
+from .config import DATABASE_ASYNC_MODE, PROFILING_ADMIN_TOKEN, PROFILING_OUTPUT_DIR
+from .inference.views import router as inference_router
+from .job.views import router as job_router
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry as metrics_registry
+from .profiling import profiler
+from .project.service import project_cache
+from .responses import ORJSONResponse
+from .project.views import (
+    async_router as async_project_router,
+    collection_router as project_collection_router,
+    router as project_router,
+)
 
 
 class ErrorMessage(BaseModel):
@@ -16,8 +28,25 @@ class ErrorResponse(BaseModel):
     detail: Optional[List[ErrorMessage]]
 
 
+class ProfilingSettings(BaseModel):
+    enabled: Optional[bool]
+    sample_rate: Optional[confloat(ge=0, le=1)]
+    interval: Optional[confloat(gt=0)]
+    slow_query_threshold: Optional[confloat(ge=0)]
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Lets through the requests carrying the PROFILING_ADMIN_TOKEN, none if it is not set."""
+    token = str(PROFILING_ADMIN_TOKEN)
+    if not token or not hmac.compare_digest((x_admin_token or "").encode(), token.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=[{"msg": "A valid X-Admin-Token is required."}],
+        )
+
+
 api_router = APIRouter(
-    default_response_class=JSONResponse,
+    default_response_class=ORJSONResponse,
     responses={
         400: {"model": ErrorResponse},
         401: {"model": ErrorResponse},
@@ -28,10 +57,63 @@ api_router = APIRouter(
 )
 
 api_router.include_router(
-    project_router, prefix="/projects", tags=["projects"]
+    project_collection_router, prefix="/projects", tags=["projects"]
+)
+api_router.include_router(
+    async_project_router if DATABASE_ASYNC_MODE else project_router,
+    prefix="/projects",
+    tags=["projects"],
 )
+api_router.include_router(inference_router, prefix="/inference", tags=["inference"])
+api_router.include_router(job_router, prefix="/jobs", tags=["jobs"])
+
+# switches the profiler, which slows requests down, and exposes the SQL, hence only for admins
+profiling_router = APIRouter(dependencies=[Depends(require_admin_token)])
 
 
 @api_router.get("/healthcheck", include_in_schema=False)
 def healthcheck():
     return {"status": "ok"}
+
+
+@api_router.get("/cache", include_in_schema=False)
+def cache_stats():
+    return {"projects": project_cache.stats()}
+
+
+@api_router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@profiling_router.get("", include_in_schema=False)
+def get_profiling():
+    return profiler.settings()
+
+
+@profiling_router.put("", include_in_schema=False)
+def update_profiling(settings: ProfilingSettings):
+    """Switches profiling on or off and changes its settings without a restart."""
+    return profiler.configure(**settings.dict())
+
+
+@profiling_router.get("/profiles", include_in_schema=False)
+def get_profiles(route: Optional[str] = None):
+    """Returns the number of samples by route, or the collapsed stacks of `route`."""
+    if route is not None:
+        return PlainTextResponse(profiler.collapsed(route))
+    return {route: sum(profile.values()) for route, profile in list(profiler.profiles.items())}
+
+
+@profiling_router.post("/profiles", include_in_schema=False)
+def write_profiles():
+    """Writes the collapsed stacks of every route to the output directory."""
+    return {"paths": profiler.write(PROFILING_OUTPUT_DIR)}
+
+
+@profiling_router.get("/slow-queries", include_in_schema=False)
+def get_slow_queries():
+    return list(profiler.slow_queries)
+
+
+api_router.include_router(profiling_router, prefix="/profiling", include_in_schema=False)
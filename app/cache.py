@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from . import config
+
+
+class CacheBackend:
+    """
+    Interface of the cache backends.
+
+    Backends only store plain values (e.g. the `dict()` of a model), never
+    objects bound to a database session. The `async_` methods run the
+    `blocking` backends, doing network I/O, in the thread pool such that
+    they do not block the event loop.
+    """
+
+    blocking = True
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    async def async_get(self, key: str) -> Optional[Any]:
+        if not self.blocking:
+            return self.get(key)
+        return await run_in_threadpool(self.get, key)
+
+    async def async_set(self, key: str, value: Any) -> None:
+        if not self.blocking:
+            return self.set(key, value)
+        await run_in_threadpool(self.set, key, value)
+
+    async def async_delete(self, *keys: str) -> None:
+        if not self.blocking:
+            return self.delete(*keys)
+        await run_in_threadpool(self.delete, *keys)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit/miss/eviction counters of the cache."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class NullCache(CacheBackend):
+    """A cache that never holds anything, used when caching is disabled."""
+
+    blocking = False
+
+    def get(self, key: str) -> Optional[Any]:
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def delete(self, *keys: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class LRUCache(CacheBackend):
+    """An in-process least recently used cache bounded in size, whose entries expire after `ttl` seconds."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 60):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), "size": len(self._data), "maxsize": self.maxsize}
+
+
+class RedisCache(CacheBackend):
+    """
+    A cache shared between processes, stored in Redis.
+
+    Any client with the `get`/`set(ex=...)`/`delete` methods of `redis.Redis`
+    can be used. Redis evicts entries by itself, so `evictions` stays at zero.
+    """
+
+    def __init__(self, client, ttl: int = 60, prefix: str = "inference:"):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls.
+
+    While a call for a key is in flight, the other callers asking for the
+    same key wait for it and share its result (or its exception) instead of
+    making the call themselves, e.g. such that a burst of requests for the
+    same row runs one query. `do` is used from threads and `async_do` from
+    the event loop, the two do not share their calls. The results are shared
+    between the callers, so they must be plain values, never objects bound to
+    a database session.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def async_do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._async_calls.get(key)
+        while future is not None:
+            self.shared += 1
+            try:
+                # the callers waiting for the call do not cancel it when they are cancelled
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # the caller making the call was cancelled, the call is made again
+            future = self._async_calls.get(key)
+
+        future = self._async_calls[key] = asyncio.get_running_loop().create_future()
+        self.calls += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # the exception is raised here, there need not be any other caller to retrieve it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._async_calls[key]
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Returns how many calls were made and how many callers shared the call of another one."""
+        return {"calls": self.calls, "shared": self.shared}
+
+
+def create_cache(backend: str = config.CACHE_BACKEND) -> CacheBackend:
+    """Creates the cache backend configured by `CACHE_BACKEND`."""
+    if backend == "memory":
+        return LRUCache(maxsize=config.CACHE_MAX_SIZE, ttl=config.CACHE_TTL)
+
+    if backend == "redis":
+        # redis is an optional dependency only needed for the shared cache
+        import redis
+
+        return RedisCache(redis.Redis.from_url(str(config.CACHE_REDIS_URL)), ttl=config.CACHE_TTL)
+
+    return NullCache()
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import config
+
+# brotli and zstandard are optional dependencies, the encodings are only offered when they are installed
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+# content types whose bodies are already compressed
+INCOMPRESSIBLE_TYPES = (
+    "image/",
+    "audio/",
+    "video/",
+    "font/woff",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "application/zstd",
+    "application/x-brotli",
+    "application/octet-stream",
+    "application/pdf",
+    "text/event-stream",
+)
+
+
+class Compressor:
+    """An incremental compressor of one response body."""
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def flush(self) -> bytes:
+        """Returns everything compressed so far, such that the client can decompress it right away."""
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        raise NotImplementedError
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encodings() -> Dict[str, tuple]:
+    """Returns the supported encodings and their compressor and level, in order of preference."""
+    encodings = {}
+    if brotli is not None:
+        encodings["br"] = (BrotliCompressor, config.COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        encodings["zstd"] = (ZstdCompressor, config.COMPRESSION_ZSTD_LEVEL)
+    encodings["gzip"] = (GzipCompressor, config.COMPRESSION_GZIP_LEVEL)
+    return encodings
+
+
+def negotiate(accept_encoding: str, encodings: List[str]) -> Optional[str]:
+    """
+    Picks the encoding of the response from the `Accept-Encoding` header.
+
+    The encoding with the highest quality value wins, ties go to the first
+    one of `encodings`. Returns None if the client accepts none of them.
+    """
+    qualities = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[coding.strip()] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with brotli, zstd or gzip, as negotiated with the client.
+
+    Bodies smaller than `minimum_size`, bodies of already compressed content
+    types and responses that already have a `Content-Encoding` are sent as
+    they are. Streaming responses are compressed chunk by chunk and every
+    chunk is flushed to the client. Bodies and chunks of at least
+    `threadpool_size` bytes are compressed in the threadpool so they do not
+    block the event loop.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1000,
+        threadpool_size: int = 64 * 1024,
+        encodings: Dict[str, tuple] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+        self.encodings = available_encodings() if encodings is None else encodings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+            encoding = negotiate(accept_encoding, list(self.encodings))
+            if encoding is not None:
+                compressor_class, level = self.encodings[encoding]
+                responder = CompressionResponder(
+                    self.app, encoding, lambda: compressor_class(level), self.minimum_size, self.threadpool_size
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, compressor_factory, minimum_size: int, threadpool_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.compressor_factory = compressor_factory
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+        self.send: Send = None
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def _run(self, func, data: bytes) -> bytes:
+        if len(data) >= self.threadpool_size:
+            return await run_in_threadpool(func, data)
+        return func(data)
+
+    def _compress_body(self, body: bytes) -> bytes:
+        compressor = self.compressor_factory()
+        return compressor.compress(body) + compressor.finish()
+
+    def _compress_chunk(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk) + self.compressor.flush()
+
+    def _compress_last_chunk(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk) + self.compressor.finish()
+
+    def _compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").lower()
+        return not content_type.startswith(INCOMPRESSIBLE_TYPES)
+
+    async def send_compressed(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # the headers are only sent along with the first part of the body
+            self.start_message = message
+            self.passthrough = not self._compressible(Headers(raw=message["headers"]))
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is None:
+            # a following chunk of a streaming response
+            body = await self._run(self._compress_chunk if more_body else self._compress_last_chunk, body)
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        if not more_body:
+            # the whole body is known, it is only compressed when it is worth it
+            compressed = await self._run(self._compress_body, body) if len(body) >= self.minimum_size else body
+            if len(compressed) < len(body):
+                body = compressed
+                headers["Content-Encoding"] = self.encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+        else:
+            self.compressor = self.compressor_factory()
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            body = await self._run(self._compress_chunk, body)
+
+        await self.send(self.start_message)
+        self.start_message = None
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
 import logging
+import os
+import tempfile
 from urllib import parse
 
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 
 LOG_LEVEL = config("LOG_LEVEL", default=logging.WARNING)
+# "json" writes one JSON object per record, "text" the plain logging format
+LOG_FORMAT = config("LOG_FORMAT", default="json")
+# the records wait in a queue for the writer thread, once it is full the new ones are dropped
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", cast=int, default=10000)
+# the maximum number of records written at once
+LOG_BATCH_SIZE = config("LOG_BATCH_SIZE", cast=int, default=100)
+# once the queue is 80% full only one in this many records below WARNING is kept
+LOG_SAMPLE_RATE = config("LOG_SAMPLE_RATE", cast=int, default=10)
 
 # database
 DATABASE_HOSTNAME = config("DATABASE_HOSTNAME", default="127.0.0.1")
@@ -18,11 +28,137 @@ _DATABASE_CREDENTIAL_USER, _DATABASE_CREDENTIAL_PASSWORD = str(DATABASE_CREDENTI
 _QUOTED_DATABASE_PASSWORD = parse.quote(str(_DATABASE_CREDENTIAL_PASSWORD))
 DATABASE_NAME = config("DATABASE_NAME", default="inference")
 DATABASE_PORT = config("DATABASE_PORT", default="5432")
-DATABASE_ENGINE_POOL_SIZE = config("DATABASE_ENGINE_POOL_SIZE", cast=int, default=500)
+# the connections all workers together may open, it has to stay below max_connections of the database
+DATABASE_CONNECTION_BUDGET = config("DATABASE_CONNECTION_BUDGET", cast=int, default=90)
+# number of worker processes sharing the budget, the variable is also read by uvicorn and gunicorn.
+# The launcher (run.py) starts one worker per CPU if not set
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", cast=int, default=None)
+# number of threads serving the sync endpoints of a worker
+THREADPOOL_SIZE = config("THREADPOOL_SIZE", cast=int, default=40)
+# the maximum size of the pool of a worker, derived from the budget if not set
+DATABASE_ENGINE_POOL_SIZE = config("DATABASE_ENGINE_POOL_SIZE", cast=int, default=None)
 DATABASE_ENGINE_MAX_OVERFLOW = config("DATABASE_ENGINE_MAX_OVERFLOW", cast=int, default=0)
+# idle connections are closed after this many seconds, down to the minimum size
+DATABASE_ENGINE_POOL_MIN_SIZE = config("DATABASE_ENGINE_POOL_MIN_SIZE", cast=int, default=2)
+DATABASE_ENGINE_POOL_IDLE_TIMEOUT = config("DATABASE_ENGINE_POOL_IDLE_TIMEOUT", cast=float, default=60)
+# how long a request waits for a connection, and how many may wait, before it fails with a 503
+DATABASE_ENGINE_POOL_TIMEOUT = config("DATABASE_ENGINE_POOL_TIMEOUT", cast=float, default=5)
+DATABASE_ENGINE_POOL_MAX_WAITERS = config("DATABASE_ENGINE_POOL_MAX_WAITERS", cast=int, default=100)
 # Deal with DB disconnects
 # https://docs.sqlalchemy.org/en/20/core/pooling.html#pool-disconnects
 DATABASE_ENGINE_POOL_PING = config("DATABASE_ENGINE_POOL_PING", default=False)
 DATABASE_ENGINE_POOL_RECYCLE = config("DATABASE_ENGINE_POOL_RECYCLE", cast=int, default=3600)
+# How long (in seconds) the reflected schema names are trusted before they are loaded again
+DATABASE_SCHEMA_REGISTRY_TTL = config("DATABASE_SCHEMA_REGISTRY_TTL", cast=int, default=300)
+# number of schemas whose engine and session factories are kept, the least recently used ones are dropped
+DATABASE_SCHEMA_REGISTRY_MAX_SIZE = config("DATABASE_SCHEMA_REGISTRY_MAX_SIZE", cast=int, default=1000)
 SQLALCHEMY_DATABASE_URI = (f"postgresql+psycopg2://{_DATABASE_CREDENTIAL_USER}:{_QUOTED_DATABASE_PASSWORD}@"
                            f"{DATABASE_HOSTNAME}:{DATABASE_PORT}/{DATABASE_NAME}")
+# Serve the API with async handlers on top of asyncpg instead of sync handlers in the threadpool
+DATABASE_ASYNC_MODE = config("DATABASE_ASYNC_MODE", cast=bool, default=False)
+SQLALCHEMY_ASYNC_DATABASE_URI = (f"postgresql+asyncpg://{_DATABASE_CREDENTIAL_USER}:{_QUOTED_DATABASE_PASSWORD}@"
+                                 f"{DATABASE_HOSTNAME}:{DATABASE_PORT}/{DATABASE_NAME}")
+
+# multi-tenancy, every tenant has its own database schema.
+# Where the tenant of a request comes from: "none" (always TENANT_DEFAULT), "header", "subdomain" or "token"
+TENANT_SOURCE = config("TENANT_SOURCE", default="none")
+TENANT_HEADER = config("TENANT_HEADER", default="X-Tenant")
+# the schema of the requests naming no tenant, they are rejected if it is empty
+TENANT_DEFAULT = config("TENANT_DEFAULT", default="public")
+# the tenants are served from <tenant>.<TENANT_DOMAIN>
+TENANT_DOMAIN = config("TENANT_DOMAIN", default="")
+# the claim of the bearer token (HS256 JWT signed with TENANT_TOKEN_SECRET) naming the tenant
+TENANT_CLAIM = config("TENANT_CLAIM", default="tenant")
+TENANT_TOKEN_SECRET = config("TENANT_TOKEN_SECRET", cast=Secret, default="")
+
+# read replicas, comma separated SQLAlchemy URIs. The reads of GET requests go to a healthy replica, round robin
+DATABASE_REPLICA_URIS = config("DATABASE_REPLICA_URIS", cast=CommaSeparatedStrings, default="")
+# seconds between two health checks of the replicas
+DATABASE_REPLICA_CHECK_INTERVAL = config("DATABASE_REPLICA_CHECK_INTERVAL", cast=float, default=5)
+# replicas lagging more than this many seconds behind the primary are not read from, 0 does not check it
+DATABASE_REPLICA_MAX_LAG = config("DATABASE_REPLICA_MAX_LAG", cast=float, default=0)
+# a client keeps reading from the primary for this many seconds after a write, such that it reads its writes
+DATABASE_READ_YOUR_WRITES_WINDOW = config("DATABASE_READ_YOUR_WRITES_WINDOW", cast=int, default=5)
+
+# number of projects the NDJSON bulk endpoint inserts per statement and transaction
+PROJECT_BULK_BATCH_SIZE = config("PROJECT_BULK_BATCH_SIZE", cast=int, default=1000)
+# number of rows the export fetches per round trip from its server-side cursor
+PROJECT_EXPORT_BATCH_SIZE = config("PROJECT_EXPORT_BATCH_SIZE", cast=int, default=5000)
+# Cache-Control of the project reads, by default clients may keep them but revalidate them (with their ETag)
+PROJECT_CACHE_CONTROL = config("PROJECT_CACHE_CONTROL", default="private, no-cache")
+
+# inference, the model is a "module:class" loaded in every process of the pool
+INFERENCE_MODEL = config("INFERENCE_MODEL", default="app.inference.toy:ToyModel")
+# number of processes running the model, next to the worker processes serving the API
+INFERENCE_WORKERS = config("INFERENCE_WORKERS", cast=int, default=1)
+# concurrent predictions are run together, in batches of at most this size
+INFERENCE_MAX_BATCH_SIZE = config("INFERENCE_MAX_BATCH_SIZE", cast=int, default=32)
+# how long (in seconds) a batch waits for more predictions once it has the first one
+INFERENCE_MAX_WAIT = config("INFERENCE_MAX_WAIT", cast=float, default=0.005)
+# predictions waiting for a batch, the following ones are rejected with a 503
+INFERENCE_MAX_PENDING = config("INFERENCE_MAX_PENDING", cast=int, default=1000)
+# whether the warm-up spawns the inference pool, else it is spawned by the first prediction
+INFERENCE_WARMUP = config("INFERENCE_WARMUP", cast=bool, default=False)
+
+# background jobs, run by `python -m app.job.worker`. Number of worker processes it starts
+JOB_WORKERS = config("JOB_WORKERS", cast=int, default=2)
+# how long (in seconds) an idle worker waits before it looks for a job again
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", cast=float, default=1.0)
+# a failed job is retried until it ran this many times
+JOB_MAX_ATTEMPTS = config("JOB_MAX_ATTEMPTS", cast=int, default=5)
+# the retries wait this many seconds, doubled on every attempt, up to the maximum
+JOB_RETRY_BACKOFF = config("JOB_RETRY_BACKOFF", cast=float, default=1.0)
+JOB_RETRY_BACKOFF_MAX = config("JOB_RETRY_BACKOFF_MAX", cast=float, default=300.0)
+# a job running for longer than this many seconds is considered lost (its worker died) and claimed again
+JOB_LEASE_TIMEOUT = config("JOB_LEASE_TIMEOUT", cast=float, default=600.0)
+
+# server, see run.py
+SERVER_HOST = config("SERVER_HOST", default="0.0.0.0")
+SERVER_PORT = config("SERVER_PORT", cast=int, default=80)
+# "auto" uses uvloop and httptools when they are installed
+SERVER_LOOP = config("SERVER_LOOP", default="auto")
+SERVER_HTTP = config("SERVER_HTTP", default="auto")
+# every worker binds its own socket and the kernel balances the connections, instead of one shared socket
+SERVER_REUSE_PORT = config("SERVER_REUSE_PORT", cast=bool, default=False)
+# workers are replaced after serving this many requests plus a random jitter, 0 disables it
+SERVER_MAX_REQUESTS = config("SERVER_MAX_REQUESTS", cast=int, default=10000)
+SERVER_MAX_REQUESTS_JITTER = config("SERVER_MAX_REQUESTS_JITTER", cast=int, default=1000)
+# how long a stopping worker finishes the requests in flight before it is killed
+SERVER_GRACEFUL_TIMEOUT = config("SERVER_GRACEFUL_TIMEOUT", cast=float, default=30)
+# fills the pools and builds the middleware stacks and the OpenAPI schema before a worker accepts requests
+SERVER_WARMUP = config("SERVER_WARMUP", cast=bool, default=True)
+
+# metrics
+# records the metrics of the requests, SQL statements and pool served by /metrics
+METRICS_ENABLED = config("METRICS_ENABLED", cast=bool, default=True)
+# requests executing more SQL statements than this are logged as possible N+1 query patterns
+METRICS_N_PLUS_ONE_THRESHOLD = config("METRICS_N_PLUS_ONE_THRESHOLD", cast=int, default=20)
+
+# profiling, can also be switched at runtime through /profiling or SIGUSR2
+PROFILING_ENABLED = config("PROFILING_ENABLED", cast=bool, default=False)
+# fraction of the requests profiled by the sampling profiler
+PROFILING_SAMPLE_RATE = config("PROFILING_SAMPLE_RATE", cast=float, default=0.01)
+# seconds between two samples of the stacks
+PROFILING_INTERVAL = config("PROFILING_INTERVAL", cast=float, default=0.01)
+# SQL statements slower than this (in seconds) are logged and explained
+PROFILING_SLOW_QUERY_THRESHOLD = config("PROFILING_SLOW_QUERY_THRESHOLD", cast=float, default=0.5)
+# where the collapsed stacks of every route are written once profiling is disabled
+PROFILING_OUTPUT_DIR = config("PROFILING_OUTPUT_DIR", default=os.path.join(tempfile.gettempdir(), "profiles"))
+# the X-Admin-Token of the requests to the /profiling endpoints, they are disabled if it is empty
+PROFILING_ADMIN_TOKEN = config("PROFILING_ADMIN_TOKEN", cast=Secret, default="")
+
+# compression
+# responses smaller than this are sent uncompressed
+COMPRESSION_MINIMUM_SIZE = config("COMPRESSION_MINIMUM_SIZE", cast=int, default=1000)
+# bodies (and streamed chunks) from this size on are compressed in the threadpool instead of the event loop
+COMPRESSION_THREADPOOL_SIZE = config("COMPRESSION_THREADPOOL_SIZE", cast=int, default=64 * 1024)
+COMPRESSION_GZIP_LEVEL = config("COMPRESSION_GZIP_LEVEL", cast=int, default=6)
+COMPRESSION_BROTLI_QUALITY = config("COMPRESSION_BROTLI_QUALITY", cast=int, default=4)
+COMPRESSION_ZSTD_LEVEL = config("COMPRESSION_ZSTD_LEVEL", cast=int, default=3)
+
+# cache
+# one of "memory" (in-process LRU), "redis" (shared, requires the redis package) or "none"
+CACHE_BACKEND = config("CACHE_BACKEND", default="memory")
+CACHE_MAX_SIZE = config("CACHE_MAX_SIZE", cast=int, default=10000)
+CACHE_TTL = config("CACHE_TTL", cast=int, default=60)
+CACHE_REDIS_URL = config("CACHE_REDIS_URL", cast=Secret, default="redis://localhost:6379/0")
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from contextvars import ContextVar
+from typing import Final, Optional
+
+
+REQUEST_ID_CTX_KEY: Final[str] = "request_id"
+_request_id_ctx_var: ContextVar[Optional[str]] = ContextVar(REQUEST_ID_CTX_KEY, default=None)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id_ctx_var.get()
+
+
+SCHEMA_CTX_KEY: Final[str] = "schema"
+_schema_ctx_var: ContextVar[str] = ContextVar(SCHEMA_CTX_KEY, default="public")
+
+
+def get_schema() -> str:
+    """Returns the database schema (the tenant) of the current request."""
+    return _schema_ctx_var.get()
+
+
+class QueryStats:
+    """The number of SQL statements a request executed and the time they took."""
+
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+READ_REPLICA_CTX_KEY: Final[str] = "read_replica"
+_read_replica_ctx_var: ContextVar[bool] = ContextVar(READ_REPLICA_CTX_KEY, default=False)
+
+
+def reads_from_replica() -> bool:
+    """Whether the sessions of the current request may read from a read replica."""
+    return _read_replica_ctx_var.get()
+
+
+QUERY_STATS_CTX_KEY: Final[str] = "query_stats"
+_query_stats_ctx_var: ContextVar[Optional[QueryStats]] = ContextVar(QUERY_STATS_CTX_KEY, default=None)
+
+
+def get_query_stats() -> Optional[QueryStats]:
+    return _query_stats_ctx_var.get()
@@ -4,6 +4,7 @@ from sqlalchemy import engine_from_config, pool
 from inference.config import SQLALCHEMY_DATABASE_URI
 from inference.database.core import Base
 from inference.logging import logging
+from inference.project.models import SEARCH_OBJECTS as PROJECT_SEARCH_OBJECTS
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -27,6 +28,9 @@ config.set_main_option("sqlalchemy.url", str(SQLALCHEMY_DATABASE_URI))
 
 
 def include_object(object, name, type_, reflected, compare_to):
+    # the search column and indexes of the projects are created by DDL, not declared in the metadata
+    if type_ in ("column", "index") and object.table.name == "project" and name in PROJECT_SEARCH_OBJECTS:
+        return False
     return True
 
 
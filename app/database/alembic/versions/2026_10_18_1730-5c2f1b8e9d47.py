@@ -0,0 +1,26 @@
+"""Enforces unique project names
+
+Revision ID: 5c2f1b8e9d47
+Revises:
+Create Date: 2026-10-18 17:30:12.481922
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5c2f1b8e9d47"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the upgrade fails if duplicate names already exist, they have to be renamed by hand first
+    op.create_unique_constraint("project_name_key", "project", ["name"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("project_name_key", "project", type_="unique")
@@ -0,0 +1,25 @@
+"""Indexes the project creation time for keyset pagination
+
+Revision ID: 8a4d3e6f0b12
+Revises: 5c2f1b8e9d47
+Create Date: 2026-10-18 18:15:40.203117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8a4d3e6f0b12"
+down_revision: Union[str, None] = "5c2f1b8e9d47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_project_created_at_id", "project", ["created_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_project_created_at_id", table_name="project")
@@ -0,0 +1,49 @@
+"""Indexes the project names and descriptions for searching
+
+Revision ID: d4b8e1f7a3c9
+Revises: c3e7a9d2f415
+Create Date: 2026-10-18 19:30:27.904615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d4b8e1f7a3c9"
+down_revision: Union[str, None] = "c3e7a9d2f415"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# app.project.models.SEARCH_DOCUMENT at this revision
+SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(description, ''))"
+
+
+def upgrade() -> None:
+    # a generated column, PostgreSQL keeps it in sync with the name and description
+    op.add_column(
+        "project",
+        sa.Column("search_vector", postgresql.TSVECTOR(), sa.Computed(SEARCH_DOCUMENT, persisted=True)),
+    )
+    op.create_index("ix_project_search", "project", ["search_vector"], postgresql_using="gin")
+
+    # the fuzzy search needs pg_trgm, the projects are only searched by words without it
+    connection = op.get_bind()
+    if connection.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.create_index(
+            "ix_project_name_trgm",
+            "project",
+            ["name"],
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_project_name_trgm")
+    op.drop_index("ix_project_search", table_name="project")
+    op.drop_column("project", "search_vector")
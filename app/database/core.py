@@ -1,26 +1,133 @@
 # -*- coding: utf-8 -*-
 import re
+import threading
+from collections import namedtuple
 from contextlib import contextmanager
-from typing import Annotated, Any
+from typing import Annotated, Any, Dict, Tuple, Type
 
 from fastapi import Depends
 from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.orm import sessionmaker, Session
 from starlette.requests import Request
 
 from .. import config
+from ..context import get_request_id
+from ..profiling import profiler
+from .instrumentation import instrument
+from .pool import AdaptiveQueuePool, AsyncAdaptedAdaptiveQueuePool, split_budget
+from .registry import SchemaRegistry
+from .replicas import ReplicaSet
 
-engine = create_engine(
-    config.SQLALCHEMY_DATABASE_URI,
-    pool_size=config.DATABASE_ENGINE_POOL_SIZE,
-    max_overflow=config.DATABASE_ENGINE_MAX_OVERFLOW,
-    pool_pre_ping=config.DATABASE_ENGINE_POOL_PING,
-    pool_recycle=config.DATABASE_ENGINE_POOL_RECYCLE
-)
+_engines_lock = threading.Lock()
 
 
-SessionLocal = sessionmaker(bind=engine)
+def create_engines():
+    """
+    Creates the engines, the session factory and the schema registry of the worker.
+
+    It is called once by the lifespan of the app, such that importing the
+    app does not open the database drivers. `engine`, `async_engine`,
+    `SessionLocal` and `schema_registry` are module attributes from then on,
+    code running without the lifespan (scripts, tests) creates them on
+    first access.
+    """
+    global engine, async_engine, SessionLocal, schema_registry
+
+    with _engines_lock:
+        if "schema_registry" in globals():
+            return
+
+        # every worker gets its share of the connection budget
+        sync_pool_size, async_pool_size = split_budget(
+            config.DATABASE_CONNECTION_BUDGET,
+            config.WEB_CONCURRENCY or 1,
+            config.DATABASE_ASYNC_MODE,
+            config.THREADPOOL_SIZE,
+        )
+        pool_args = dict(
+            max_overflow=config.DATABASE_ENGINE_MAX_OVERFLOW,
+            pool_pre_ping=config.DATABASE_ENGINE_POOL_PING,
+            pool_recycle=config.DATABASE_ENGINE_POOL_RECYCLE,
+            pool_timeout=config.DATABASE_ENGINE_POOL_TIMEOUT,
+            pool_min_size=config.DATABASE_ENGINE_POOL_MIN_SIZE,
+            pool_idle_timeout=config.DATABASE_ENGINE_POOL_IDLE_TIMEOUT,
+            pool_max_waiters=config.DATABASE_ENGINE_POOL_MAX_WAITERS,
+        )
+
+        engine = create_engine(
+            config.SQLALCHEMY_DATABASE_URI,
+            poolclass=AdaptiveQueuePool,
+            pool_size=config.DATABASE_ENGINE_POOL_SIZE or sync_pool_size,
+            **pool_args,
+        )
+        if config.METRICS_ENABLED:
+            instrument(engine)
+        profiler.add_engine(engine)
+
+        SessionLocal = sessionmaker(bind=engine)
+
+        # the async engine is opt-in as it requires the asyncpg driver
+        async_engine = None
+        if config.DATABASE_ASYNC_MODE:
+            async_engine = create_async_engine(
+                config.SQLALCHEMY_ASYNC_DATABASE_URI,
+                poolclass=AsyncAdaptedAdaptiveQueuePool,
+                pool_size=config.DATABASE_ENGINE_POOL_SIZE or async_pool_size,
+                **pool_args,
+            )
+            if config.METRICS_ENABLED:
+                instrument(async_engine.sync_engine)
+            profiler.add_engine(async_engine.sync_engine)
+
+        # the replicas are other servers, every one gets a pool of the size of the primary one
+        replicas = []
+        async_replicas = []
+        for index, uri in enumerate(config.DATABASE_REPLICA_URIS):
+            url = make_url(uri)
+            # the connections of the pool are used by all threads of the threadpool
+            connect_args = {"check_same_thread": False} if url.get_backend_name() == "sqlite" else {}
+            replica = create_engine(
+                url,
+                poolclass=AdaptiveQueuePool,
+                pool_size=engine.pool.size(),
+                connect_args=connect_args,
+                **pool_args,
+            )
+            if config.METRICS_ENABLED:
+                instrument(replica, name=f"{replica.dialect.driver}_replica{index}")
+            replicas.append(replica)
+            if async_engine is not None:
+                async_replicas.append(
+                    create_async_engine(
+                        url.set(drivername="postgresql+asyncpg"),
+                        poolclass=AsyncAdaptedAdaptiveQueuePool,
+                        pool_size=async_engine.pool.size(),
+                        **pool_args,
+                    )
+                )
+        replica_set = ReplicaSet(replicas, max_lag=config.DATABASE_REPLICA_MAX_LAG)
+
+        # we scope the sessions by request id such that every request gets its own session.
+        # see: https://github.com/tiangolo/fastapi/issues/726
+        schema_registry = SchemaRegistry(
+            engine,
+            ttl=config.DATABASE_SCHEMA_REGISTRY_TTL,
+            scopefunc=get_request_id,
+            async_engine=async_engine,
+            max_size=config.DATABASE_SCHEMA_REGISTRY_MAX_SIZE,
+            replica_set=replica_set,
+            async_replicas=async_replicas,
+        )
+
+
+def __getattr__(name):
+    if name in ("engine", "async_engine", "SessionLocal", "schema_registry"):
+        create_engines()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def resolve_table_name(name):
@@ -29,6 +136,64 @@ def resolve_table_name(name):
     return "_".join([x.lower() for x in names if x])
 
 
+def _repr(obj, id_str: str, repr_attrs, max_length: int) -> str:
+    values = []
+    single = len(repr_attrs) == 1
+    for key in repr_attrs:
+        if not hasattr(obj, key):
+            raise KeyError(
+                "{} has incorrect attribute '{}' in " "__repr__attrs__".format(
+                    obj.__class__, key
+                )
+            )
+        value = getattr(obj, key)
+        wrap_in_quote = isinstance(value, str)
+
+        value = str(value)
+        if len(value) > max_length:
+            value = value[:max_length] + "..."
+
+        if wrap_in_quote:
+            value = "'{}'".format(value)
+        values.append(value if single else "{}:{}".format(key, value))
+    attrs_str = " ".join(values)
+
+    # join class name, id like '#123' and repr_attrs
+    return "<{} {}{}>".format(
+        obj.__class__.__name__,
+        ("#" + id_str) if id_str else "",
+        " " + attrs_str if attrs_str else "",
+    )
+
+
+class ReadOnlyRow(tuple):
+    """
+    The base of the row types of the models (see `CustomBase.row_type`).
+
+    A row holds the column values of one database row in a namedtuple: it
+    is built straight from the result of a column-level query, without an
+    instance state, identity map or attribute events, and it can not be
+    changed. It offers the same `dict()` as the model.
+    """
+
+    __slots__ = ()
+    __model__: Any = None
+    _fields: Tuple[str, ...]
+
+    def dict(self) -> Dict[str, Any]:
+        """Returns a dict representation of the row."""
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        model = self.__model__
+        ids = [str(getattr(self, c.name)) for c in model.__table__.primary_key.columns]
+        return _repr(self, "-".join(ids), model.__repr_attrs__, model.__repr_max_length__)
+
+
+# the row type of every model, built on first use
+_row_types: Dict[type, Type[ReadOnlyRow]] = {}
+
+
 class CustomBase:
     __repr_attrs__ = []
     __repr_max_length__ = 15
@@ -37,9 +202,26 @@ class CustomBase:
     def __tablename__(self):
         return resolve_table_name(self.__name__)
 
+    @classmethod
+    def row_type(cls) -> Type[ReadOnlyRow]:
+        """
+        Returns the read-only row type of the model, with a field per column.
+
+        The rows of `select(*cls.__table__.columns)` are turned into it with
+        `row_type._make(row)`, cached dicts with `row_type(**data)`.
+        """
+        row_type = _row_types.get(cls)
+        if row_type is None:
+            names = tuple(c.name for c in cls.__table__.columns)
+            fields = namedtuple(f"{cls.__name__}Row", names)
+            namespace = {"__slots__": (), "__model__": cls, "__module__": cls.__module__}
+            row_type = type(fields.__name__, (ReadOnlyRow, fields), namespace)
+            _row_types[cls] = row_type
+        return row_type
+
     def dict(self):
         """Returns a dict representation of a model."""
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        return {name: getattr(self, name) for name in self.row_type()._fields}
 
     @property
     def _id_str(self):
@@ -49,56 +231,34 @@ class CustomBase:
         else:
             return "None"
 
-    @property
-    def _repr_attrs_str(self):
-        max_length = self.__repr_max_length__
-
-        values = []
-        single = len(self.__repr_attrs__) == 1
-        for key in self.__repr_attrs__:
-            if not hasattr(self, key):
-                raise KeyError(
-                    "{} has incorrect attribute '{}' in " "__repr__attrs__".format(
-                        self.__class__, key
-                    )
-                )
-            value = getattr(self, key)
-            wrap_in_quote = isinstance(value, str)
-
-            value = str(value)
-            if len(value) > max_length:
-                value = value[:max_length] + "..."
-
-            if wrap_in_quote:
-                value = "'{}'".format(value)
-            values.append(value if single else "{}:{}".format(key, value))
-
-        return " ".join(values)
-
     def __repr__(self):
-        # get id like '#123'
-        id_str = ("#" + self._id_str) if self._id_str else ""
-        # join class name, id and repr_attrs
-        return "<{} {}{}>".format(
-            self.__class__.__name__,
-            id_str,
-            " " + self._repr_attrs_str if self._repr_attrs_str else "",
-        )
+        return _repr(self, self._id_str, self.__repr_attrs__, self.__repr_max_length__)
 
 
 Base = declarative_base(cls=CustomBase)
 
 
 def get_db(request: Request):
-    return request.state.db
+    # the session is only created once a handler asks for it and it only checks
+    # out a connection once it is first used
+    return request.state.db()
 
 
 DbSession = Annotated[Session, Depends(get_db)]
 
 
+async def get_async_db(request: Request):
+    async with request.state.async_db() as session:
+        yield session
+
+
+AsyncDbSession = Annotated[AsyncSession, Depends(get_async_db)]
+
+
 @contextmanager
 def get_session():
     """Context manager to ensure the session is closed after use."""
+    create_engines()
     session = SessionLocal()
     try:
         yield session
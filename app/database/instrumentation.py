@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..context import get_query_stats
+from ..metrics import registry
+
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "Time spent executing a SQL statement."
+)
+db_pool_wait = registry.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a connection of the pool."
+)
+db_pool_rejected = registry.counter(
+    "db_pool_rejected_total",
+    "Number of connection checkouts that failed as the pool was saturated or the wait timed out.",
+    ("reason",),
+)
+
+
+# the instrumented engines by name, the driver name unless given
+_engines = {}
+
+
+def _pool_gauge(func):
+    # the pool is looked up every time as disposing the engine replaces it
+    return lambda: {(driver,): func(engine.pool) for driver, engine in _engines.items()}
+
+
+registry.gauge(
+    "db_pool_size",
+    "Maximum number of connections the pool opens.",
+    _pool_gauge(lambda pool: pool.size()),
+    ("driver",),
+)
+registry.gauge(
+    "db_pool_open",
+    "Number of connections the pool has open.",
+    _pool_gauge(lambda pool: pool.checkedin() + pool.checkedout()),
+    ("driver",),
+)
+registry.gauge(
+    "db_pool_checked_out",
+    "Number of connections checked out of the pool.",
+    _pool_gauge(lambda pool: pool.checkedout()),
+    ("driver",),
+)
+registry.gauge(
+    "db_pool_checked_in",
+    "Number of idle connections in the pool.",
+    _pool_gauge(lambda pool: pool.checkedin()),
+    ("driver",),
+)
+registry.gauge(
+    "db_pool_overflow",
+    "Number of connections opened beyond the size of the pool.",
+    _pool_gauge(lambda pool: max(pool.overflow(), 0)),
+    ("driver",),
+)
+registry.gauge(
+    "db_pool_waiters",
+    "Number of callers waiting for a connection of the pool.",
+    _pool_gauge(lambda pool: pool.waiters() if hasattr(pool, "waiters") else 0),
+    ("driver",),
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["query_start_time"].pop()
+    db_query_duration.observe(elapsed)
+
+    # the statements of a request are added up for the request metrics
+    stats = get_query_stats()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+
+def _handle_error(context):
+    # failed statements never get to after_cursor_execute
+    start_times = context.connection.info.get("query_start_time") if context.connection is not None else None
+    if start_times:
+        start_times.pop()
+
+
+def instrument(engine: Engine, name: str = None):
+    """Records the duration of every SQL statement the engine executes and the state of its pool."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    _engines[name or engine.dialect.driver] = engine
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from time import perf_counter
+from typing import Optional, Tuple
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .instrumentation import db_pool_rejected, db_pool_wait
+
+IDLE_SINCE_KEY = "pool_idle_since"
+
+
+class PoolSaturatedError(exc.TimeoutError):
+    """Raised right away when too many callers already wait for a connection of the pool."""
+
+
+def split_budget(budget: int, workers: int, async_mode: bool, threadpool_size: int) -> Tuple[int, int]:
+    """
+    Splits the connection budget of all workers into the sizes of the sync and async pools of one worker.
+
+    The sync pool is used from the threadpool only, it never needs more
+    connections than there are threads. In async mode the sync pool only
+    serves the sync endpoints, it gets half of the connections of the
+    worker and the async pool the rest.
+    """
+    per_worker = max(budget // max(workers, 1), 1)
+    if not async_mode:
+        return min(per_worker, threadpool_size), 0
+    sync_size = max(min(per_worker // 2, threadpool_size), 1)
+    return sync_size, max(per_worker - sync_size, 1)
+
+
+class AdaptiveQueuePool(QueuePool):
+    """
+    A queue pool that opens connections on demand up to its size and closes
+    them again once they have been idle for `pool_idle_timeout` seconds
+    (see `trim`), keeping at least `pool_min_size` idle connections.
+
+    Callers wait at most `timeout` seconds for a connection. When
+    `pool_max_waiters` callers already wait for one, the checkout fails
+    right away with `PoolSaturatedError` instead of queueing up.
+    """
+
+    def __init__(
+        self,
+        creator,
+        pool_min_size: int = 0,
+        pool_idle_timeout: float = 60.0,
+        pool_max_waiters: Optional[int] = None,
+        **kw
+    ):
+        # the connection idle for the longest time is then at the bottom of the queue
+        kw["use_lifo"] = True
+        super().__init__(creator, **kw)
+        self._min_size = pool_min_size
+        self._idle_timeout = pool_idle_timeout
+        self._max_waiters = pool_max_waiters
+        self._waiters = 0
+        self._waiters_lock = threading.Lock()
+
+    def waiters(self) -> int:
+        return self._waiters
+
+    def _saturated(self) -> bool:
+        return self._pool.empty() and self._overflow >= self._max_overflow
+
+    def _do_get(self):
+        if self._max_waiters is not None and self._waiters >= self._max_waiters and self._saturated():
+            db_pool_rejected.inc("saturated")
+            raise PoolSaturatedError(
+                f"QueuePool limit of size {self.size()} reached and {self._waiters} callers "
+                f"already wait for a connection."
+            )
+
+        start = perf_counter()
+        with self._waiters_lock:
+            self._waiters += 1
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            db_pool_rejected.inc("timeout")
+            raise
+        finally:
+            with self._waiters_lock:
+                self._waiters -= 1
+            db_pool_wait.observe(perf_counter() - start)
+
+    def _do_return_conn(self, conn):
+        conn.info[IDLE_SINCE_KEY] = time.monotonic()
+        super()._do_return_conn(conn)
+
+    def _pop_idle(self, deadline: float) -> list:
+        with self._pool.mutex:
+            return self._pop_expired(self._pool.queue, deadline)
+
+    def _pop_expired(self, idle, deadline: float) -> list:
+        expired = []
+        while len(idle) > self._min_size and idle[0].info.get(IDLE_SINCE_KEY, deadline) < deadline:
+            expired.append(idle[0])
+            del idle[0]
+        return expired
+
+    def trim(self) -> int:
+        """Closes the connections idle for longer than the idle timeout, returns how many were closed."""
+        expired = self._pop_idle(time.monotonic() - self._idle_timeout)
+        for record in expired:
+            try:
+                record.close()
+            finally:
+                self._dec_overflow()
+        return len(expired)
+
+    def prefill(self):
+        """Opens connections until `pool_min_size` of them are idle, e.g. before serving any request."""
+        connections = [self.connect() for _ in range(min(self._min_size, self.size()))]
+        for connection in connections:
+            connection.close()
+
+    def recreate(self):
+        self.logger.info("Pool recreating")
+        return self.__class__(
+            self._creator,
+            pool_min_size=self._min_size,
+            pool_idle_timeout=self._idle_timeout,
+            pool_max_waiters=self._max_waiters,
+            pool_size=self._pool.maxsize,
+            max_overflow=self._max_overflow,
+            pre_ping=self._pre_ping,
+            timeout=self._timeout,
+            recycle=self._recycle,
+            echo=self.echo,
+            logging_name=self._orig_logging_name,
+            reset_on_return=self._reset_on_return,
+            _dispatch=self.dispatch,
+            dialect=self._dialect,
+        )
+
+
+class AsyncAdaptedAdaptiveQueuePool(AdaptiveQueuePool, AsyncAdaptedQueuePool):
+    """The `AdaptiveQueuePool` of the async engines, only used from the event loop."""
+
+    def _pop_idle(self, deadline: float) -> list:
+        # the list under the asyncio.LifoQueue of the pool
+        return self._pop_expired(self._pool._queue._queue, deadline)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, FrozenSet, Optional, Sequence
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+from ..cache import LRUCache
+from .replicas import ReplicaSet, RoutingSession
+
+log = logging.getLogger(__name__)
+
+
+# schemas of the database itself, never routed to
+SYSTEM_SCHEMAS = frozenset({"information_schema"})
+SYSTEM_SCHEMA_PREFIX = "pg_"
+
+
+class _Schema:
+    """The schema-translated engine and session factories of one schema."""
+
+    __slots__ = ("engine", "session", "async_session")
+
+    def __init__(self, engine: Engine, session: scoped_session, async_session: Optional[Callable]):
+        self.engine = engine
+        self.session = session
+        self.async_session = async_session
+
+
+class SchemaRegistry:
+    """
+    Keeps the database schema names in memory together with one
+    schema-translated engine and session factory per schema (and, when an
+    `async_engine` is given, one async session factory per schema).
+
+    The schema names are reflected once (normally at startup) and refreshed
+    when they are older than `ttl` seconds or after `invalidate()` has been
+    called, so requests no longer pay for a catalog query, not even the ones
+    naming a schema that does not exist.
+
+    The schema-translated engines share the pool of `engine`, only the
+    `max_size` most recently used schemas keep theirs and their session
+    factories such that thousands of tenants do not fill the memory.
+
+    With a `replica_set`, the sessions read from the replicas during
+    read-only requests (see `RoutingSession`). `async_replicas` are the
+    async engines of the same replicas, in the same order.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        ttl: int = 300,
+        scopefunc: Optional[Callable] = None,
+        async_engine: Optional[AsyncEngine] = None,
+        max_size: int = 1000,
+        replica_set: Optional[ReplicaSet] = None,
+        async_replicas: Sequence[AsyncEngine] = (),
+    ):
+        self.engine = engine
+        self.ttl = ttl
+        self.scopefunc = scopefunc
+        self.async_engine = async_engine
+        self.replica_set = replica_set if replica_set else None
+        self.async_replicas = async_replicas
+        self._lock = threading.Lock()
+        self._schema_names: FrozenSet[str] = frozenset()
+        self._schemas = LRUCache(maxsize=max_size, ttl=ttl)
+        self._loaded_at: Optional[float] = None
+        # the schemas share the session factories, creating one per schema is costly
+        session_class = RoutingSession if self.replica_set else Session
+        self._session_factory = sessionmaker(class_=session_class)
+        # objects are not expired on commit as they can not be lazy loaded again
+        self._async_session_factory = sessionmaker(
+            class_=AsyncSession, sync_session_class=session_class, expire_on_commit=False
+        )
+
+    @property
+    def expired(self) -> bool:
+        """Whether the schema names need to be reflected again."""
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at >= self.ttl
+
+    @property
+    def schema_names(self) -> FrozenSet[str]:
+        if self.expired:
+            self.load()
+        return self._schema_names
+
+    def load(self) -> None:
+        """Reflects the schema names from the database."""
+        schema_names = frozenset(
+            name
+            for name in inspect(self.engine).get_schema_names()
+            if name not in SYSTEM_SCHEMAS and not name.startswith(SYSTEM_SCHEMA_PREFIX)
+        )
+        with self._lock:
+            if not schema_names.issuperset(self._schema_names):
+                # we drop the engines of schemas that no longer exist
+                self._schemas.clear()
+            self._schema_names = schema_names
+            self._loaded_at = time.monotonic()
+        log.debug(f"Loaded {len(schema_names)} database schema names.")
+
+    def invalidate(self) -> None:
+        """Forces the schema names to be reflected on the next lookup."""
+        self._loaded_at = None
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit/miss/eviction counters of the schemas kept."""
+        return self._schemas.stats()
+
+    def _get(self, schema: str) -> Optional[_Schema]:
+        if schema not in self.schema_names:
+            return None
+
+        entry = self._schemas.get(schema)
+        if entry is None:
+            with self._lock:
+                entry = self._schemas.get(schema)
+                if entry is None:
+                    entry = self._create(schema)
+                    self._schemas.set(schema, entry)
+        return entry
+
+    def _create(self, schema: str) -> _Schema:
+        # add correct schema mapping depending on the request
+        translate_map = {None: schema}
+        schema_engine = self.engine.execution_options(schema_translate_map=translate_map)
+        replicas = {}
+        if self.replica_set:
+            replicas = dict(
+                replica_set=self.replica_set,
+                replicas=[engine.execution_options(schema_translate_map=translate_map)
+                          for engine in self.replica_set.engines],
+            )
+        session = scoped_session(
+            partial(self._session_factory, bind=schema_engine, **replicas), scopefunc=self.scopefunc
+        )
+
+        async_session = None
+        if self.async_engine is not None:
+            async_schema_engine = self.async_engine.execution_options(schema_translate_map=translate_map)
+            if self.replica_set:
+                # the async sessions route their statements through a sync session, with the sync engines
+                replicas["replicas"] = [
+                    engine.execution_options(schema_translate_map=translate_map).sync_engine
+                    for engine in self.async_replicas
+                ]
+            async_session = partial(self._async_session_factory, bind=async_schema_engine, **replicas)
+        return _Schema(schema_engine, session, async_session)
+
+    def get_engine(self, schema: str) -> Optional[Engine]:
+        """Returns the engine for the given schema or None if the schema does not exist."""
+        entry = self._get(schema)
+        return entry.engine if entry is not None else None
+
+    def get_session(self, schema: str) -> Optional[scoped_session]:
+        """
+        Returns the session registry for the given schema or None if the schema does not exist.
+
+        The registry is built once per schema and scoped by `scopefunc`, callers are
+        expected to call `remove()` on it once they are done with their session.
+        """
+        entry = self._get(schema)
+        return entry.session if entry is not None else None
+
+    def get_async_session(self, schema: str) -> Optional[Callable[[], AsyncSession]]:
+        """
+        Returns the async session factory for the given schema or None if the
+        schema does not exist or no async engine is configured.
+        """
+        entry = self._get(schema)
+        return entry.async_session if entry is not None else None
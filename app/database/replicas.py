@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import itertools
+import logging
+import threading
+from typing import List, Optional, Sequence
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..context import reads_from_replica
+
+log = logging.getLogger(__name__)
+
+# the replication lag of a PostgreSQL standby, NULL on a primary
+_REPLICATION_LAG = text("SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())")
+
+
+class ReplicaSet:
+    """
+    The read replicas of the primary database.
+
+    `choose()` returns the index of the next healthy replica, round robin,
+    or None when there is none and the reads go to the primary. The
+    replicas are checked by `check()` (every few seconds, from the
+    lifespan); a replica failing the check, lagging more than `max_lag`
+    seconds behind the primary or losing its connection during a request is
+    left out until a check succeeds again.
+    """
+
+    def __init__(self, engines: Sequence[Engine], max_lag: float = 0):
+        self.engines: List[Engine] = list(engines)
+        self.max_lag = max_lag
+        self.healthy: List[int] = list(range(len(self.engines)))
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        for index, engine in enumerate(self.engines):
+            event.listen(engine, "handle_error", self._handle_error(index))
+
+    def __len__(self):
+        return len(self.engines)
+
+    def choose(self) -> Optional[int]:
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def _handle_error(self, index: int):
+        def handle_error(context):
+            if context.is_disconnect:
+                self.mark_down(index)
+
+        return handle_error
+
+    def mark_down(self, index: int):
+        with self._lock:
+            if index in self.healthy:
+                log.warning(f"Read replica {index} is down, its reads go to the other replicas or the primary.")
+                self.healthy = [healthy for healthy in self.healthy if healthy != index]
+
+    def _is_healthy(self, engine: Engine) -> bool:
+        try:
+            with engine.connect() as connection:
+                if self.max_lag and engine.dialect.name == "postgresql":
+                    lag = connection.execute(_REPLICATION_LAG).scalar()
+                    if lag is not None and lag > self.max_lag:
+                        log.warning(f"Read replica {engine.url!r} lags {lag:.1f}s behind the primary.")
+                        return False
+                else:
+                    connection.execute(text("SELECT 1"))
+        except Exception as e:
+            log.warning(f"Read replica {engine.url!r} failed its health check: {e}")
+            return False
+        return True
+
+    def check(self) -> List[int]:
+        """Checks every replica, returns the indexes of the healthy ones."""
+        healthy = [index for index, engine in enumerate(self.engines) if self._is_healthy(engine)]
+        with self._lock:
+            self.healthy = healthy
+        return healthy
+
+
+class RoutingSession(Session):
+    """
+    A session sending the reads of read-only requests to a read replica.
+
+    The replica is chosen once per session, such that all its reads see the
+    same state. Writes always go to the primary (the `bind`), and so do all
+    statements of the session once it has written something, so it reads
+    its own writes.
+    """
+
+    def __init__(self, replica_set: ReplicaSet = None, replicas: Sequence[Engine] = (), **kw):
+        super().__init__(**kw)
+        # the engines of the replica set, translated to the schema of the session
+        self.replica_set = replica_set
+        self.replicas = replicas
+        self.replica: Optional[Engine] = None
+        self.wrote = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or (clause is not None and getattr(clause, "is_dml", False)):
+            self.wrote = True
+        if self.wrote or not self.replicas or not reads_from_replica():
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+        if self.replica is None:
+            index = self.replica_set.choose()
+            if index is None:
+                return super().get_bind(mapper=mapper, clause=clause, **kw)
+            self.replica = self.replicas[index]
+        return self.replica
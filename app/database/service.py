@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from pydantic import BaseModel
+from pydantic.error_wrappers import ErrorWrapper, ValidationError
+from sqlalchemy import tuple_
+from sqlalchemy.exc import DataError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy_filters import apply_filters, apply_sort
+from sqlalchemy_filters.exceptions import BadFilterFormat, BadSortFormat, FieldNotFound
+
+from ..enums import CountMode
+from ..exceptions import FieldNotFoundError, InvalidCursorError, InvalidFilterError
+
+
+class Explain(Executable, ClauseElement):
+    """An EXPLAIN of the given statement, returning the plan as JSON."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def estimate_count(*, db_session: Session, query: Query) -> int:
+    """Returns the number of rows of the query as estimated by the query planner."""
+    plan = db_session.execute(Explain(query.statement)).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count(*, db_session: Session, query: Query, mode: CountMode) -> Optional[int]:
+    """Counts the rows of the query, exactly or estimated, or not at all."""
+    if mode == CountMode.exact:
+        return query.order_by(None).count()
+    if mode == CountMode.estimate:
+        return estimate_count(db_session=db_session, query=query.order_by(None))
+    return None
+
+
+def encode_cursor(value: Any, id: int) -> str:
+    """Encodes the position after a row as an opaque cursor."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, python_type: type) -> tuple:
+    """Decodes a cursor created by `encode_cursor`."""
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        value = datetime.fromisoformat(value) if python_type is datetime else python_type(value)
+        return value, int(id)
+    except (TypeError, ValueError) as e:
+        raise ValidationError(
+            [ErrorWrapper(InvalidCursorError(msg=f"Invalid cursor: {e}"), loc="cursor")],
+            model=BaseModel,
+        ) from None
+
+
+def _keyset(query: Query, model, sort_field: str, descending: bool, cursor: Optional[str]):
+    """Sorts the query by the given column and the primary key and seeks past the cursor."""
+    column = getattr(model, sort_field)
+    columns = [column] if sort_field == "id" else [column, model.id]
+
+    if cursor:
+        value, id = decode_cursor(cursor, column.type.python_type)
+        position = (value,) if sort_field == "id" else (value, id)
+        key = tuple_(*columns) if len(columns) > 1 else column
+        bound = tuple_(*position) if len(position) > 1 else position[0]
+        query = query.filter(key < bound if descending else key > bound)
+
+    return query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+
+
+def search_filter_sort_paginate(
+    *,
+    db_session: Session,
+    model,
+    filter_spec: List[dict] = None,
+    sort_by: Sequence[str] = ("id",),
+    descending: Sequence[bool] = (False,),
+    page: int = 1,
+    items_per_page: int = 10,
+    cursor: Optional[str] = None,
+    total: CountMode = CountMode.estimate,
+    keyset_fields: Sequence[str] = ("id", "created_at"),
+):
+    """
+    Filters, sorts and paginates a model. The items are read-only rows of
+    the model (see `CustomBase.row_type`), read without loading instances.
+
+    Listings sorted by a single field of `keyset_fields` are paginated by
+    keyset: `cursor` (the `next` value of the previous page) seeks straight to
+    the following page so deep pages cost the same as the first one. Without a
+    cursor, or for other sorts, `page` is used as an offset.
+    """
+    keyset = len(sort_by) == 1 and sort_by[0] in keyset_fields
+    if cursor and not keyset:
+        msg = f"Cursors require sorting by one of: {', '.join(keyset_fields)}."
+        raise ValidationError(
+            [ErrorWrapper(InvalidCursorError(msg=msg), loc="cursor")], model=BaseModel
+        )
+
+    row_type = model.row_type()
+    query = db_session.query(*[getattr(model, name) for name in row_type._fields])
+    try:
+        if filter_spec:
+            query = apply_filters(query, filter_spec)
+    except FieldNotFound as e:
+        raise ValidationError(
+            [ErrorWrapper(FieldNotFoundError(msg=str(e)), loc="filter")], model=BaseModel
+        ) from None
+    except BadFilterFormat as e:
+        raise ValidationError(
+            [ErrorWrapper(InvalidFilterError(msg=str(e)), loc="filter")], model=BaseModel
+        ) from None
+
+    try:
+        total_count = count(db_session=db_session, query=query, mode=total)
+
+        if keyset:
+            query = _keyset(query, model, sort_by[0], bool(descending and descending[0]), cursor)
+        else:
+            sort_spec = [
+                {"field": field, "direction": "desc" if desc else "asc"}
+                for field, desc in zip(sort_by, list(descending) + [False] * len(sort_by))
+            ]
+            query = apply_sort(query, sort_spec)
+
+        if not cursor and page > 1:
+            query = query.offset((page - 1) * items_per_page)
+        items = [row_type._make(row) for row in query.limit(items_per_page)]
+    except FieldNotFound as e:
+        raise ValidationError(
+            [ErrorWrapper(FieldNotFoundError(msg=str(e)), loc="sortBy")], model=BaseModel
+        ) from None
+    except BadSortFormat as e:
+        raise ValidationError(
+            [ErrorWrapper(InvalidFilterError(msg=str(e)), loc="sortBy")], model=BaseModel
+        ) from None
+    except DataError as e:
+        # e.g. a filter value the database can not cast to the type of the column
+        db_session.rollback()
+        raise ValidationError(
+            [ErrorWrapper(InvalidFilterError(msg=str(e.orig).splitlines()[0]), loc="filter")],
+            model=BaseModel,
+        ) from None
+
+    next_cursor = None
+    if keyset and len(items) == items_per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_by[0]), last.id)
+
+    return {
+        "items": items,
+        "itemsPerPage": items_per_page,
+        "page": page,
+        "total": total_count,
+        "next": next_cursor,
+    }
@@ -24,3 +24,20 @@ class ProjectEnum(StrEnum):
     """
 
     pass  # No additional implementation needed
+
+
+class CountMode(ProjectEnum):
+    """How the total number of items of a paginated listing is computed."""
+
+    exact = "exact"
+    estimate = "estimate"
+    none = "none"
+
+
+class TenantSource(ProjectEnum):
+    """Where the tenant (the database schema) of a request comes from."""
+
+    none = "none"
+    header = "header"
+    subdomain = "subdomain"
+    token = "token"
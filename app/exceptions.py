@@ -10,3 +10,23 @@ class NotFoundError(PydanticValueError):
 class ExistsError(PydanticValueError):
     code = "exists"
     msg_template = "{msg}"
+
+
+class FieldNotFoundError(PydanticValueError):
+    code = "field_not_found"
+    msg_template = "{msg}"
+
+
+class InvalidFilterError(PydanticValueError):
+    code = "invalid_filter"
+    msg_template = "{msg}"
+
+
+class InvalidCursorError(PydanticValueError):
+    code = "invalid_cursor"
+    msg_template = "{msg}"
+
+
+class InvalidInputError(PydanticValueError):
+    code = "invalid_input"
+    msg_template = "{msg}"
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib import import_module
+from time import perf_counter
+from typing import Any, Deque, List, Optional, Set, Tuple
+
+from ..metrics import registry
+
+log = logging.getLogger(__name__)
+
+inference_batch_size = registry.histogram(
+    "inference_batch_size",
+    "Number of predictions run together in one batch.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+inference_batch_duration = registry.histogram(
+    "inference_batch_duration_seconds", "Time a batch took in the process pool, including the transfers."
+)
+inference_rejected = registry.counter(
+    "inference_rejected_total", "Predictions rejected because too many were already waiting."
+)
+
+
+class InferenceOverloadedError(Exception):
+    """Raised right away when too many predictions already wait for a batch."""
+
+
+# the model of a process of the pool, loaded when the process starts
+_model = None
+
+
+def load_model(path: str):
+    """Returns an instance of the model class at `path` ("module:class")."""
+    module, _, name = path.partition(":")
+    return getattr(import_module(module), name)()
+
+
+def _init_worker(path: str):
+    global _model
+    _model = load_model(path)
+
+
+def _ready() -> Optional[int]:
+    return getattr(_model, "input_size", None)
+
+
+def _predict(batch: List[Any]) -> List[Any]:
+    return _model.predict(batch)
+
+
+class BatchingEngine:
+    """
+    Runs the predictions of concurrent requests together in micro-batches.
+
+    The requests queue their inputs and wait for their result. A batch is
+    formed as soon as a process of the pool is free: it takes the inputs
+    waiting by then and waits up to `max_wait` seconds for more, until it
+    holds `max_batch_size` of them. The batch runs in the process pool, such
+    that the model does not hold the GIL of the worker serving the API, and
+    its results are handed back to the requests in order. The busier the
+    pool, the larger the batches.
+
+    The engine is used from one event loop, it is started on first use (or
+    by the warm-up) and stopped by the lifespan.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        workers: int = 1,
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+        max_pending: int = 1000,
+    ):
+        self.model = model
+        self.workers = max(workers, 1)
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        # the size of the inputs of the model (if it tells), known once the engine started
+        self.input_size: Optional[int] = None
+        self.batches = 0
+        self.predictions = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Deque[Tuple[Any, asyncio.Future]] = deque()
+        self._arrived: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+        self._start_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def started(self) -> bool:
+        return self._collector is not None
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # the processes are spawned such that they do not inherit the threads and connections of the worker
+        return ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model,),
+        )
+
+    async def start(self):
+        """Starts the processes of the pool and waits until they loaded the model."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+            loop = asyncio.get_running_loop()
+            self._pool = self._create_pool()
+            ready = [loop.run_in_executor(self._pool, _ready) for _ in range(self.workers)]
+            self.input_size = (await asyncio.gather(*ready))[0]
+            self._arrived = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        """Lets the running batches finish, fails the predictions still waiting and stops the pool."""
+        if not self.started:
+            return
+        self._collector.cancel()
+        self._collector = None
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        while self._pending:
+            _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError("The inference engine was stopped."))
+        pool, self._pool = self._pool, None
+        await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+    async def predict(self, inputs: Any) -> Any:
+        """Queues the inputs for the next batch and returns the prediction of the model for them."""
+        if not self.started:
+            await self.start()
+        if len(self._pending) >= self.max_pending:
+            inference_rejected.inc()
+            raise InferenceOverloadedError(f"{len(self._pending)} predictions already wait for a batch.")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((inputs, future))
+        self._arrived.set()
+        return await future
+
+    def stats(self) -> dict:
+        """Returns how many batches ran and how many predictions they held."""
+        return {"batches": self.batches, "predictions": self.predictions}
+
+    async def _wait_for_inputs(self, timeout: Optional[float] = None) -> bool:
+        self._arrived.clear()
+        try:
+            await asyncio.wait_for(self._arrived.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # a batch is formed once a process is free, the inputs queue up until then
+            await self._slots.acquire()
+            while not self._pending:
+                await self._wait_for_inputs()
+
+            deadline = loop.time() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0 or not await self._wait_for_inputs(remaining):
+                    break
+
+            batch = []
+            while self._pending and len(batch) < self.max_batch_size:
+                inputs, future = self._pending.popleft()
+                # the requests gone in the meantime are left out
+                if not future.done():
+                    batch.append((inputs, future))
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._run(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        start = perf_counter()
+        pool = self._pool
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                pool, _predict, [inputs for inputs, _ in batch]
+            )
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and pool is self._pool:
+                # a process of the pool died, e.g. it was killed, the following batches get a new pool
+                log.error("The inference process pool broke, it is replaced.")
+                pool.shutdown(wait=False)
+                self._pool = self._create_pool()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+        finally:
+            self._slots.release()
+            self.batches += 1
+            self.predictions += len(batch)
+            inference_batch_size.observe(len(batch))
+            inference_batch_duration.observe(perf_counter() - start)
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from typing import List
+
+from pydantic import conlist
+
+from ..models import DataBase
+
+
+class PredictionCreate(DataBase):
+    inputs: conlist(float, min_items=1)
+
+
+class PredictionRead(DataBase):
+    probabilities: List[float]
+    label: int
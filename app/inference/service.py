@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from typing import List
+
+from ..config import (
+    INFERENCE_MAX_BATCH_SIZE,
+    INFERENCE_MAX_PENDING,
+    INFERENCE_MAX_WAIT,
+    INFERENCE_MODEL,
+    INFERENCE_WORKERS,
+)
+from .engine import BatchingEngine
+
+# the processes of the pool are only started on first use (or by the warm-up)
+inference_engine = BatchingEngine(
+    INFERENCE_MODEL,
+    workers=INFERENCE_WORKERS,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait=INFERENCE_MAX_WAIT,
+    max_pending=INFERENCE_MAX_PENDING,
+)
+
+
+async def predict(*, inputs: List[float]) -> List[float]:
+    """
+    Returns the probabilities of the classes of the model for the inputs.
+
+    Raises a ValueError when the model expects another number of inputs.
+    """
+    if not inference_engine.started:
+        await inference_engine.start()
+    input_size = inference_engine.input_size
+    if input_size is not None and len(inputs) != input_size:
+        raise ValueError(f"The model expects {input_size} inputs, got {len(inputs)}.")
+    return await inference_engine.predict(inputs)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+from typing import List
+
+
+class ToyModel:
+    """
+    A small multilayer perceptron in plain Python, standing in for a real
+    model in the tests and benchmarks. Its weights are drawn from a seeded
+    generator, so every process builds the same model.
+
+    Any model class with an `input_size` and a `predict` of a batch can be
+    served by the inference engine.
+    """
+
+    input_size = 16
+    hidden_size = 64
+    output_size = 4
+
+    def __init__(self, seed: int = 0):
+        rng = random.Random(seed)
+        self.hidden = [[rng.gauss(0, 0.5) for _ in range(self.input_size)] for _ in range(self.hidden_size)]
+        self.output = [[rng.gauss(0, 0.5) for _ in range(self.hidden_size)] for _ in range(self.output_size)]
+
+    def _forward(self, inputs: List[float]) -> List[float]:
+        hidden = [max(sum(w * x for w, x in zip(row, inputs)), 0.0) for row in self.hidden]
+        logits = [sum(w * h for w, h in zip(row, hidden)) for row in self.output]
+        # softmax
+        top = max(logits)
+        exps = [math.exp(logit - top) for logit in logits]
+        total = sum(exps)
+        return [value / total for value in exps]
+
+    def predict(self, batch: List[List[float]]) -> List[List[float]]:
+        """Returns the probabilities of the classes of every input of the batch."""
+        return [self._forward(inputs) for inputs in batch]
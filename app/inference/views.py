@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter
+from pydantic.error_wrappers import ErrorWrapper, ValidationError
+
+from ..exceptions import InvalidInputError
+from ..responses import ORJSONResponse
+
+from .models import PredictionCreate, PredictionRead
+from .service import predict
+
+router = APIRouter()
+
+
+@router.post(
+    "/predict",
+    response_model=PredictionRead,
+    summary="Run the model on one input.",
+)
+async def create_prediction(prediction_in: PredictionCreate):
+    """
+    Run the model on one input.
+
+    The predictions of concurrent requests are run together in batches, in
+    processes of their own.
+    """
+    try:
+        probabilities = await predict(inputs=prediction_in.inputs)
+    except ValueError as e:
+        raise ValidationError(
+            [ErrorWrapper(InvalidInputError(msg=str(e)), loc="inputs")], model=PredictionCreate
+        )
+    label = max(range(len(probabilities)), key=probabilities.__getitem__)
+    return ORJSONResponse({"probabilities": probabilities, "label": label})
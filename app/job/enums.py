@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from ..enums import ProjectEnum
+
+
+class JobStatus(ProjectEnum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
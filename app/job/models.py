@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import JSON, Column, DateTime, Index, Integer, String, Text
+
+from ..database.core import Base
+from ..models import DataBase, PrimaryKey, TimeStampMixin
+from .enums import JobStatus
+
+
+class Job(Base, TimeStampMixin):
+    """
+    A job of the queue. The queue is kept in the default schema of the
+    database for all tenants, `tenant` is the schema the job runs in.
+    """
+
+    # Columns
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    tenant = Column(String, nullable=False)
+    payload = Column(JSON)
+    status = Column(String, nullable=False, default=JobStatus.queued)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    # the job is not claimed before this time, it is pushed back by the retries
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # the worker running the job and since when, such that the jobs of dead workers are claimed again
+    locked_by = Column(String)
+    locked_at = Column(DateTime)
+    result = Column(JSON)
+    error = Column(Text)
+
+    __table_args__ = (
+        # backs the claiming of the next job
+        Index("ix_job_status_run_at", "status", "run_at"),
+    )
+
+
+class JobCreate(DataBase):
+    kind: str
+    payload: Dict[str, Any] = {}
+
+
+class JobRead(DataBase):
+    id: PrimaryKey
+    kind: str
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    result: Optional[Any]
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
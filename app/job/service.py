@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from ..config import JOB_LEASE_TIMEOUT, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF, JOB_RETRY_BACKOFF_MAX
+from .enums import JobStatus
+from .models import Job, JobCreate
+
+
+def submit(*, db_session: Session, job_in: JobCreate, tenant: str) -> Job:
+    """Queues a job to run in the schema `tenant`, it is claimed by the next free worker."""
+    job = Job(**job_in.dict(), tenant=tenant, max_attempts=JOB_MAX_ATTEMPTS)
+    db_session.add(job)
+    db_session.commit()
+    return job
+
+
+def get(*, db_session: Session, job_id: int, tenant: str) -> Optional[Job]:
+    """Returns a job of the schema `tenant`, the jobs of the other tenants are not found."""
+    return db_session.query(Job).filter(Job.id == job_id, Job.tenant == tenant).one_or_none()
+
+
+def _claimable(now: datetime):
+    table = Job.__table__
+    return or_(
+        and_(table.c.status == JobStatus.queued, table.c.run_at <= now),
+        # the worker running the job died (or hangs), its lease expired
+        and_(
+            table.c.status == JobStatus.running,
+            table.c.locked_at < now - timedelta(seconds=JOB_LEASE_TIMEOUT),
+        ),
+    )
+
+
+def claim(*, db_session: Session, worker: str) -> Optional[Row]:
+    """
+    Claims the next job due for `worker` and returns its row, or None if no job is due.
+
+    On PostgreSQL the job is picked and claimed by a single statement, and
+    the rows already locked by other workers are skipped (FOR UPDATE SKIP
+    LOCKED), such that any number of workers claim jobs concurrently
+    without waiting for each other. Other databases (e.g. SQLite, which
+    serializes its writers) pick the job first and claim it with an UPDATE
+    that only succeeds if it is still claimable, a worker losing the race
+    returns None and tries again.
+    """
+    table = Job.__table__
+    now = datetime.utcnow()
+    claimable = _claimable(now)
+    next_job = select(table.c.id).where(claimable).order_by(table.c.run_at, table.c.id).limit(1)
+    values = dict(
+        status=JobStatus.running,
+        attempts=table.c.attempts + 1,
+        locked_by=worker,
+        locked_at=now,
+        updated_at=now,
+    )
+
+    if db_session.get_bind().dialect.name == "postgresql":
+        next_job = next_job.with_for_update(skip_locked=True).scalar_subquery()
+        row = db_session.execute(
+            update(table).where(table.c.id == next_job).values(**values).returning(*table.columns)
+        ).one_or_none()
+    else:
+        job_id = db_session.execute(next_job).scalar()
+        row = None
+        if job_id is not None:
+            result = db_session.execute(update(table).where(table.c.id == job_id, claimable).values(**values))
+            if result.rowcount == 1:
+                row = db_session.execute(select(*table.columns).where(table.c.id == job_id)).one()
+    db_session.commit()
+    return row
+
+
+def _finish(*, db_session: Session, job_id: int, worker: str, **values) -> bool:
+    table = Job.__table__
+    # a worker whose lease expired (and whose job was claimed again) must not overwrite the new run
+    result = db_session.execute(
+        update(table)
+        .where(table.c.id == job_id, table.c.locked_by == worker, table.c.status == JobStatus.running)
+        .values(locked_by=None, locked_at=None, updated_at=datetime.utcnow(), **values)
+    )
+    db_session.commit()
+    return result.rowcount == 1
+
+
+def complete(*, db_session: Session, job_id: int, worker: str, result: Any) -> bool:
+    """Stores the result of a job run by `worker`, returns False if the job was no longer its own."""
+    return _finish(
+        db_session=db_session,
+        job_id=job_id,
+        worker=worker,
+        status=JobStatus.succeeded,
+        result=result,
+        error=None,
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    The seconds a job waits before its next attempt, after `attempts` failed.
+
+    The delay doubles with every attempt up to the maximum, and is spread
+    by a random jitter such that the jobs that failed together (e.g. while
+    the database was down) are not all retried at once.
+    """
+    delay = min(JOB_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1)
+
+
+def fail(*, db_session: Session, job: Row, worker: str, error: str, retry: bool = True) -> bool:
+    """
+    Records the failure of a job run by `worker`. The job is queued again
+    with a backoff unless it must not be retried or it ran out of attempts.
+
+    Returns False if the job was no longer its own.
+    """
+    if retry and job.attempts < job.max_attempts:
+        run_at = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+        return _finish(
+            db_session=db_session,
+            job_id=job.id,
+            worker=worker,
+            status=JobStatus.queued,
+            run_at=run_at,
+            error=error,
+        )
+    return _finish(db_session=db_session, job_id=job.id, worker=worker, status=JobStatus.failed, error=error)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+The tasks the workers run, by job kind.
+
+A task is called with the session of the schema of the job and the payload
+it was submitted with, and returns a JSON serializable result. An exception
+fails the attempt and the job is retried later, unless it is a
+`PermanentJobError`, which would fail again.
+"""
+from functools import lru_cache
+from typing import Any, Callable, Dict, List
+
+from pydantic import ValidationError, parse_obj_as
+from sqlalchemy.orm import Session
+
+from ..config import INFERENCE_MODEL, PROJECT_BULK_BATCH_SIZE
+from ..inference.engine import load_model
+from ..project.models import ProjectCreate
+from ..project.service import create_all
+
+TASKS: Dict[str, Callable[..., Any]] = {}
+
+
+class PermanentJobError(Exception):
+    """Fails a job without retrying it, e.g. as its payload is invalid."""
+
+
+def task(kind: str):
+    """Registers the decorated function as the task of the jobs of the given kind."""
+
+    def register(fn: Callable[..., Any]) -> Callable[..., Any]:
+        TASKS[kind] = fn
+        return fn
+
+    return register
+
+
+@task("project.import")
+def import_projects(*, db_session: Session, payload: dict) -> dict:
+    """Creates the `projects` of the payload, in batches. The projects whose name is taken are skipped."""
+    try:
+        projects_in = parse_obj_as(List[ProjectCreate], payload.get("projects", []))
+    except ValidationError as e:
+        raise PermanentJobError(str(e))
+
+    created = 0
+    for start in range(0, len(projects_in), PROJECT_BULK_BATCH_SIZE):
+        batch = projects_in[start:start + PROJECT_BULK_BATCH_SIZE]
+        rows = create_all(db_session=db_session, projects_in=batch)
+        created += sum(row is not None for row in rows)
+    return {"created": created, "exists": len(projects_in) - created}
+
+
+@lru_cache(maxsize=None)
+def _model():
+    # loaded once per worker process, on its first prediction job
+    return load_model(INFERENCE_MODEL)
+
+
+@task("inference.predict")
+def predict(*, db_session: Session, payload: dict) -> dict:
+    """Runs the model on the `inputs` of the payload, a batch of inputs."""
+    model = _model()
+    batch = payload.get("inputs")
+    input_size = getattr(model, "input_size", None)
+    if not isinstance(batch, list) or not batch:
+        raise PermanentJobError("The payload must hold a non-empty list of inputs.")
+    for inputs in batch:
+        if not isinstance(inputs, list) or (input_size is not None and len(inputs) != input_size):
+            raise PermanentJobError(f"The model expects lists of {input_size} inputs.")
+    return {"probabilities": model.predict(batch)}
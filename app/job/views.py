@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from typing import Annotated, Iterator
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic.error_wrappers import ErrorWrapper, ValidationError
+from sqlalchemy.orm import Session
+
+from ..context import get_schema
+from ..database import core as database
+from ..exceptions import InvalidInputError
+from ..models import PrimaryKey
+from ..responses import ORJSONResponse
+
+from .models import JobCreate, JobRead
+from .service import get, submit
+from .tasks import TASKS
+
+router = APIRouter()
+
+
+def get_queue_db() -> Iterator[Session]:
+    # the queue is shared by all tenants, its session is not schema-translated
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+QueueSession = Annotated[Session, Depends(get_queue_db)]
+
+
+@router.post(
+    "",
+    response_model=JobRead,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Submit a job.",
+)
+def submit_job(db_session: QueueSession, job_in: JobCreate):
+    """
+    Submit a job, which runs in the background.
+
+    The job is returned right away, its status and result are polled at
+    `/jobs/{job_id}`.
+    """
+    if job_in.kind not in TASKS:
+        raise ValidationError(
+            [ErrorWrapper(InvalidInputError(msg=f"Unknown job kind: {job_in.kind}"), loc="kind")],
+            model=JobCreate,
+        )
+    job = submit(db_session=db_session, job_in=job_in, tenant=get_schema())
+    return ORJSONResponse(JobRead.dump_orm(job), status_code=status.HTTP_202_ACCEPTED)
+
+
+@router.get(
+    "/{job_id}",
+    response_model=JobRead,
+    summary="Get a job.",
+)
+def get_job(db_session: QueueSession, job_id: PrimaryKey):
+    """Get the status of a job, and its result once it succeeded."""
+    job = get(db_session=db_session, job_id=job_id, tenant=get_schema())
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=[{"msg": "A job with this id does not exist."}],
+        )
+    return ORJSONResponse(JobRead.dump_orm(job))
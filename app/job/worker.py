@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+The workers of the job queue.
+
+Every worker process claims the jobs due one at a time and runs them in the
+schema of their tenant. The workers only share the database, so the queue
+scales out by starting more of them, on this host (`--processes`) or on
+others. The supervisor restarts the workers that die, their jobs are
+claimed again once their lease expired.
+
+On SIGTERM or SIGINT the workers finish the job they run and exit.
+
+Usage:
+
+    ./run python -m app.job.worker --processes 4
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy.engine import Row
+
+from .. import config
+from ..context import _request_id_ctx_var, _schema_ctx_var
+from ..database import core as database
+from ..logging import configure_logging
+from .service import claim, complete, fail
+from .tasks import PermanentJobError, TASKS
+
+log = logging.getLogger(__name__)
+
+# workers exiting sooner than this after they were started are restarted with a delay
+MIN_UPTIME = 1.0
+
+
+class JobWorker:
+    """Claims and runs jobs until it is stopped, waiting `poll_interval` seconds while none is due."""
+
+    def __init__(self, name: Optional[str] = None, poll_interval: float = 1.0, stop=None):
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.stop = stop if stop is not None else threading.Event()
+        self.succeeded = 0
+        self.failed = 0
+
+    def run(self):
+        log.info(f"Worker {self.name} started.")
+        while not self.stop.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                # e.g. the database is unreachable, the worker waits for it
+                log.exception(f"Worker {self.name} could not claim a job.")
+                ran = False
+            if not ran:
+                self.stop.wait(self.poll_interval)
+        log.info(f"Worker {self.name} stopped.")
+
+    def run_once(self) -> bool:
+        """Runs the next job due, returns False if there was none."""
+        with database.get_session() as session:
+            job = claim(db_session=session, worker=self.name)
+        if job is None:
+            return False
+        self.execute(job)
+        return True
+
+    def execute(self, job: Row):
+        request_token = _request_id_ctx_var.set(f"job-{job.id}")
+        schema_token = _schema_ctx_var.set(job.tenant)
+        tenant_session = None
+        try:
+            fn = TASKS.get(job.kind)
+            if fn is None:
+                raise PermanentJobError(f"Unknown job kind: {job.kind}")
+            if job.attempts > job.max_attempts:
+                # the job outlived the lease of its workers this often, e.g. it crashes them
+                raise PermanentJobError(f"The job was abandoned by {job.attempts - 1} workers.")
+            tenant_session = database.schema_registry.get_session(job.tenant)
+            if tenant_session is None:
+                raise PermanentJobError(f"Unknown tenant: {job.tenant}")
+            result = fn(db_session=tenant_session(), payload=job.payload or {})
+        except Exception as e:
+            retry = not isinstance(e, PermanentJobError)
+            log.warning(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {e!r}", exc_info=retry)
+            with database.get_session() as session:
+                fail(db_session=session, job=job, worker=self.name, error=str(e) or repr(e), retry=retry)
+            self.failed += 1
+        else:
+            with database.get_session() as session:
+                if not complete(db_session=session, job_id=job.id, worker=self.name, result=result):
+                    log.warning(f"Job {job.id} was claimed by another worker, its result is dropped.")
+            self.succeeded += 1
+        finally:
+            if tenant_session is not None:
+                tenant_session.remove()
+            _schema_ctx_var.reset(schema_token)
+            _request_id_ctx_var.reset(request_token)
+
+
+def work(stop, poll_interval: float):
+    """The target of the worker processes."""
+    # the supervisor stops the workers through `stop`, such that the signals do not interrupt a job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    configure_logging()
+    JobWorker(poll_interval=poll_interval, stop=stop).run()
+
+
+class Supervisor:
+    def __init__(self, processes: int, poll_interval: float, graceful_timeout: float = 30):
+        self.processes_count = processes
+        self.poll_interval = poll_interval
+        self.graceful_timeout = graceful_timeout
+        self.processes: List[Optional[multiprocessing.Process]] = []
+        self.started_at: List[float] = []
+        # the workers are spawned such that they do not inherit the connections of the supervisor
+        self._context = multiprocessing.get_context("spawn")
+        self.stop = self._context.Event()
+        self.should_exit = False
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=work, args=(self.stop, self.poll_interval), name=f"job-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+
+    def _handle_exit(self, signum, frame):
+        # the event is not set here, its lock may be held by the interrupted main thread
+        self.should_exit = True
+
+    def run(self) -> int:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._handle_exit)
+
+        self.processes = [None] * self.processes_count
+        self.started_at = [0.0] * self.processes_count
+        for index in range(self.processes_count):
+            self._spawn(index)
+        log.warning(f"Started {self.processes_count} job workers.")
+
+        while not self.should_exit:
+            time.sleep(0.5)
+            for index, process in enumerate(self.processes):
+                if self.should_exit or process.is_alive():
+                    continue
+                log.error(f"Job worker {process.pid} died with exit code {process.exitcode}, restarting it.")
+                if time.monotonic() - self.started_at[index] < MIN_UPTIME:
+                    # does not restart a crashing worker in a tight loop
+                    time.sleep(MIN_UPTIME)
+                self._spawn(index)
+
+        self.shutdown()
+        return 0
+
+    def shutdown(self):
+        """Lets the workers finish their job, the ones not done in time are killed."""
+        self.stop.set()
+        deadline = time.monotonic() + self.graceful_timeout
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                log.error(f"Job worker {process.pid} did not stop in time, killing it.")
+                process.kill()
+                process.join()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the jobs of the queue with several worker processes.")
+    parser.add_argument("--processes", type=int, default=config.JOB_WORKERS)
+    parser.add_argument("--poll-interval", type=float, default=config.JOB_POLL_INTERVAL)
+    parser.add_argument("--graceful-timeout", type=float, default=config.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+    return Supervisor(args.processes, args.poll_interval, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,32 @@
 # -*- coding: utf-8 -*-
+"""
+The logging pipeline.
+
+The threads emitting log records (e.g. the event loop) only hand them to a
+bounded queue, a writer thread formats them and writes them in batches. The
+emitting threads never wait for the queue: once it fills up the records
+below WARNING are sampled, and once it is full the records are dropped and
+counted, the writer logs how many.
+"""
+import atexit
 import logging
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+from typing import List, Optional, TextIO
+
+import orjson
 
-from .config import LOG_LEVEL
+from .config import LOG_BATCH_SIZE, LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE
+from .context import get_request_id
 from .enums import ProjectEnum
 
 
 LOG_FORMAT_DEBUG = "%(levelname)s:%(message)s:%(pathname)s:%(funcName)s:%(lineno)d"
+# the queue is under backpressure from this fill ratio on
+HIGH_WATER_MARK = 0.8
 
 
 class LogLevels(ProjectEnum):
@@ -15,17 +36,186 @@ class LogLevels(ProjectEnum):
     debug = "DEBUG"
 
 
-def configure_logging():
-    log_level = str(LOG_LEVEL).upper()  # cast to string
-    log_levels = list(LogLevels)
+class JSONFormatter(logging.Formatter):
+    """Formats a record as one JSON object, with the id of the request that emitted it."""
+
+    def __init__(self, debug: bool = False):
+        super().__init__()
+        self.debug = debug
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            data["request_id"] = request_id
+        if self.debug:
+            data.update(pathname=record.pathname, funcName=record.funcName, lineno=record.lineno)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        return orjson.dumps(data, default=str).decode()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands the records to the queue of the writer thread without waiting.
+
+    Only the request id and the message are resolved in the emitting thread
+    (and the traceback, which must not outlive it), the records are
+    formatted by the writer.
+    """
+
+    def __init__(self, log_queue: queue.Queue, sample_rate: int = 10):
+        super().__init__(log_queue)
+        self.sample_rate = max(sample_rate, 1)
+        self.high_water = int(log_queue.maxsize * HIGH_WATER_MARK) if log_queue.maxsize > 0 else 0
+        self.dropped = 0
+        self._shed = 0
+
+    def emit(self, record: logging.LogRecord):
+        if self.high_water and record.levelno < logging.WARNING and self.queue.qsize() >= self.high_water:
+            self._shed += 1
+            if self._shed % self.sample_rate:
+                self.dropped += 1
+                return
+        super().emit(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = get_request_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """The thread writing the records of the queue to a stream, in batches."""
+
+    _stop = object()
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        handler: NonBlockingQueueHandler,
+        formatter: logging.Formatter,
+        stream: TextIO = None,
+        batch_size: int = 100,
+    ):
+        self.queue = log_queue
+        self.handler = handler
+        self.formatter = formatter
+        self.stream = stream
+        self.batch_size = batch_size
+        self.reported = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
 
-    if log_level not in log_levels:
+    def stop(self):
+        """Writes the records still queued and stops the thread."""
+        if self._thread is not None:
+            self.queue.put(self._stop)
+            self._thread.join()
+            self._thread = None
+
+    def _drain(self) -> List[logging.LogRecord]:
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drain()
+            stopping = self._stop in batch
+            lines = [self._format(record) for record in batch if record is not self._stop]
+
+            dropped = self.handler.dropped
+            if dropped > self.reported:
+                msg = f"{dropped - self.reported} log records were dropped, the log queue was full."
+                record = logging.LogRecord(__name__, logging.WARNING, __file__, 0, msg, None, None)
+                lines.append(self._format(record))
+                self.reported = dropped
+
+            if lines:
+                self._write("\n".join(lines) + "\n")
+            if stopping:
+                return
+
+    def _format(self, record: logging.LogRecord) -> str:
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return f"Could not format the log record {record.msg!r}: {e}"
+
+    def _write(self, text: str):
+        # the stream is looked up on every write, such that a replaced sys.stderr is used
+        stream = self.stream or sys.stderr
+        try:
+            stream.write(text)
+            stream.flush()
+        except Exception:
+            pass
+
+
+_writer: Optional[LogWriter] = None
+
+
+def _get_log_level() -> str:
+    log_level = str(LOG_LEVEL).upper()  # cast to string
+    if log_level not in list(LogLevels):
         # we use error as the default log level
-        logging.basicConfig(level=LogLevels.error)
-        return
+        return LogLevels.error
+    return log_level
+
 
-    if log_level == LogLevels.debug:
-        logging.basicConfig(level=log_level, format=LOG_FORMAT_DEBUG)
+def configure_logging(stream: TextIO = None):
+    """
+    Sends the records of the root logger through the queue to the writer
+    thread, unless the root logger already has handlers (like
+    `logging.basicConfig`).
+    """
+    global _writer
+
+    log_level = _get_log_level()
+    root = logging.getLogger()
+    if root.handlers:
         return
 
-    logging.basicConfig(level=log_level)
+    debug = log_level == LogLevels.debug
+    if not debug:
+        # the records need not know where they were emitted, which spares a stack walk per record
+        logging._srcfile = None
+
+    if LOG_FORMAT == "json":
+        formatter = JSONFormatter(debug=debug)
+    else:
+        formatter = logging.Formatter(LOG_FORMAT_DEBUG if debug else logging.BASIC_FORMAT)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue, sample_rate=LOG_SAMPLE_RATE)
+    _writer = LogWriter(log_queue, handler, formatter, stream=stream, batch_size=LOG_BATCH_SIZE)
+    _writer.start()
+    atexit.register(_writer.stop)
+
+    root.addHandler(handler)
+    root.setLevel(log_level)
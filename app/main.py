@@ -1,26 +1,46 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import logging
-from contextvars import ContextVar
+from contextlib import asynccontextmanager
 from uuid import uuid1
-from typing import Optional, Final
 
+import anyio.to_thread
 from fastapi import FastAPI, status
 from fastapi.responses import JSONResponse
-from sqlalchemy import inspect
-from sqlalchemy.orm import scoped_session
-from starlette.middleware.gzip import GZipMiddleware
+from pydantic.error_wrappers import ValidationError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.util import greenlet_spawn
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 
 from .api import api_router
-from .database.core import engine, sessionmaker
+from .compression import CompressionMiddleware
+from .config import (
+    COMPRESSION_MINIMUM_SIZE,
+    COMPRESSION_THREADPOOL_SIZE,
+    DATABASE_ENGINE_POOL_IDLE_TIMEOUT,
+    DATABASE_READ_YOUR_WRITES_WINDOW,
+    DATABASE_REPLICA_CHECK_INTERVAL,
+    INFERENCE_WARMUP,
+    METRICS_ENABLED,
+    METRICS_N_PLUS_ONE_THRESHOLD,
+    SERVER_WARMUP,
+    THREADPOOL_SIZE,
+)
+from .context import _read_replica_ctx_var, _request_id_ctx_var, _schema_ctx_var, get_request_id  # noqa: F401
+from .database import core as database
+from .database.replicas import ReplicaSet
+from .enums import TenantSource
+from .inference.engine import InferenceOverloadedError
+from .inference.service import inference_engine
 from .logging import configure_logging
+from .metrics import MetricsMiddleware
+from .profiling import ProfilingMiddleware, profiler
+from .tenant import tenant_resolver
 
 
 log = logging.getLogger(__name__)
 
-# we configure the logging level and format
-configure_logging()
-
 
 async def not_found(request, exc):
     return JSONResponse(
@@ -28,11 +48,128 @@ async def not_found(request, exc):
     )
 
 
+async def validation_error(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content={"detail": exc.errors()}
+    )
+
+
+async def pool_timeout(request, exc):
+    # the database or the inference engine is saturated, the client is better off retrying than waiting
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": [{"msg": "The service is busy, please retry."}]},
+        headers={"Retry-After": "1"},
+    )
+
+
 exception_handlers = {404: not_found}
 
+# the cookie sending the reads of a client that just wrote to the primary
+READ_PRIMARY_COOKIE = "read_primary"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+async def trim_pools():
+    """Closes the connections of the pools once they have been idle for a while."""
+    while True:
+        await asyncio.sleep(DATABASE_ENGINE_POOL_IDLE_TIMEOUT / 2)
+        await run_in_threadpool(database.engine.pool.trim)
+        if database.async_engine is not None:
+            # the async connections are closed from the event loop
+            await greenlet_spawn(database.async_engine.sync_engine.pool.trim)
+        replica_set = database.schema_registry.replica_set
+        if replica_set is not None:
+            for replica in replica_set.engines:
+                await run_in_threadpool(replica.pool.trim)
+            for replica in database.schema_registry.async_replicas:
+                await greenlet_spawn(replica.sync_engine.pool.trim)
+
+
+async def check_replicas(replica_set: ReplicaSet):
+    """Checks the health of the read replicas, the reads only go to the healthy ones."""
+    while True:
+        await asyncio.sleep(DATABASE_REPLICA_CHECK_INTERVAL)
+        await run_in_threadpool(replica_set.check)
+
+
+async def warm_up(app: FastAPI):
+    """Does the work of the first requests before the worker accepts any, see app/server.py."""
+    await run_in_threadpool(database.engine.pool.prefill)
+    if database.async_engine is not None:
+        await greenlet_spawn(database.async_engine.sync_engine.pool.prefill)
+    api.openapi()
+    if INFERENCE_WARMUP:
+        # spawns the processes of the inference pool and loads the model in them
+        await inference_engine.start()
+
+    # a request through the whole app builds the middleware stacks of the app and of the API
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    path = "/api/v1/healthcheck"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": None,
+        "server": None,
+        "state": {},
+    }
+    await app(scope, receive, send)
+    if messages[0]["status"] != status.HTTP_200_OK:
+        log.warning(f"The warm-up request failed with status {messages[0]['status']}.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # we configure the logging level and format
+    configure_logging()
+    # the sync pool is sized after the threadpool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # the engines are created here rather than when the app is imported
+    database.create_engines()
+    # we reflect the schema names once before serving any request
+    await run_in_threadpool(database.schema_registry.load)
+    # kill -USR2 <pid> switches profiling on and off
+    profiler.install_signal_handler()
+    if SERVER_WARMUP:
+        await warm_up(app)
+    tasks = [asyncio.create_task(trim_pools())]
+    replica_set = database.schema_registry.replica_set
+    if replica_set is not None:
+        await run_in_threadpool(replica_set.check)
+        tasks.append(asyncio.create_task(check_replicas(replica_set)))
+    yield
+    for task in tasks:
+        task.cancel()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    for replica in database.schema_registry.async_replicas:
+        await replica.dispose()
+    await inference_engine.stop()
+
+
 # we create the ASGI for the app
-app = FastAPI(exception_handlers=exception_handlers, openapi_url="")
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app = FastAPI(exception_handlers=exception_handlers, openapi_url="", lifespan=lifespan)
+# the only compression layer, it also covers the mounted API
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    threadpool_size=COMPRESSION_THREADPOOL_SIZE,
+)
 
 # we create the Web API framework
 api = FastAPI(
@@ -43,15 +180,9 @@ api = FastAPI(
     openapi_url="/docs/openapi.json",
     redoc_url="/docs",
 )
-api.add_middleware(GZipMiddleware, minimum_size=1000)
-
-
-REQUEST_ID_CTX_KEY: Final[str] = "request_id"
-_request_id_ctx_var: ContextVar[Optional[str]] = ContextVar(REQUEST_ID_CTX_KEY, default=None)
-
-
-def get_request_id() -> Optional[str]:
-    return _request_id_ctx_var.get()
+api.add_exception_handler(ValidationError, validation_error)
+api.add_exception_handler(PoolTimeoutError, pool_timeout)
+api.add_exception_handler(InferenceOverloadedError, pool_timeout)
 
 
 @api.middleware("http")
@@ -62,35 +193,62 @@ async def db_session_middleware(request: Request, call_next):
     # see: https://github.com/tiangolo/fastapi/issues/726
     ctx_token = _request_id_ctx_var.set(request_id)
 
-    schema = "public"
-    # validate schema exists
-    schema_names = inspect(engine).get_schema_names()
-    if schema in schema_names:
-        # add correct schema mapping depending on the request
-        schema_engine = engine.execution_options(
-            schema_translate_map={
-                None: schema,
-            }
-        )
-    else:
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"detail": [{"msg": f"Unknown database schema name: {schema}"}]},
-        )
-
+    schema_token = None
     try:
-        session = scoped_session(sessionmaker(bind=schema_engine), scopefunc=get_request_id)
-        request.state.db = session()
-        response = await call_next(request)
-    except Exception as e:
-        raise e from None
+        schema = tenant_resolver.resolve(request.headers)
+        if schema is None:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST, content={"detail": [{"msg": "No valid tenant given."}]}
+            )
+        # validate schema exists, the schema names are only reflected again once they expire
+        if database.schema_registry.expired:
+            await run_in_threadpool(database.schema_registry.load)
+        session = database.schema_registry.get_session(schema)
+        if session is None:
+            if tenant_resolver.source == TenantSource.none:
+                return JSONResponse(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    content={"detail": [{"msg": f"Unknown database schema name: {schema}"}]},
+                )
+            return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND, content={"detail": [{"msg": f"Unknown tenant: {schema}"}]}
+            )
+
+        # the cached rows are kept per schema
+        schema_token = _schema_ctx_var.set(schema)
+        replicated = database.schema_registry.replica_set is not None
+        if replicated:
+            # the reads of read-only requests go to a replica, unless the client just wrote something
+            replica_token = _read_replica_ctx_var.set(
+                request.method in SAFE_METHODS and READ_PRIMARY_COOKIE not in request.cookies
+            )
+        request.state.db = session
+        request.state.async_db = database.schema_registry.get_async_session(schema)
+        try:
+            response = await call_next(request)
+        except Exception as e:
+            raise e from None
+        finally:
+            # closes the session of this request (if any) and forgets about it
+            session.remove()
+            if replicated:
+                _read_replica_ctx_var.reset(replica_token)
+
+        if replicated and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=DATABASE_READ_YOUR_WRITES_WINDOW, httponly=True)
     finally:
-        request.state.db.close()
+        if schema_token is not None:
+            _schema_ctx_var.reset(schema_token)
+        _request_id_ctx_var.reset(ctx_token)
 
-    _request_id_ctx_var.reset(ctx_token)
     return response
 
 
+# added last such that they also measure the session middleware
+api.add_middleware(ProfilingMiddleware)
+if METRICS_ENABLED:
+    api.add_middleware(MetricsMiddleware, n_plus_one_threshold=METRICS_N_PLUS_ONE_THRESHOLD)
+
 # we add all API routes to the Web API framework
 api.include_router(api_router)
 
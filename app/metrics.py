@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+import bisect
+import logging
+import threading
+import weakref
+from time import perf_counter
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .context import QueryStats, _query_stats_ctx_var
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    labels = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _add(totals: Dict[tuple, list], shard: Dict[tuple, list]) -> None:
+    for labelvalues, values in list(shard.items()):
+        total = totals.get(labelvalues)
+        if total is None:
+            totals[labelvalues] = list(values)
+        else:
+            for i, value in enumerate(values):
+                total[i] += value
+
+
+class _ShardOwner:
+    """Kept in the thread-local storage of a thread, it is collected once the thread ends."""
+
+    __slots__ = ("__weakref__",)
+
+
+class Metric:
+    """
+    Base class of the metrics.
+
+    Every thread records into its own shard of values, which only that
+    thread ever writes to, so recording takes no lock. The shards are only
+    added up when the metrics are collected. Once a thread ends, its shard
+    is folded into the values of the finished threads, so recycled worker
+    threads do not pile up shards.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: Dict[int, Dict[tuple, list]] = {}
+        # the values recorded by the threads that ended
+        self._base: Dict[tuple, list] = {}
+        # reentrant, a shard may be retired by a garbage collection while the shards are merged
+        self._lock = threading.RLock()
+
+    def _shard(self) -> Dict[tuple, list]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            owner = self._local.owner = _ShardOwner()
+            # setting a key of a dict is atomic
+            self._shards[id(values)] = values
+            weakref.finalize(owner, self._retire, values)
+            return values
+
+    def _retire(self, values: Dict[tuple, list]) -> None:
+        with self._lock:
+            _add(self._base, values)
+            del self._shards[id(values)]
+
+    def _new_values(self) -> list:
+        raise NotImplementedError
+
+    def _merged(self) -> Dict[tuple, list]:
+        with self._lock:
+            merged = {}
+            _add(merged, self._base)
+            for shard in list(self._shards.values()):
+                _add(merged, shard)
+            return merged
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Returns the (name, labels, value) samples of the metric."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        with self._lock:
+            self._base.clear()
+            for shard in list(self._shards.values()):
+                shard.clear()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_values(self) -> list:
+        return [0.0]
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        shard = self._shard()
+        values = shard.get(labelvalues)
+        if values is None:
+            values = shard[labelvalues] = self._new_values()
+        values[0] += amount
+
+    def samples(self):
+        return [
+            (self.name, _format_labels(self.labelnames, labelvalues), values[0])
+            for labelvalues, values in sorted(self._merged().items())
+        ]
+
+
+class Histogram(Metric):
+    """A histogram of the observed values, in buckets whose upper bounds are `buckets`."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_values(self) -> list:
+        # one count per bucket, the count of the +Inf bucket and the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *labelvalues) -> None:
+        shard = self._shard()
+        values = shard.get(labelvalues)
+        if values is None:
+            values = shard[labelvalues] = self._new_values()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def samples(self):
+        samples = []
+        for labelvalues, values in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(bound)}"')
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.labelnames, labelvalues)
+            samples.append((f"{self.name}_sum", labels, values[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Gauge(Metric):
+    """
+    A gauge whose value is read by `func` when the metrics are collected.
+
+    With `labelnames`, `func` returns the values by tuple of label values.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def samples(self):
+        if not self.labelnames:
+            return [(self.name, "", self.func())]
+        return [
+            (self.name, _format_labels(self.labelnames, labelvalues), value)
+            for labelvalues, value in sorted(self.func().items())
+        ]
+
+
+class MetricsRegistry:
+    """The metrics exposed by the `/metrics` endpoint."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"A metric named {metric.name!r} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def gauge(self, name: str, documentation: str, func: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, func, labelnames))
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "http_requests_total", "Number of HTTP requests.", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Latency of the HTTP requests.", ("method", "route")
+)
+http_request_queries = registry.histogram(
+    "http_request_db_queries",
+    "Number of SQL statements executed per HTTP request.",
+    ("method", "route"),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+http_request_query_duration = registry.histogram(
+    "http_request_db_query_duration_seconds",
+    "Total time spent executing SQL statements per HTTP request.",
+    ("method", "route"),
+)
+http_requests_n_plus_one = registry.counter(
+    "http_requests_n_plus_one_total",
+    "Number of HTTP requests that executed more SQL statements than the N+1 threshold.",
+    ("method", "route"),
+)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, the status and the SQL statements of every request
+    by route, and logs the requests that execute more than
+    `n_plus_one_threshold` statements, which usually is an N+1 query pattern.
+    """
+
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int = 20) -> None:
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _query_stats_ctx_var.set(stats)
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - start
+            _query_stats_ctx_var.reset(token)
+
+            # the route template keeps the number of label values bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            http_requests.inc(method, path, status)
+            http_request_duration.observe(elapsed, method, path)
+            http_request_queries.observe(stats.count, method, path)
+            http_request_query_duration.observe(stats.duration, method, path)
+            if stats.count > self.n_plus_one_threshold:
+                http_requests_n_plus_one.inc(method, path)
+                log.warning(
+                    f"{method} {path} executed {stats.count} SQL statements "
+                    f"(threshold {self.n_plus_one_threshold}), possible N+1 query pattern."
+                )
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from typing import Optional
 
 from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST
 from pydantic.types import conint, constr, SecretStr
 
 from sqlalchemy import Column, DateTime, event
@@ -44,11 +46,32 @@ class DataBase(BaseModel):
             SecretStr: lambda v: v.get_secret_value() if v else None,
         }
 
+    @classmethod
+    def dump_orm(cls, obj) -> dict:
+        """
+        Reads the fields of the model from an ORM object (or a row or a dict)
+        without validating them, as `cls.from_orm(obj).dict()` would for
+        values that are already valid, e.g. loaded from the database.
+        """
+        get = obj.get if isinstance(obj, dict) else lambda name: getattr(obj, name, None)
+
+        data = {}
+        for name, field in cls.__fields__.items():
+            value = get(name)
+            nested = field.type_
+            if value is not None and isinstance(nested, type) and issubclass(nested, DataBase):
+                if field.shape == SHAPE_LIST:
+                    value = [nested.dump_orm(item) for item in value]
+                else:
+                    value = nested.dump_orm(value)
+            data[name] = field.default if value is None else value
+        return data
+
 
-class Pagination(InferenceBase):
+class Pagination(DataBase):
     itemsPerPage: int
     page: int
-    total: int
+    total: Optional[int]
 
 
 class PrimaryKeyModel(BaseModel):
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import config
+from .context import get_request_id
+
+log = logging.getLogger(__name__)
+
+# stacks whose innermost frame is in one of these files belong to idle threads
+_IDLE_FILES = tuple(
+    os.path.join(os.path.dirname(os.__file__), name) for name in ("threading.py", "selectors.py", "queue.py")
+)
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    # the paths are shortened to the module path, as in tracebacks of installed packages
+    for path in sorted((path or os.getcwd() for path in sys.path), key=len, reverse=True):
+        if filename.startswith(path + os.sep):
+            filename = filename[len(path) + 1:]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    A sampling profiler.
+
+    While at least one request is profiled, a background thread takes the
+    stacks of all busy threads every `interval` seconds and hands them to
+    the collectors of the profiled requests. The stacks are kept as tuples
+    of code objects (outermost first), they are only formatted when the
+    profile of a request is added to the profile of its route.
+    """
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._collectors: List[Counter] = []
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            thread, self._thread = self._thread, None
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+
+    def begin(self) -> Counter:
+        """Starts collecting the stacks for a request."""
+        collector = Counter()
+        with self._lock:
+            self._collectors.append(collector)
+        self._wakeup.set()
+        return collector
+
+    def end(self, collector: Counter):
+        with self._lock:
+            self._collectors.remove(collector)
+
+    def _stacks(self):
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own or frame.f_code.co_filename.startswith(_IDLE_FILES):
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            yield tuple(stack)
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                collectors = list(self._collectors)
+            if not collectors:
+                # sleeps until a request is profiled
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            for stack in self._stacks():
+                for collector in collectors:
+                    collector[stack] += 1
+            time.sleep(self.interval)
+
+
+class Profiler:
+    """
+    Opt-in profiling of the API, switchable at runtime.
+
+    When enabled, `sample_rate` of the requests are profiled by the
+    `StackSampler` and their stacks are added up by route, in the collapsed
+    stack format of flamegraph.pl and speedscope. SQL statements slower
+    than `slow_query_threshold` seconds are kept along with their EXPLAIN
+    plan. When disabled, nothing is sampled and no SQL event listener is
+    installed, and the profiles are written to `output_dir` (if any).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_rate: float = 0.01,
+        interval: float = 0.01,
+        slow_query_threshold: float = 0.5,
+        max_slow_queries: int = 100,
+        output_dir: str = None,
+    ):
+        self.enabled = False
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.slow_query_threshold = slow_query_threshold
+        self.sampler = StackSampler(interval)
+        self.profiles: Dict[str, Counter] = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self._engines: List[Engine] = []
+        self._labels = {}
+        self._endpoint_codes = {}
+        self._lock = threading.Lock()
+        if enabled:
+            self.configure(enabled=True)
+
+    def settings(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "interval": self.sampler.interval,
+            "slow_query_threshold": self.slow_query_threshold,
+        }
+
+    def add_engine(self, engine: Engine):
+        """Captures the slow SQL statements of the engine while profiling is enabled."""
+        self._engines.append(engine)
+        if self.enabled:
+            self._listen(engine)
+
+    def _listen(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _remove(self, engine: Engine):
+        if event.contains(engine, "before_cursor_execute", self._before_cursor_execute):
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def configure(
+        self,
+        enabled: bool = None,
+        sample_rate: float = None,
+        interval: float = None,
+        slow_query_threshold: float = None,
+    ) -> dict:
+        """Changes the settings of the profiler, e.g. from the admin endpoint."""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if interval is not None:
+            self.sampler.interval = interval
+        if slow_query_threshold is not None:
+            self.slow_query_threshold = slow_query_threshold
+
+        if enabled is not None and enabled != self.enabled:
+            self.enabled = enabled
+            for engine in self._engines:
+                if enabled:
+                    self._listen(engine)
+                else:
+                    self._remove(engine)
+            if enabled:
+                self.sampler.start()
+            else:
+                self.sampler.stop()
+                if self.output_dir and self.profiles:
+                    self.write(self.output_dir)
+            log.warning(f"Profiling {'enabled' if enabled else 'disabled'}.")
+        return self.settings()
+
+    def toggle(self, *args):
+        """Switches profiling on or off, the handler of the profiling signal."""
+        self.configure(enabled=not self.enabled)
+
+    def install_signal_handler(self, signum: Optional[int] = getattr(signal, "SIGUSR2", None)) -> bool:
+        """Installs `toggle` as the handler of `signum`, which does not exist on Windows."""
+        if signum is None:
+            return False
+        try:
+            signal.signal(signum, self.toggle)
+        except ValueError:
+            # signal handlers can only be installed from the main thread
+            return False
+        return True
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+
+    def other_endpoints(self, router, endpoint) -> frozenset:
+        """Returns the code of the endpoints of the router, except the one of `endpoint`."""
+        codes = self._endpoint_codes.get(id(router))
+        if codes is None:
+            codes = frozenset(
+                route.endpoint.__code__ for route in router.routes if hasattr(route, "endpoint")
+            )
+            self._endpoint_codes[id(router)] = codes
+        return codes - {endpoint.__code__} if endpoint is not None else codes
+
+    def record(self, route: str, stacks: Counter, other_endpoints: frozenset = frozenset()):
+        """Adds the stacks sampled during a request to the profile of its route."""
+        collapsed = Counter()
+        for stack, count in stacks.items():
+            # the stacks of concurrent requests to other routes are left out
+            if other_endpoints.isdisjoint(stack):
+                collapsed[";".join(self._label(code) for code in stack)] += count
+        with self._lock:
+            self.profiles.setdefault(route, Counter()).update(collapsed)
+
+    def collapsed(self, route: str) -> str:
+        """Returns the profile of the route in the collapsed stack format."""
+        with self._lock:
+            profile = dict(self.profiles.get(route, {}))
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(profile.items()))
+
+    def write(self, directory: str) -> List[str]:
+        """Writes the profile of every route to `<directory>/<route>.collapsed`."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for route in list(self.profiles):
+            name = re.sub(r"[^\w.-]+", "_", route).strip("_") or "root"
+            path = os.path.join(directory, f"{name}.collapsed")
+            with open(path, "w") as f:
+                f.write(self.collapsed(route))
+            paths.append(path)
+        return paths
+
+    def clear(self):
+        with self._lock:
+            self.profiles.clear()
+        self.slow_queries.clear()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiling_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get("profiling_start_time")
+        if not start_times:
+            return
+        elapsed = time.perf_counter() - start_times.pop()
+        if elapsed < self.slow_query_threshold:
+            return
+
+        plan = None
+        if not executemany and _EXPLAINABLE.match(statement):
+            # explained through the DBAPI cursor such that it does not come through these events again,
+            # under a savepoint such that a failed EXPLAIN does not abort the transaction of the request
+            dbapi_connection = conn.connection
+            savepoint = not getattr(dbapi_connection, "autocommit", False)
+            try:
+                explain = dbapi_connection.cursor()
+                try:
+                    if savepoint:
+                        explain.execute("SAVEPOINT profiling_explain")
+                    try:
+                        explain.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                        plan = explain.fetchone()[0]
+                    except Exception:
+                        if savepoint:
+                            explain.execute("ROLLBACK TO SAVEPOINT profiling_explain")
+                        raise
+                    finally:
+                        if savepoint:
+                            explain.execute("RELEASE SAVEPOINT profiling_explain")
+                finally:
+                    explain.close()
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+
+        self.slow_queries.append(
+            {
+                "statement": statement,
+                "duration": elapsed,
+                "request_id": get_request_id(),
+                "plan": plan,
+            }
+        )
+        log.warning(f"Slow SQL statement ({elapsed:.3f}s): {statement}")
+
+
+profiler = Profiler(
+    enabled=config.PROFILING_ENABLED,
+    sample_rate=config.PROFILING_SAMPLE_RATE,
+    interval=config.PROFILING_INTERVAL,
+    slow_query_threshold=config.PROFILING_SLOW_QUERY_THRESHOLD,
+    output_dir=config.PROFILING_OUTPUT_DIR,
+)
+
+
+class ProfilingMiddleware:
+    """Profiles the sampled requests while profiling is enabled, it only checks a flag otherwise."""
+
+    def __init__(self, app: ASGIApp, profiler: Profiler = profiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profiler = self.profiler
+        if not profiler.enabled or scope["type"] != "http" or random.random() >= profiler.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        stacks = profiler.sampler.begin()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.sampler.end(stacks)
+            route = scope.get("route")
+            if route is not None:
+                other_endpoints = profiler.other_endpoints(scope["app"].router, getattr(route, "endpoint", None))
+                profiler.record(route.path, stacks, other_endpoints)
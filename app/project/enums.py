@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from ..enums import ProjectEnum
+
+
+class ProjectBulkStatus(ProjectEnum):
+    created = "created"
+    exists = "exists"
+    invalid = "invalid"
+
+
+class ProjectExportFormat(ProjectEnum):
+    ndjson = "ndjson"
+    csv = "csv"
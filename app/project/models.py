@@ -2,18 +2,84 @@
 from typing import List, Optional
 from pydantic import Field
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DDL, event, Index, Integer, literal_column, String, text
 
 from ..database.core import Base
-from ..models import InferenceBase, NameStr, PrimaryKey, TimeStampMixin
+from ..models import DataBase, NameStr, Pagination, PrimaryKey, TimeStampMixin
+from .enums import ProjectBulkStatus
 
 
 class Project(Base, TimeStampMixin):
     # Columns
     id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, unique=True)
     description = Column(String)
 
+    __table_args__ = (
+        # backs the keyset pagination of the listing sorted by creation time
+        Index("ix_project_created_at_id", "created_at", "id"),
+    )
+
+
+# the read-only rows of the read paths
+ProjectRow = Project.row_type()
+
+
+# The full-text document of the projects on PostgreSQL: their name and
+# description as a tsvector, with the 'simple' configuration (which neither
+# stems nor drops stop words, as names are not prose). It is stored in a
+# generated column, which the database keeps in sync and the ORM does not
+# map, such that ranking the matches does not parse them again.
+SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(description, ''))"
+search_vector = literal_column("project.search_vector")
+# the search objects of the project table that are not in the metadata, which
+# autogenerate must neither drop nor create (see `include_object` of alembic)
+SEARCH_OBJECTS = frozenset({"search_vector", "ix_project_search", "ix_project_name_trgm"})
+
+
+@event.listens_for(Project.__table__, "after_create")
+def _create_search_document(target, connection, **kw):
+    # the same as the migration d4b8e1f7a3c9, for the tables created by `create_all`
+    if connection.dialect.name != "postgresql":
+        return
+    statements = [
+        "ALTER TABLE %(fullname)s ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_DOCUMENT}) STORED",
+        "CREATE INDEX ix_project_search ON %(fullname)s USING gin (search_vector)",
+    ]
+    # the fuzzy search needs pg_trgm, which is not shipped with every server
+    if connection.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar():
+        statements += [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX ix_project_name_trgm ON %(fullname)s USING gin (name gin_trgm_ops)",
+        ]
+    for statement in statements:
+        connection.execute(DDL(statement).against(target))
+
+
+# SQLite (e.g. for local runs) searches a FTS5 table of the trigrams of the
+# projects, which triggers keep in sync with the project table
+for statement in (
+    "CREATE VIRTUAL TABLE project_search USING fts5("
+    "name, description, content='project', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER project_search_insert AFTER INSERT ON project BEGIN "
+    "INSERT INTO project_search (rowid, name, description) VALUES (new.id, new.name, new.description); "
+    "END",
+    "CREATE TRIGGER project_search_delete AFTER DELETE ON project BEGIN "
+    "INSERT INTO project_search (project_search, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "END",
+    "CREATE TRIGGER project_search_update AFTER UPDATE ON project BEGIN "
+    "INSERT INTO project_search (project_search, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO project_search (rowid, name, description) VALUES (new.id, new.name, new.description); "
+    "END",
+):
+    event.listen(Project.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    Project.__table__, "after_drop", DDL("DROP TABLE IF EXISTS project_search").execute_if(dialect="sqlite")
+)
+
 
 class ProjectBase(DataBase):
     id: Optional[PrimaryKey]
@@ -27,3 +93,14 @@ class ProjectCreate(ProjectBase):
 
 class ProjectRead(ProjectBase):
     pass
+
+
+class ProjectPagination(Pagination):
+    items: List[ProjectRead] = []
+    next: Optional[str]
+
+
+class ProjectBulkRead(DataBase):
+    status: ProjectBulkStatus
+    project: Optional[ProjectRead]
+    msg: Optional[str]
@@ -1,25 +1,332 @@
 # -*- coding: utf-8 -*-
-from typing import Optional
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import func, literal_column, or_, select, table, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from .models import Project, ProjectCreate
+from ..cache import SingleFlight, create_cache
+from ..config import PROJECT_BULK_BATCH_SIZE
+from ..context import get_schema, reads_from_replica
+from .models import Project, ProjectCreate, ProjectRow, search_vector
 
+# read-through cache of the project rows, keyed by schema and by id and name
+project_cache = create_cache()
+# concurrent lookups of the same project share one query
+project_flight = SingleFlight()
 
-def get_by_name(*, db_session: Session, name: str) -> Optional[Project]:
-    """Returns a project based on the given project name."""
-    return db_session.query(Project).filter(Project.name == name).one_or_none()
 
+def _cache_key(field: str, value) -> str:
+    return f"{get_schema()}:project:{field}:{value}"
 
-def get(*, db_session: Session, project_id: int) -> Optional[Project]:
-    """Gets a notifcation by id."""
-    return db_session.query(Project).filter(Project.id == project_id).one_or_none()
+
+def _detached(data: dict) -> Project:
+    """Builds a project from a database row that can be merged into a session without a query."""
+    project = Project(**data)
+    make_transient_to_detached(project)
+    return project
+
+
+def _row(data: Optional[dict]) -> Optional[ProjectRow]:
+    return ProjectRow(**data) if data is not None else None
+
+
+def _insert(values):
+    """
+    Builds an INSERT of the given projects that returns the inserted rows.
+
+    Projects whose name is taken are skipped by the database (and not
+    returned), which makes the duplicate check race free.
+    """
+    table = Project.__table__
+    return (
+        insert(table)
+        .values(values)
+        .on_conflict_do_nothing(index_elements=[table.c.name])
+        .returning(*table.columns)
+    )
+
+
+def _flight_key(key: str) -> tuple:
+    # the lookups reading from a replica do not share the ones reading from the primary
+    return key, reads_from_replica()
+
+
+def _select(criterion):
+    return select(*Project.__table__.columns).where(criterion)
+
+
+def _to_cache(data: Optional[dict]) -> Optional[dict]:
+    if data is not None:
+        project_cache.set(_cache_key("id", data["id"]), data)
+        project_cache.set(_cache_key("name", data["name"]), data)
+    return data
+
+
+def _lookup(*, db_session: Session, key: str, criterion) -> Optional[ProjectRow]:
+    """
+    Looks a project up in the cache, else in the database.
+
+    Concurrent lookups of the same key share one query, each one gets its
+    own row of the project.
+    """
+    data = project_cache.get(key)
+    if data is not None:
+        return _row(data)
+
+    def query() -> Optional[dict]:
+        row = db_session.execute(_select(criterion)).one_or_none()
+        return _to_cache(row._asdict() if row is not None else None)
+
+    return _row(project_flight.do(_flight_key(key), query))
+
+
+async def _async_to_cache(data: Optional[dict]) -> Optional[dict]:
+    if data is not None:
+        await project_cache.async_set(_cache_key("id", data["id"]), data)
+        await project_cache.async_set(_cache_key("name", data["name"]), data)
+    return data
+
+
+async def _async_lookup(*, db_session: AsyncSession, key: str, criterion) -> Optional[ProjectRow]:
+    """Looks a project up in the cache, else in the database, like `_lookup`."""
+    data = await project_cache.async_get(key)
+    if data is not None:
+        return _row(data)
+
+    async def query() -> Optional[dict]:
+        result = await db_session.execute(_select(criterion))
+        row = result.one_or_none()
+        return await _async_to_cache(row._asdict() if row is not None else None)
+
+    return _row(await project_flight.async_do(_flight_key(key), query))
+
+
+def _invalidated_keys(project_id: int, name: str) -> tuple:
+    return _cache_key("id", project_id), _cache_key("name", name), _cache_key("version", project_id)
+
+
+def invalidate(*, project_id: int, name: str) -> None:
+    """Removes a project from the cache."""
+    project_cache.delete(*_invalidated_keys(project_id, name))
+
+
+async def async_invalidate(*, project_id: int, name: str) -> None:
+    """Removes a project from the cache."""
+    await project_cache.async_delete(*_invalidated_keys(project_id, name))
+
+
+def get_version(*, db_session: Session, project_id: int) -> Optional[datetime]:
+    """
+    Returns when a project was last updated, e.g. to answer a conditional request.
+
+    The version is taken from the cached project or from the version index
+    of the cache, else only that column is read from the database.
+    """
+    data = project_cache.get(_cache_key("id", project_id))
+    if data is not None:
+        return data["updated_at"]
+
+    key = _cache_key("version", project_id)
+    version = project_cache.get(key)
+    if version is None:
+        version = db_session.execute(
+            select(Project.updated_at).where(Project.id == project_id)
+        ).scalar_one_or_none()
+        if version is not None:
+            project_cache.set(key, version)
+    return version
+
+
+def get_by_name(*, db_session: Session, name: str) -> Optional[ProjectRow]:
+    """Returns the read-only row of a project based on the given project name."""
+    return _lookup(db_session=db_session, key=_cache_key("name", name), criterion=Project.name == name)
 
 
-def create(*, db_session: Session, project_in: ProjectCreate) -> Project:
-    """Creates a project."""
-    project = Project(**project_in.dict())
+def get(*, db_session: Session, project_id: int) -> Optional[ProjectRow]:
+    """Gets the read-only row of a project by id."""
+    return _lookup(
+        db_session=db_session, key=_cache_key("id", project_id), criterion=Project.id == project_id
+    )
 
-    db_session.add(project)
+
+def create_all(
+    *, db_session: Session, projects_in: List[ProjectCreate], batch_size: int = PROJECT_BULK_BATCH_SIZE
+) -> List[Optional[Row]]:
+    """
+    Creates the given projects in one transaction, with one INSERT per
+    `batch_size` projects such that no statement outgrows the bind
+    parameter limit of the driver.
+
+    Returns the created project rows in the order of `projects_in`, with None for
+    the projects whose name is already taken (by an existing project or an
+    earlier item). Ids given in `projects_in` are ignored.
+    """
+    values = {}
+    for project_in in projects_in:
+        values.setdefault(project_in.name, project_in.dict(exclude={"id"}))
+
+    created = {}
+    unique_values = list(values.values())
+    for start in range(0, len(unique_values), batch_size):
+        rows = db_session.execute(_insert(unique_values[start:start + batch_size]))
+        created.update((row.name, row) for row in rows)
     db_session.commit()
-    return project
+
+    for row in created.values():
+        invalidate(project_id=row.id, name=row.name)
+
+    results = []
+    for project_in in projects_in:
+        # a name is only mapped to the item that created it
+        results.append(created.pop(project_in.name, None))
+    return results
+
+
+def create(*, db_session: Session, project_in: ProjectCreate) -> Optional[Project]:
+    """Creates a project, returns None if a project with the same name already exists."""
+    row = db_session.execute(_insert(project_in.dict(exclude_none=True))).one_or_none()
+    db_session.commit()
+    if row is None:
+        return None
+
+    invalidate(project_id=row.id, name=row.name)
+    return db_session.merge(_detached(row._asdict()), load=False)
+
+
+# whether the databases have pg_trgm, by URL, checked on their first search
+_trigram_support: Dict[str, bool] = {}
+# the FTS5 table searched on SQLite, see the models
+_search_table = table("project_search")
+
+
+def _has_trigram(db_session: Session) -> bool:
+    url = str(db_session.get_bind().url)
+    supported = _trigram_support.get(url)
+    if supported is None:
+        supported = _trigram_support[url] = db_session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).scalar() is not None
+    return supported
+
+
+def _search_postgresql(db_session: Session, q: str, words: List[str]):
+    columns = Project.__table__.c
+    clauses = []
+    rank = literal_column("0")
+    if words:
+        # every word matches a word of the name or description starting with it
+        query = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{w}:*" for w in words))
+        clauses.append(search_vector.op("@@")(query))
+        rank = rank + func.ts_rank_cd(search_vector, query)
+    # the trigram index can not narrow queries shorter than a trigram, they would read every project
+    if len(q) >= 3 and _has_trigram(db_session):
+        # parts of names and names with typos, ranked by their similarity
+        pattern = "%{}%".format(q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+        clauses += [columns.name.ilike(pattern, escape="\\"), columns.name.op("%")(q)]
+        rank = rank + func.similarity(columns.name, q)
+    if not clauses:
+        return None
+    return select(*columns).where(or_(*clauses)).order_by(rank.desc(), columns.id)
+
+
+def _search_sqlite(db_session: Session, q: str, words: List[str]):
+    # the trigram tokenizer matches any part of a word, but no word shorter than a trigram
+    terms = ['"{}"'.format(word.replace('"', '""')) for word in words if len(word) >= 3]
+    if not terms:
+        return None
+    columns = Project.__table__.c
+    return (
+        select(*columns)
+        .join_from(Project.__table__, _search_table, literal_column("project_search.rowid") == columns.id)
+        .where(literal_column("project_search").op("MATCH")(" ".join(terms)))
+        .order_by(func.bm25(literal_column("project_search")), columns.id)
+    )
+
+
+def search(*, db_session: Session, q: str, page: int = 1, items_per_page: int = 10) -> List[ProjectRow]:
+    """
+    Returns the projects whose name or description match the words of `q`,
+    the best matches first, as read-only rows.
+
+    On PostgreSQL the words match the beginning of the words of the projects
+    through the full-text index, and when the database has pg_trgm, any part
+    of their name or names with typos (for a `q` of at least three
+    characters) through the trigram index. On SQLite
+    the words match any part of the projects (of at least three letters),
+    through the FTS5 table.
+    """
+    words = re.findall(r"\w+", q)
+    if db_session.get_bind().dialect.name == "sqlite":
+        statement = _search_sqlite(db_session, q, words)
+    else:
+        statement = _search_postgresql(db_session, q, words)
+    if statement is None:
+        return []
+    rows = db_session.execute(statement.offset((page - 1) * items_per_page).limit(items_per_page))
+    return [ProjectRow._make(row) for row in rows]
+
+
+# the order of the exported columns (the timestamp columns share a creation
+# order, so the order of the table columns differs between processes)
+EXPORT_COLUMNS = ("id", "name", "description", "created_at", "updated_at")
+
+
+def export(*, db_session: Session, batch_size: int) -> Iterator[List[Row]]:
+    """
+    Yields every project row in batches, read through a server-side cursor.
+
+    The rows are plain Core rows, they are neither turned into `Project`
+    instances nor kept in the identity map.
+    """
+    table = Project.__table__
+    connection = db_session.connection(execution_options={"stream_results": True})
+    columns = [table.c[name] for name in EXPORT_COLUMNS]
+    result = connection.execute(select(*columns).order_by(table.c.id))
+    yield from result.partitions(batch_size)
+
+
+async def async_get_by_name(*, db_session: AsyncSession, name: str) -> Optional[ProjectRow]:
+    """Returns the read-only row of a project based on the given project name."""
+    return await _async_lookup(
+        db_session=db_session, key=_cache_key("name", name), criterion=Project.name == name
+    )
+
+
+async def async_get(*, db_session: AsyncSession, project_id: int) -> Optional[ProjectRow]:
+    """Gets the read-only row of a project by id."""
+    return await _async_lookup(
+        db_session=db_session, key=_cache_key("id", project_id), criterion=Project.id == project_id
+    )
+
+
+async def async_get_version(*, db_session: AsyncSession, project_id: int) -> Optional[datetime]:
+    """Returns when a project was last updated, from the cache like `get_version` or reading only that column."""
+    data = await project_cache.async_get(_cache_key("id", project_id))
+    if data is not None:
+        return data["updated_at"]
+
+    key = _cache_key("version", project_id)
+    version = await project_cache.async_get(key)
+    if version is None:
+        result = await db_session.execute(select(Project.updated_at).where(Project.id == project_id))
+        version = result.scalar_one_or_none()
+        if version is not None:
+            await project_cache.async_set(key, version)
+    return version
+
+
+async def async_create(*, db_session: AsyncSession, project_in: ProjectCreate) -> Optional[Project]:
+    """Creates a project, returns None if a project with the same name already exists."""
+    result = await db_session.execute(_insert(project_in.dict(exclude_none=True)))
+    row = result.one_or_none()
+    await db_session.commit()
+    if row is None:
+        return None
+
+    await async_invalidate(project_id=row.id, name=row.name)
+    return await db_session.merge(_detached(row._asdict()), load=False)
@@ -1,20 +1,275 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException, status
+import csv
+import io
+import json
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Iterable, Iterator, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import Json
 from pydantic.error_wrappers import ErrorWrapper, ValidationError
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
 
-from ..database.core import DbSession
+from ..config import PROJECT_BULK_BATCH_SIZE, PROJECT_CACHE_CONTROL, PROJECT_EXPORT_BATCH_SIZE
+from ..database.core import AsyncDbSession, DbSession
+from ..database.service import search_filter_sort_paginate
+from ..enums import CountMode
 from ..exceptions import ExistsError
-from ..models import PrimaryKey
+from ..models import DataBase, PrimaryKey
+from ..responses import is_not_modified, not_modified, ORJSONResponse, validators
 
+from .enums import ProjectBulkStatus, ProjectExportFormat
 from .models import (
+    Project,
+    ProjectBulkRead,
     ProjectCreate,
+    ProjectPagination,
     ProjectRead,
 )
-from .service import create, get, get_by_name
+from .service import (
+    async_create,
+    async_get,
+    async_get_version,
+    create,
+    create_all,
+    EXPORT_COLUMNS,
+    export,
+    get,
+    get_version,
+    search,
+)
+
 
+# routes on the project collection, served by the same handlers in both database modes
+collection_router = APIRouter()
 
 router = APIRouter()
 
+# the same routes served by async handlers, used when DATABASE_ASYNC_MODE is enabled
+async_router = APIRouter()
+
+
+@collection_router.get(
+    "",
+    response_model=ProjectPagination,
+    summary="List projects.",
+)
+def list_projects(
+    db_session: DbSession,
+    filter_spec: Optional[Json] = Query(None, alias="filter"),
+    sort_by: List[str] = Query(["id"], alias="sortBy"),
+    descending: List[bool] = Query([False]),
+    page: int = Query(1, gt=0),
+    items_per_page: int = Query(10, alias="itemsPerPage", gt=0, le=1000),
+    cursor: Optional[str] = None,
+    total: CountMode = CountMode.estimate,
+):
+    """
+    List projects, filtered with a sqlalchemy-filters `filter` spec (JSON).
+
+    Listings sorted by `id` or `created_at` return a `next` cursor which
+    fetches the following page in constant time, whatever its depth. The
+    `total` is estimated by the query planner unless an `exact` count is
+    asked for, or left out with `none`.
+    """
+    pagination = search_filter_sort_paginate(
+        db_session=db_session,
+        model=Project,
+        filter_spec=filter_spec,
+        sort_by=sort_by,
+        descending=descending,
+        page=page,
+        items_per_page=items_per_page,
+        cursor=cursor,
+        total=total,
+    )
+    return ORJSONResponse(ProjectPagination.dump_orm(pagination))
+
+
+@collection_router.get(
+    "/search",
+    response_model=ProjectPagination,
+    summary="Search projects.",
+)
+def search_projects(
+    db_session: DbSession,
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, gt=0),
+    items_per_page: int = Query(10, alias="itemsPerPage", gt=0, le=100),
+):
+    """
+    Search projects by the words of their name and description, the best
+    matches first.
+
+    The words of `q` match the words starting with them, and where the
+    database supports it any part of the names and names with typos. The
+    total is not counted.
+    """
+    items = search(db_session=db_session, q=q, page=page, items_per_page=items_per_page)
+    return ORJSONResponse(
+        ProjectPagination.dump_orm({"items": items, "itemsPerPage": items_per_page, "page": page})
+    )
+
+
+# the export formats dates the same way as the API responses
+_format_datetime = DataBase.__config__.json_encoders[datetime]
+
+
+def _export_value(value):
+    return _format_datetime(value) if isinstance(value, datetime) else value
+
+
+def _export_chunks(batches: Iterable[list], export_format: ProjectExportFormat) -> Iterator[bytes]:
+    """Serializes batches of project rows, one chunk per batch."""
+    columns = EXPORT_COLUMNS
+
+    if export_format == ProjectExportFormat.csv:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for batch in batches:
+            writer.writerows([_export_value(value) for value in row] for row in batch)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        return
+
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, map(_export_value, row)))) + "\n" for row in batch
+        ).encode("utf-8")
+
+
+@collection_router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}, "text/csv": {}}}},
+    summary="Export all projects.",
+)
+def export_projects(
+    request: Request,
+    export_format: ProjectExportFormat = Query(ProjectExportFormat.ndjson, alias="format"),
+):
+    """
+    Export every project as NDJSON or CSV.
+
+    The rows are streamed from a server-side cursor straight into the
+    response, so memory use does not depend on the size of the table.
+    """
+    # the request session is gone once the response starts streaming, the export uses its own
+    session_factory = request.state.db.session_factory
+
+    def content():
+        db_session = session_factory()
+        try:
+            batches = export(db_session=db_session, batch_size=PROJECT_EXPORT_BATCH_SIZE)
+            yield from _export_chunks(batches, export_format)
+        finally:
+            db_session.close()
+
+    headers = {"Content-Disposition": f'attachment; filename="projects.{export_format}"'}
+
+    media_type = "text/csv" if export_format == ProjectExportFormat.csv else "application/x-ndjson"
+    return StreamingResponse(content(), media_type=media_type, headers=headers)
+
+
+def _bulk_results(projects_in: List[ProjectCreate], projects) -> List[ProjectBulkRead]:
+    return [
+        ProjectBulkRead(status=ProjectBulkStatus.created, project=ProjectRead.from_orm(project))
+        if project
+        else ProjectBulkRead(
+            status=ProjectBulkStatus.exists,
+            msg=f"A project with the name {project_in.name!r} already exists.",
+        )
+        for project_in, project in zip(projects_in, projects)
+    ]
+
+
+@collection_router.post(
+    "/bulk",
+    response_model=List[ProjectBulkRead],
+    summary="Create many projects at once.",
+)
+def bulk_create_projects(db_session: DbSession, projects_in: List[ProjectCreate]):
+    """
+    Create many projects in one transaction.
+
+    Returns one result per given project, in the same order. Projects whose
+    name is already taken are skipped.
+    """
+    projects = create_all(db_session=db_session, projects_in=projects_in)
+    return _bulk_results(projects_in, projects)
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def _write_bulk_batch(db_session, batch, output) -> None:
+    projects_in = [project_in for project_in in batch if isinstance(project_in, ProjectCreate)]
+    projects = create_all(db_session=db_session, projects_in=projects_in)
+    results = iter(_bulk_results(projects_in, projects))
+
+    for item in batch:
+        result = item if isinstance(item, ProjectBulkRead) else next(results)
+        output.write(result.json().encode("utf-8") + b"\n")
+
+
+@collection_router.post(
+    "/bulk/ndjson",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+    summary="Create many projects from a NDJSON upload.",
+)
+async def bulk_create_projects_ndjson(db_session: DbSession, request: Request):
+    """
+    Create projects from a newline delimited JSON upload, one project per line.
+
+    The upload is read and inserted in batches and the per-line results are
+    spooled to disk once they outgrow memory, so imports of any size run in
+    bounded memory. Every batch is committed on its own.
+    """
+    output = SpooledTemporaryFile(max_size=1024 * 1024)
+
+    batch = []
+    async for line in _iter_lines(request.stream()):
+        try:
+            batch.append(ProjectCreate.parse_raw(line))
+        except ValidationError as e:
+            batch.append(ProjectBulkRead(status=ProjectBulkStatus.invalid, msg=e.errors()[0]["msg"]))
+
+        if len(batch) >= PROJECT_BULK_BATCH_SIZE:
+            await run_in_threadpool(_write_bulk_batch, db_session, batch, output)
+            batch = []
+    if batch:
+        await run_in_threadpool(_write_bulk_batch, db_session, batch, output)
+
+    output.seek(0)
+    return StreamingResponse(
+        output, media_type="application/x-ndjson", background=BackgroundTask(output.close)
+    )
+
+
+def _is_conditional(request: Request) -> bool:
+    # the version of the project is only looked up for the clients having a copy of it
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def _validators(project_id: int, updated_at: Optional[datetime]) -> dict:
+    return validators(project_id, updated_at, PROJECT_CACHE_CONTROL)
+
 
 @router.post(
     "",
@@ -23,15 +278,13 @@ router = APIRouter()
 )
 def create_project(db_session: DbSession, project_in: ProjectCreate):
     """Create a new project."""
-    project = get_by_name(db_session=db_session, name=project_in.name)
-    if project:
+    project = create(db_session=db_session, project_in=project_in)
+    if not project:
         raise ValidationError(
             [ErrorWrapper(ExistsError(msg="A project with this name already exists."), loc="name")],
             model=ProjectCreate,
         )
-
-    project = create(db_session=db_session, project_in=project_in)
-    return project
+    return ORJSONResponse(ProjectRead.dump_orm(project))
 
 
 @router.get(
@@ -39,12 +292,62 @@ def create_project(db_session: DbSession, project_in: ProjectCreate):
     response_model=ProjectRead,
     summary="Get a project.",
 )
-def get_project(db_session: DbSession, project_id: PrimaryKey):
-    """Get a project by its id."""
+def get_project(request: Request, db_session: DbSession, project_id: PrimaryKey):
+    """
+    Get a project by its id.
+
+    The response carries an ETag and a Last-Modified header, a request
+    sending them back in If-None-Match or If-Modified-Since is answered with
+    a 304 as long as the project was not updated, without reading the
+    project itself.
+    """
+    if _is_conditional(request):
+        headers = _validators(project_id, get_version(db_session=db_session, project_id=project_id))
+        if is_not_modified(request.headers, headers):
+            return not_modified(headers)
+
     project = get(db_session=db_session, project_id=project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=[{"msg": "A project with this id does not exist."}],
         )
-    return project
+    return ORJSONResponse(ProjectRead.dump_orm(project), headers=_validators(project.id, project.updated_at))
+
+
+@async_router.post(
+    "",
+    response_model=ProjectRead,
+    summary="Create a new project.",
+)
+async def async_create_project(db_session: AsyncDbSession, project_in: ProjectCreate):
+    """Create a new project."""
+    project = await async_create(db_session=db_session, project_in=project_in)
+    if not project:
+        raise ValidationError(
+            [ErrorWrapper(ExistsError(msg="A project with this name already exists."), loc="name")],
+            model=ProjectCreate,
+        )
+    return ORJSONResponse(ProjectRead.dump_orm(project))
+
+
+@async_router.get(
+    "/{project_id}",
+    response_model=ProjectRead,
+    summary="Get a project.",
+)
+async def async_get_project(request: Request, db_session: AsyncDbSession, project_id: PrimaryKey):
+    """Get a project by its id, see `get_project` for the conditional requests."""
+    if _is_conditional(request):
+        version = await async_get_version(db_session=db_session, project_id=project_id)
+        headers = _validators(project_id, version)
+        if is_not_modified(request.headers, headers):
+            return not_modified(headers)
+
+    project = await async_get(db_session=db_session, project_id=project_id)
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=[{"msg": "A project with this id does not exist."}],
+        )
+    return ORJSONResponse(ProjectRead.dump_orm(project), headers=_validators(project.id, project.updated_at))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Mapping, Optional
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+from .models import DataBase
+
+_json_encoders = DataBase.__config__.json_encoders
+
+
+def _default(value: Any):
+    # values are encoded the same way as the pydantic models of the API encode them
+    encoder = _json_encoders.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    if isinstance(value, BaseModel):
+        return value.dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    A JSON response rendered by orjson.
+
+    The output is byte for byte the one of `JSONResponse`, including the
+    datetime format of the API models.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def validators(key: Any, updated_at: Optional[datetime], cache_control: str) -> dict:
+    """
+    Returns the ETag, Last-Modified and Cache-Control headers of a resource.
+
+    The ETag is derived from the key of the resource (e.g. its id) and the
+    time it was last updated, such that it changes with every update. It is
+    weak since the compressed and identity bodies share it.
+    """
+    headers = {"Cache-Control": cache_control}
+    if updated_at is not None:
+        # the timestamps are naive UTC
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+        headers["ETag"] = f'W/"{key}-{int(updated_at.timestamp() * 1_000_000):x}"'
+        headers["Last-Modified"] = format_datetime(updated_at, usegmt=True)
+    return headers
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def is_not_modified(request_headers: Mapping[str, str], headers: Mapping[str, str]) -> bool:
+    """
+    Whether the copy of the client is still fresh according to its
+    `If-None-Match` or, without it, its `If-Modified-Since` header
+    (RFC 9110, section 13.2.2).
+    """
+    etag = headers.get("ETag")
+    if etag is None:
+        return False
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # weak comparison
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None:
+        since = _parse_http_date(if_modified_since)
+        # the dates have a resolution of one second
+        return since is not None and _parse_http_date(headers["Last-Modified"]) <= since
+    return False
+
+
+def not_modified(headers: Mapping[str, str]) -> Response:
+    """The 304 response, without a body but with the validators of the resource."""
+    return Response(status_code=304, headers=dict(headers))
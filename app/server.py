@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+The production launcher of the API.
+
+The supervisor starts one uvicorn server per worker process and replaces
+the workers that exit, either because they served their share of requests
+(`max_requests` plus a random jitter, such that they are not all recycled
+at once) or because they crashed. The workers either accept on one socket
+bound by the supervisor before they are started, or each bind their own
+socket with SO_REUSEPORT and let the kernel spread the connections.
+
+On SIGTERM or SIGINT the workers stop accepting connections and finish the
+requests in flight for up to `graceful_timeout` seconds before they exit.
+A worker only accepts connections once the lifespan of the app is done,
+which warms the worker up (see `app.main.warm_up`).
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import List, Optional
+
+import uvicorn
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+# the exit code of uvicorn when the app fails to start, restarting the worker would not help
+STARTUP_FAILURE = 3
+# workers exiting sooner than this after they were started are restarted with a delay
+MIN_UPTIME = 1.0
+
+
+def cpu_count() -> int:
+    """Returns the number of CPUs the process may use, including the quota of its cgroup."""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(int(int(quota) / int(period)), 1))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def bind_socket(host: str, port: int, reuse_port: bool = False, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(
+    server_config: uvicorn.Config,
+    sockets: List[socket.socket],
+    reuse_port: bool,
+    max_requests: int,
+    max_requests_jitter: int,
+):
+    """The target of the worker processes."""
+    if max_requests:
+        server_config.limit_max_requests = max_requests + random.randint(0, max_requests_jitter)
+    if reuse_port:
+        sockets = [bind_socket(server_config.host, server_config.port, True, server_config.backlog)]
+    server = uvicorn.Server(server_config)
+    server.run(sockets=sockets)
+    if not server.started:
+        sys.exit(STARTUP_FAILURE)
+
+
+class Supervisor:
+    def __init__(
+        self,
+        server_config: uvicorn.Config,
+        workers: int,
+        reuse_port: bool = False,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30,
+    ):
+        self.config = server_config
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.sockets: List[socket.socket] = []
+        self.processes: List[Optional[multiprocessing.Process]] = []
+        self.started_at: List[float] = []
+        self.should_exit = False
+        # the workers are spawned such that they do not inherit the state of the supervisor
+        self._context = multiprocessing.get_context("spawn")
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=serve,
+            args=(self.config, self.sockets, self.reuse_port, self.max_requests, self.max_requests_jitter),
+            name=f"worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+
+    def _handle_exit(self, signum, frame):
+        self.should_exit = True
+
+    def run(self) -> int:
+        if not self.reuse_port:
+            self.sockets = [bind_socket(self.config.host, self.config.port, backlog=self.config.backlog)]
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._handle_exit)
+
+        self.processes = [None] * self.workers
+        self.started_at = [0.0] * self.workers
+        for index in range(self.workers):
+            self._spawn(index)
+        log.warning(f"Started {self.workers} workers on {self.config.host}:{self.config.port}.")
+
+        exit_code = 0
+        while not self.should_exit:
+            time.sleep(0.5)
+            for index, process in enumerate(self.processes):
+                if self.should_exit or process.is_alive():
+                    continue
+                if process.exitcode == STARTUP_FAILURE:
+                    log.error(f"Worker {process.pid} failed to start, stopping.")
+                    self.should_exit = True
+                    exit_code = STARTUP_FAILURE
+                    break
+                if process.exitcode:
+                    log.error(f"Worker {process.pid} died with exit code {process.exitcode}, restarting it.")
+                else:
+                    log.info(f"Worker {process.pid} was recycled.")
+                if time.monotonic() - self.started_at[index] < MIN_UPTIME:
+                    # does not restart a crashing worker in a tight loop
+                    time.sleep(MIN_UPTIME)
+                self._spawn(index)
+
+        self.shutdown()
+        return exit_code
+
+    def shutdown(self):
+        """Lets the workers drain their connections, the ones not done in time are killed."""
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                log.error(f"Worker {process.pid} did not stop in time, killing it.")
+                process.kill()
+                process.join()
+        for sock in self.sockets:
+            sock.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serves the API with several worker processes.")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument(
+        "--workers", type=int, default=config.WEB_CONCURRENCY, help="defaults to the number of CPUs"
+    )
+    parser.add_argument("--loop", default=config.SERVER_LOOP, help="auto uses uvloop if installed")
+    parser.add_argument("--http", default=config.SERVER_HTTP, help="auto uses httptools if installed")
+    parser.add_argument("--reuse-port", action="store_true", default=config.SERVER_REUSE_PORT)
+    parser.add_argument("--max-requests", type=int, default=config.SERVER_MAX_REQUESTS, help="0 disables it")
+    parser.add_argument("--max-requests-jitter", type=int, default=config.SERVER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=float, default=config.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or cpu_count()
+    # the workers split the connection budget of the database by this number
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    server_config = uvicorn.Config(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        loop=args.loop,
+        http=args.http,
+        log_level=args.log_level,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    logging.basicConfig(level=args.log_level.upper())
+    supervisor = Supervisor(
+        server_config,
+        workers,
+        reuse_port=args.reuse_port,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout,
+    )
+    return supervisor.run()
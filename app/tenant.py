@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+
+from starlette.datastructures import Headers
+
+from . import config
+from .enums import TenantSource
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def decode_token(token: str, secret: bytes) -> Optional[dict]:
+    """Returns the claims of a JWT signed with HS256, or None if it is invalid or expired."""
+    try:
+        header_segment, payload_segment, signature_segment = token.split(".")
+        header = json.loads(_b64decode(header_segment))
+        if not isinstance(header, dict) or header.get("alg") != "HS256":
+            return None
+        signature = hmac.new(secret, f"{header_segment}.{payload_segment}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(signature, _b64decode(signature_segment)):
+            return None
+        claims = json.loads(_b64decode(payload_segment))
+    except (ValueError, binascii.Error):
+        return None
+
+    if not isinstance(claims, dict):
+        return None
+    expires_at = claims.get("exp")
+    if isinstance(expires_at, (int, float)) and expires_at <= time.time():
+        return None
+    return claims
+
+
+class TenantResolver:
+    """
+    Finds the tenant, i.e. the database schema, of a request.
+
+    It is taken from the `header` header, from the subdomain of `domain` or
+    from the `claim` of the bearer token, depending on `source`. Requests
+    naming no tenant get the `default` one, `resolve` returns None for the
+    ones naming an invalid tenant (and, without `default`, for the ones
+    naming none). Whether the schema exists is up to the schema registry.
+    """
+
+    def __init__(
+        self,
+        source: str = TenantSource.none,
+        header: str = "X-Tenant",
+        default: str = "public",
+        domain: str = "",
+        claim: str = "tenant",
+        secret: str = "",
+    ):
+        self.source = TenantSource(source)
+        self.header = header
+        self.default = default or None
+        self.domain = domain.lower().strip(".")
+        self.claim = claim
+        self.secret = secret.encode()
+        if self.source == TenantSource.subdomain and not self.domain:
+            raise ValueError("TENANT_DOMAIN is required to take the tenant from the subdomain.")
+        if self.source == TenantSource.token and not self.secret:
+            raise ValueError("TENANT_TOKEN_SECRET is required to take the tenant from the token.")
+
+    def resolve(self, headers: Headers) -> Optional[str]:
+        if self.source == TenantSource.header:
+            return headers.get(self.header) or self.default
+
+        if self.source == TenantSource.subdomain:
+            host = headers.get("host", "").rsplit(":", 1)[0].lower()
+            if host == self.domain:
+                return self.default
+            subdomain, dot, domain = host.partition(".")
+            # tenants are only served from direct subdomains of the domain
+            return subdomain if dot and domain == self.domain else None
+
+        if self.source == TenantSource.token:
+            authorization = headers.get("authorization")
+            if not authorization:
+                return self.default
+            scheme, _, token = authorization.partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            claims = decode_token(token.strip(), self.secret)
+            tenant = claims.get(self.claim) if claims is not None else None
+            return tenant if isinstance(tenant, str) and tenant else None
+
+        return self.default
+
+
+tenant_resolver = TenantResolver(
+    source=config.TENANT_SOURCE,
+    header=config.TENANT_HEADER,
+    default=config.TENANT_DEFAULT,
+    domain=config.TENANT_DOMAIN,
+    claim=config.TENANT_CLAIM,
+    secret=str(config.TENANT_TOKEN_SECRET),
+)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the sync (threadpool) and async (asyncpg) database modes under high
+concurrency. Every mode is served by its own uvicorn process which is loaded
+with concurrent `GET /api/v1/projects/{id}` requests.
+
+Usage:
+
+    ./run python benchmarks/async_mode.py --concurrency 50 200 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.database.core import Base, SessionLocal, engine
+from app.project.models import Project
+
+
+def seed() -> int:
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db_session:
+        project = Project(name="benchmark-async-mode", description="Benchmark")
+        db_session.add(project)
+        db_session.commit()
+        return project.id
+
+
+def start_server(port: int, async_mode: bool, pool_size: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_ASYNC_MODE=str(async_mode).lower(),
+        DATABASE_ENGINE_POOL_SIZE=str(pool_size),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "error"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/healthcheck")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def load(url: str, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(url)
+            except httpx.TransportError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pool-size", type=int, default=80)
+    args = parser.parse_args()
+
+    project_id = seed()
+    url = f"http://127.0.0.1:{args.port}/api/v1/projects/{project_id}"
+
+    try:
+        for async_mode in (False, True):
+            server = start_server(args.port, async_mode, args.pool_size)
+            try:
+                for concurrency in args.concurrency:
+                    latencies, errors = asyncio.run(load(url, concurrency, args.duration))
+                    quantiles = statistics.quantiles(latencies, n=100)
+                    print(
+                        f"{'async' if async_mode else 'sync':5} concurrency={concurrency:<5} "
+                        f"{len(latencies) / args.duration:8.1f} req/s "
+                        f"p50={quantiles[49] * 1000:7.1f}ms p99={quantiles[98] * 1000:7.1f}ms "
+                        f"errors={errors}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        with SessionLocal() as db_session:
+            db_session.query(Project).filter(Project.id == project_id).delete()
+            db_session.commit()
+
+
+if __name__ == "__main__":
+    main()
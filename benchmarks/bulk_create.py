@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Compares importing projects one `POST /api/v1/projects` at a time with the
+`POST /api/v1/projects/bulk` and `POST /api/v1/projects/bulk/ndjson` endpoints.
+
+Usage:
+
+    ./run python benchmarks/bulk_create.py --projects 2000
+"""
+import argparse
+import json
+import time
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from app.database.core import Base, SessionLocal, engine
+from app.main import app
+from app.project.models import Project
+
+
+def one_by_one(client: TestClient, projects):
+    for project in projects:
+        assert client.post("/api/v1/projects", json=project).status_code == 200
+
+
+def bulk(client: TestClient, projects):
+    assert client.post("/api/v1/projects/bulk", json=projects).status_code == 200
+
+
+def bulk_ndjson(client: TestClient, projects):
+    content = "\n".join(json.dumps(project) for project in projects).encode("utf-8")
+    response = client.post(
+        "/api/v1/projects/bulk/ndjson",
+        content=content,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--projects", type=int, default=2000)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    prefix = f"benchmark-bulk-{uuid4().hex[:8]}"
+    try:
+        with TestClient(app) as client:
+            for func in (one_by_one, bulk, bulk_ndjson):
+                projects = [
+                    {"name": f"{prefix}-{func.__name__}-{i}", "description": "Benchmark"}
+                    for i in range(args.projects)
+                ]
+                start = time.perf_counter()
+                func(client, projects)
+                elapsed = time.perf_counter() - start
+                print(f"{func.__name__:12} {elapsed:8.2f}s {args.projects / elapsed:10.1f} projects/s")
+    finally:
+        with SessionLocal() as db_session:
+            db_session.query(Project).filter(Project.name.startswith(prefix)).delete(
+                synchronize_session=False
+            )
+            db_session.commit()
+
+
+if __name__ == "__main__":
+    main()
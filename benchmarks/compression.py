@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the CPU time per request and the bytes on the wire of the previous
+compression setup (Starlette's GZipMiddleware, at level 9, on both the app
+and the mounted API) with the CompressionMiddleware for every encoding.
+
+The responses are a page of the project listing and a streamed NDJSON export,
+rendered from generated projects, so no database is needed. The ASGI apps are
+called directly, without any server or HTTP client.
+
+Usage:
+
+    ./run python benchmarks/compression.py --items 50 --export-rows 100000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import orjson
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import StreamingResponse
+
+from app.compression import CompressionMiddleware, available_encodings
+from app.responses import ORJSONResponse
+
+
+def projects(count: int, start: int = 1):
+    now = datetime.utcnow()
+    return [
+        {
+            "id": i,
+            "name": f"Project {i}",
+            "description": f"Benchmark {i * 7919 % 10007}",
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def listing_app(items: int):
+    content = {"items": projects(items), "itemsPerPage": items, "page": 1, "total": None}
+
+    async def app(scope, receive, send):
+        await ORJSONResponse(content)(scope, receive, send)
+
+    return app
+
+
+def export_app(rows: int, batch_size: int = 5000):
+    chunks = [
+        b"".join(orjson.dumps(project, default=str) + b"\n" for project in projects(batch_size, start))
+        for start in range(1, rows + 1, batch_size)
+    ]
+
+    async def app(scope, receive, send):
+        await StreamingResponse(iter(chunks), media_type="application/x-ndjson")(scope, receive, send)
+
+    return app
+
+
+async def request(app, accept_encoding: str) -> int:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", accept_encoding.encode("latin-1"))],
+    }
+    size = 0
+
+    async def receive():
+        # the client never disconnects, streaming responses cancel this once they are done
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size
+
+
+async def measure(app, accept_encoding: str, repeat: int):
+    await request(app, accept_encoding)
+    # process_time also counts the compression done in the threadpool
+    start = time.process_time()
+    for _ in range(repeat):
+        size = await request(app, accept_encoding)
+    return (time.process_time() - start) / repeat * 1000, size
+
+
+def setups(app):
+    yield "identity", app, "identity"
+    # the previous setup, GZipMiddleware on the app and on the mounted API
+    yield "GZipMiddleware x2 (gzip 9)", GZipMiddleware(GZipMiddleware(app, 1000), 1000), "gzip"
+    for encoding, (compressor, level) in available_encodings().items():
+        yield f"CompressionMiddleware ({encoding} {level})", CompressionMiddleware(app), encoding
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--export-rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    for title, app, repeat in (
+        (f"listing, {args.items} items", listing_app(args.items), args.repeat),
+        (f"export, {args.export_rows} rows", export_app(args.export_rows), max(1, args.repeat // 200)),
+    ):
+        print(title)
+        for name, wrapped, accept_encoding in setups(app):
+            ms, size = asyncio.run(measure(wrapped, accept_encoding, repeat))
+            print(f"  {name:32} {ms:9.2f} ms CPU {size / 1024:10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
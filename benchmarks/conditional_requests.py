@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Measures clients polling projects with `GET /api/v1/projects/{id}`, plainly
+and with the ETag of their copy in If-None-Match (answered with a 304), with
+and without the project cache. Reports the latency, the bytes of the
+responses and the SQL statements per request.
+
+Usage:
+
+    ./run python benchmarks/conditional_requests.py --projects 100 --requests 5000 --description-size 4096
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.cache import LRUCache, NullCache
+from app.database import core as database
+from app.main import app
+from app.project import service
+from app.project.models import Project
+
+
+def run(client: TestClient, project_ids, etags: dict, requests: int):
+    statements = 0
+
+    def before_cursor_execute(*args):
+        nonlocal statements
+        statements += 1
+
+    latencies = []
+    size = 0
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        for _ in range(requests):
+            project_id = random.choice(project_ids)
+            headers = {"If-None-Match": etags[project_id]} if etags else {}
+            start = time.perf_counter()
+            response = client.get(f"/api/v1/projects/{project_id}", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == (304 if etags else 200)
+            size += len(response.content)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
+    return latencies, size, statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--description-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    database.create_engines()
+    database.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as db_session:
+        projects = [
+            Project(name=f"benchmark-conditional-{i}", description="x" * args.description_size)
+            for i in range(args.projects)
+        ]
+        db_session.add_all(projects)
+        db_session.commit()
+        project_ids = [project.id for project in projects]
+
+    try:
+        with TestClient(app) as client:
+            etags = {
+                project_id: client.get(f"/api/v1/projects/{project_id}").headers["etag"]
+                for project_id in project_ids
+            }
+            # every project is cached by id, name and version
+            caches = (("no cache", NullCache()), ("lru cache", LRUCache(maxsize=3 * args.projects)))
+            for cache_name, cache in caches:
+                service.project_cache = cache
+                for name, client_etags in (("plain", {}), ("if-none-match", etags)):
+                    run(client, project_ids, client_etags, 100)  # warm up
+                    latencies, size, statements = run(client, project_ids, client_etags, args.requests)
+                    quantiles = statistics.quantiles(latencies, n=100)
+                    print(
+                        f"{cache_name:9} {name:13} p50={quantiles[49] * 1000:6.2f}ms "
+                        f"p99={quantiles[98] * 1000:6.2f}ms bytes/request={size / args.requests:7.1f} "
+                        f"statements/request={statements / args.requests:5.2f}"
+                    )
+    finally:
+        with database.SessionLocal() as db_session:
+            db_session.query(Project).filter(Project.id.in_(project_ids)).delete(synchronize_session=False)
+            db_session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the throughput and latency of the inference engine serving
+concurrent predictions of the toy model, for several maximum batch sizes
+(a batch size of 1 runs every prediction on its own).
+
+Usage:
+
+    ./run python benchmarks/inference_batching.py --batch-sizes 1 8 32 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from app.inference.engine import BatchingEngine
+
+
+async def run(engine: BatchingEngine, concurrency: int, duration: float):
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            inputs = [random.random() for _ in range(16)]
+            start = time.perf_counter()
+            await engine.predict(inputs)
+            latencies.append(time.perf_counter() - start)
+
+    await engine.start()
+    try:
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+    finally:
+        await engine.stop()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default="app.inference.toy:ToyModel")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-wait", type=float, default=0.005)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    for batch_size in args.batch_sizes:
+        engine = BatchingEngine(
+            args.model, workers=args.workers, max_batch_size=batch_size, max_wait=args.max_wait
+        )
+        latencies = asyncio.run(run(engine, args.concurrency, args.duration))
+        quantiles = statistics.quantiles(latencies, n=100)
+        stats = engine.stats()
+        print(
+            f"max_batch_size={batch_size:<4} {len(latencies) / args.duration:8.1f} predictions/s "
+            f"mean batch={stats['predictions'] / stats['batches']:5.1f} "
+            f"p50={quantiles[49] * 1000:7.2f}ms p99={quantiles[98] * 1000:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the throughput of the job queue with 1, 2 and 4 worker processes:
+queues `--jobs` project imports of `--projects` projects each, starts the
+workers (`python -m app.job.worker`) and reports the jobs per second until
+the queue is drained, and whether every project was imported.
+
+Usage:
+
+    ./run python benchmarks/job_queue.py --jobs 500 --projects 10 --processes 1 2 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy import func, select, text
+
+from app.database import core as database
+from app.job.enums import JobStatus
+from app.job.models import Job
+from app.project.models import Project
+
+PREFIX = "benchmark-job-"
+
+
+def cleanup():
+    with database.engine.begin() as connection:
+        connection.execute(text("DELETE FROM job WHERE kind = 'project.import' AND tenant = 'public'"))
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def enqueue(run: int, jobs: int, projects: int):
+    rows = [
+        {
+            "kind": "project.import",
+            "tenant": "public",
+            "payload": {"projects": [{"name": f"{PREFIX}{run}-{i}-{j}"} for j in range(projects)]},
+            "status": JobStatus.queued,
+            "attempts": 0,
+            "max_attempts": 1,
+        }
+        for i in range(jobs)
+    ]
+    with database.engine.begin() as connection:
+        connection.execute(Job.__table__.insert(), rows)
+
+
+def counts() -> dict:
+    with database.engine.connect() as connection:
+        rows = connection.execute(select(Job.status, func.count()).group_by(Job.status)).all()
+    return dict(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--projects", type=int, default=10, help="projects imported per job")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    database.Base.metadata.create_all(bind=database.engine, tables=[Project.__table__, Job.__table__])
+    for run, processes in enumerate(args.processes):
+        cleanup()
+        enqueue(run, args.jobs, args.projects)
+        start = time.perf_counter()
+        workers = subprocess.Popen(
+            [
+                sys.executable, "-m", "app.job.worker", "--processes", str(processes),
+                "--poll-interval", str(args.poll_interval),
+            ],
+            env=dict(os.environ, PYTHONPATH=os.getcwd()),
+        )
+        try:
+            while True:
+                status = counts()
+                if not status.get(JobStatus.queued) and not status.get(JobStatus.running):
+                    break
+                time.sleep(0.02)
+            elapsed = time.perf_counter() - start
+        finally:
+            workers.terminate()
+            workers.wait()
+
+        with database.engine.connect() as connection:
+            created = connection.execute(
+                text("SELECT count(*) FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"}
+            ).scalar()
+        print(
+            f"processes={processes} jobs/s={args.jobs / elapsed:8.1f} "
+            f"succeeded={status.get(JobStatus.succeeded, 0)} failed={status.get(JobStatus.failed, 0)} "
+            f"projects={created}/{args.jobs * args.projects} (including the start of the workers)"
+        )
+    cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the latency of requests logging many records without any handler,
+with a handler writing every record synchronously (as `logging.basicConfig`
+did) and with the queue and writer thread of `app.logging`. The endpoint is
+async, such that the records are emitted on the event loop, and the stream
+the records are written to takes some time per write, like a pipe to a log
+collector.
+
+Usage:
+
+    ./run python benchmarks/logging_pipeline.py --requests 2000 --records 20 --write-latency 50
+"""
+import argparse
+import asyncio
+import logging
+import queue
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.logging import JSONFormatter, LogWriter, NonBlockingQueueHandler
+
+log = logging.getLogger("benchmark")
+
+
+class SlowStream:
+    """A stream taking `latency` seconds per write, which counts the lines written."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lines = 0
+
+    def write(self, text: str):
+        time.sleep(self.latency)
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+
+def create_app(records: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/")
+    async def index():
+        for i in range(records):
+            log.info("Handled step %d of %d", i, records)
+        return {"status": "ok"}
+
+    return app
+
+
+async def run(app: FastAPI, requests: int, concurrency: int):
+    latencies = []
+
+    async def worker(client: httpx.AsyncClient, count: int):
+        for _ in range(count):
+            start = time.perf_counter()
+            response = await client.get("/")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await asyncio.gather(*[worker(client, requests // concurrency) for _ in range(concurrency)])
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--records", type=int, default=20, help="records logged per request")
+    parser.add_argument("--write-latency", type=float, default=50, help="microseconds per write")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    app = create_app(args.records)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    latency = args.write_latency / 1_000_000
+
+    for name in ("none", "sync", "queue"):
+        stream = SlowStream(latency)
+        writer = None
+        if name == "none":
+            handler = logging.NullHandler()
+        elif name == "sync":
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(JSONFormatter())
+        else:
+            log_queue = queue.Queue(maxsize=args.queue_size)
+            handler = NonBlockingQueueHandler(log_queue)
+            writer = LogWriter(log_queue, handler, JSONFormatter(), stream=stream)
+            writer.start()
+        log.handlers = [handler]
+
+        asyncio.run(run(app, 100, args.concurrency))  # warm up
+        latencies = asyncio.run(run(app, args.requests, args.concurrency))
+        if writer is not None:
+            writer.stop()
+        quantiles = statistics.quantiles(latencies, n=100)
+        dropped = getattr(handler, "dropped", 0)
+        print(
+            f"{name:6} p50={quantiles[49] * 1000:7.2f}ms p99={quantiles[98] * 1000:7.2f}ms "
+            f"lines written={stream.lines} dropped={dropped}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the overhead of the metrics (request middleware, SQL statement
+events and pool instrumentation). The API is served by a uvicorn process
+with the metrics enabled and one with them disabled. Both are loaded with
+`GET /api/v1/projects/{id}` with the cache turned off, so every request
+executes a query. The CPU time of the server process is read from /proc,
+so this only runs on Linux.
+
+Usage:
+
+    ./run python benchmarks/metrics_overhead.py --concurrency 10 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.database.core import Base, SessionLocal, engine
+from app.project.models import Project
+
+
+def seed() -> int:
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db_session:
+        project = Project(name="benchmark-metrics", description="Benchmark")
+        db_session.add(project)
+        db_session.commit()
+        return project.id
+
+
+def cpu_time(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # utime and stime, in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def start_server(port: int, metrics: bool) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        METRICS_ENABLED=str(metrics).lower(),
+        CACHE_BACKEND="none",
+        DATABASE_ENGINE_POOL_SIZE="40",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "error"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/healthcheck")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def load(url: str, concurrency: int, duration: float):
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    project_id = seed()
+    url = f"http://127.0.0.1:{args.port}/api/v1/projects/{project_id}"
+
+    try:
+        for metrics in (False, True):
+            server = start_server(args.port, metrics)
+            try:
+                # warm up
+                asyncio.run(load(url, args.concurrency, 1))
+                cpu_start = cpu_time(server.pid)
+                latencies = asyncio.run(load(url, args.concurrency, args.duration))
+                cpu = cpu_time(server.pid) - cpu_start
+                quantiles = statistics.quantiles(latencies, n=100)
+                print(
+                    f"metrics={'on' if metrics else 'off':3} {len(latencies) / args.duration:8.1f} req/s "
+                    f"p50={quantiles[49] * 1000:6.2f}ms p99={quantiles[98] * 1000:6.2f}ms "
+                    f"server CPU {cpu / len(latencies) * 1e6:7.0f} us/request"
+                )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        with SessionLocal() as db_session:
+            db_session.query(Project).filter(Project.id == project_id).delete()
+            db_session.commit()
+
+
+if __name__ == "__main__":
+    main()
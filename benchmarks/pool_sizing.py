@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the previous fixed pool (500 connections per worker, 30s timeout)
+with the adaptive pool sized from the connection budget. The API is served
+by uvicorn with several workers and loaded with concurrent
+`GET /api/v1/projects` requests (exact totals, cache disabled) at several
+concurrency levels.
+
+Usage:
+
+    ./run python benchmarks/pool_sizing.py --workers 3 --concurrency 10 50 200 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from sqlalchemy import text
+
+from app.database.core import Base, engine
+from app.project.models import Project  # noqa: F401
+
+PREFIX = "benchmark-pool-"
+
+SETUPS = {
+    "fixed": {
+        "DATABASE_ENGINE_POOL_SIZE": "500",
+        "DATABASE_ENGINE_POOL_TIMEOUT": "30",
+        "DATABASE_ENGINE_POOL_MAX_WAITERS": str(10 ** 6),
+        "DATABASE_ENGINE_POOL_IDLE_TIMEOUT": str(10 ** 6),
+    },
+    "adaptive": {},
+}
+
+
+def seed(rows: int):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || g, 'Benchmark', now(), now() FROM generate_series(1, :rows) AS g"
+            ),
+            {"prefix": PREFIX, "rows": rows},
+        )
+
+
+def cleanup():
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def start_server(port: int, workers: int, env: dict) -> subprocess.Popen:
+    env = dict(os.environ, CACHE_BACKEND="none", WEB_CONCURRENCY=str(workers), **env)
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+            "--workers", str(workers), "--log-level", "critical",
+        ],
+        env=env,
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/healthcheck")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def load(url: str, concurrency: int, duration: float):
+    latencies = []
+    errors = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(url)
+                status = response.status_code
+            except httpx.TransportError:
+                status = "transport"
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    url = f"http://127.0.0.1:{args.port}/api/v1/projects?total=exact"
+
+    try:
+        for name, env in SETUPS.items():
+            server = start_server(args.port, args.workers, env)
+            try:
+                for concurrency in args.concurrency:
+                    latencies, errors = asyncio.run(load(url, concurrency, args.duration))
+                    ok = len(latencies) - sum(errors.values())
+                    quantiles = statistics.quantiles(latencies, n=100)
+                    print(
+                        f"{name:8} concurrency={concurrency:<5} {ok / args.duration:8.1f} ok/s "
+                        f"p50={quantiles[49] * 1000:8.1f}ms p99={quantiles[98] * 1000:8.1f}ms errors={errors}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
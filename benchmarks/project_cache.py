@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the latency of `GET /api/v1/projects/{id}` and the number of SQL
+statements it issues with and without the project cache, for a read-heavy
+workload spread over a set of projects.
+
+Usage:
+
+    ./run python benchmarks/project_cache.py --projects 100 --requests 5000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.cache import LRUCache, NullCache
+from app.database.core import Base, SessionLocal, engine
+from app.main import app
+from app.project import service
+from app.project.models import Project
+
+
+def run(client: TestClient, project_ids, requests: int):
+    statements = 0
+
+    def before_cursor_execute(*args):
+        nonlocal statements
+        statements += 1
+
+    latencies = []
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.get(f"/api/v1/projects/{random.choice(project_ids)}")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return latencies, statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db_session:
+        projects = [
+            Project(name=f"benchmark-cache-{i}", description="Benchmark") for i in range(args.projects)
+        ]
+        db_session.add_all(projects)
+        db_session.commit()
+        project_ids = [project.id for project in projects]
+
+    try:
+        with TestClient(app) as client:
+            # every project is cached by id and by name
+            caches = (("no cache", NullCache()), ("lru cache", LRUCache(maxsize=2 * args.projects)))
+            for name, cache in caches:
+                service.project_cache = cache
+                run(client, project_ids, 100)  # warm up
+                latencies, statements = run(client, project_ids, args.requests)
+                quantiles = statistics.quantiles(latencies, n=100)
+                print(
+                    f"{name:10} p50={quantiles[49] * 1000:6.2f}ms p99={quantiles[98] * 1000:6.2f}ms "
+                    f"statements/request={statements / args.requests:5.2f} {cache.stats()}"
+                )
+    finally:
+        with SessionLocal() as db_session:
+            db_session.query(Project).filter(Project.id.in_(project_ids)).delete(synchronize_session=False)
+            db_session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the peak RSS of the API process while it streams
+`GET /api/v1/projects/export` for tables of growing size (on top of the rows
+already in the table). Every size is exported by a fresh uvicorn process so
+the peaks do not carry over.
+
+The peak RSS is read from /proc, so this only runs on Linux.
+
+Usage:
+
+    ./run python benchmarks/project_export.py --rows 10000 100000 1000000 10000000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from sqlalchemy import text
+
+from app.database.core import Base, engine
+from app.project.models import Project  # noqa: F401
+
+PREFIX = "benchmark-export-"
+
+
+def cleanup():
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def resize(rows: int):
+    """Replaces the benchmark rows of the project table by `rows` new ones."""
+    Base.metadata.create_all(bind=engine)
+    cleanup()
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || g, 'Benchmark', now(), now() FROM generate_series(1, :rows) AS g"
+            ),
+            {"prefix": PREFIX, "rows": rows},
+        )
+
+
+def peak_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("VmHWM not found")
+
+
+def start_server(port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "error"],
+        env=dict(os.environ),
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/healthcheck")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--encoding", default="identity", help="the Accept-Encoding of the request")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    headers = {"Accept-Encoding": args.encoding}
+    try:
+        for rows in args.rows:
+            resize(rows)
+            server = start_server(args.port)
+            try:
+                baseline = peak_rss(server.pid)
+                size = 0
+                start = time.perf_counter()
+                url = f"http://127.0.0.1:{args.port}/api/v1/projects/export"
+                params = {"format": args.format}
+                with httpx.stream("GET", url, params=params, headers=headers, timeout=None) as response:
+                    for chunk in response.iter_raw():
+                        size += len(chunk)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{rows:>10} rows {size / 2 ** 20:10.1f} MiB in {elapsed:7.2f}s "
+                    f"peak RSS {peak_rss(server.pid) / 2 ** 20:7.1f} MiB (idle {baseline / 2 ** 20:.1f} MiB)"
+                )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
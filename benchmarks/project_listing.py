@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Measures `GET /api/v1/projects` over a large table: shallow and deep pages
+with offset and keyset (cursor) pagination, and the cost of an exact total
+versus the planner estimate.
+
+The rows are generated by the database (generate_series) and removed again
+once the benchmark is done.
+
+Usage:
+
+    ./run python benchmarks/project_listing.py --rows 1000000
+"""
+import argparse
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.database.core import Base, engine
+from app.main import app
+
+PREFIX = "benchmark-listing-"
+
+
+def seed(rows: int):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || g, 'Benchmark', "
+                "now() - g * interval '1 second', now() - g * interval '1 second' "
+                "FROM generate_series(1, :rows) AS g"
+            ),
+            {"prefix": PREFIX, "rows": rows},
+        )
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE project"))
+
+
+def cleanup():
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def timed(client: TestClient, params: dict, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get("/api/v1/projects", params=params)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return statistics.median(latencies) * 1000, response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--items-per-page", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    try:
+        with TestClient(app) as client:
+            base = {"itemsPerPage": args.items_per_page, "sortBy": "created_at", "total": "none"}
+            deep_page = args.rows // args.items_per_page - 1
+
+            for total in ("none", "estimate", "exact"):
+                ms, data = timed(client, {**base, "total": total}, args.repeat)
+                print(f"first page, total={total:8} {ms:9.2f} ms  total={data['total']}")
+
+            ms, _ = timed(client, {**base, "page": deep_page}, args.repeat)
+            print(f"offset page {deep_page:<14} {ms:9.2f} ms")
+
+            # seek to the same depth once, then time the keyset query for that page
+            _, data = timed(client, {**base, "page": deep_page - 1}, 1)
+            ms, _ = timed(client, {**base, "cursor": data["next"]}, args.repeat)
+            print(f"keyset page {deep_page:<14} {ms:9.2f} ms")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
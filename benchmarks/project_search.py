@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Measures `GET /api/v1/projects/search` over a million projects: seeds the
+projects with names and descriptions drawn from a vocabulary of made-up
+words, such that every word is used by about `rows / vocabulary * 4`
+projects, and reports the p50/p95/p99 of the search itself (the query and
+the rows) and of the whole request, by kind of query. Also checks that the
+query plan uses the search index.
+
+Usage:
+
+    ./run python benchmarks/project_search.py --rows 1000000 --queries 200
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.database import core as database
+from app.main import app
+from app.project import service
+from app.project.models import Project, SEARCH_DOCUMENT
+
+PREFIX = "benchmark-search-"
+SYLLABLES = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+
+
+def vocabulary(size: int, rng: random.Random) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def seed(rows: int, words: List[str]):
+    database.Base.metadata.create_all(bind=database.engine, tables=[Project.__table__])
+    cleanup()
+    with database.engine.begin() as connection:
+        # the indexes are dropped while the rows are inserted, they are built once afterwards
+        connection.execute(text("DROP INDEX IF EXISTS ix_project_search"))
+        connection.execute(text("DROP INDEX IF EXISTS ix_project_name_trgm"))
+        connection.execute(
+            text(
+                "ALTER TABLE project ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({SEARCH_DOCUMENT}) STORED"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || w[1 + (g * 7919) % n] || ' ' || w[1 + (g * 104729) % n] || ' ' || g, "
+                "w[1 + (g * 15485863) % n] || ' ' || w[1 + (g * 32452843) % n], now(), now() "
+                "FROM generate_series(CAST(1 AS bigint), :rows) AS g, "
+                "(SELECT CAST(:words AS text[]) AS w, cardinality(CAST(:words AS text[])) AS n) AS v"
+            ),
+            {"prefix": PREFIX, "rows": rows, "words": words},
+        )
+        connection.execute(text("CREATE INDEX ix_project_search ON project USING gin (search_vector)"))
+        if connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+            connection.execute(
+                text("CREATE INDEX ix_project_name_trgm ON project USING gin (name gin_trgm_ops)")
+            )
+        connection.execute(text("ANALYZE project"))
+
+
+def cleanup():
+    with database.engine.begin() as connection:
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def percentiles(latencies: List[float]) -> str:
+    quantiles = statistics.quantiles(latencies, n=100)
+    return " ".join(f"p{n}={quantiles[n - 1] * 1000:6.2f}ms" for n in (50, 95, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200, help="queries per kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keeps the projects for another run")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(args.vocabulary, rng)
+    start = time.perf_counter()
+    seed(args.rows, words)
+    print(f"seeded {args.rows} projects in {time.perf_counter() - start:.1f}s")
+
+    kinds: Dict[str, Callable[[], str]] = {
+        "one word": lambda: rng.choice(words),
+        "two words": lambda: f"{rng.choice(words)} {rng.choice(words)}",
+        "prefix": lambda: rng.choice(words)[:4],
+        "no match": lambda: "zzzzqx",
+    }
+    try:
+        with database.SessionLocal() as db_session:
+            statement = service._search_postgresql(db_session, words[0], [words[0]])
+            plan = db_session.execute(
+                text(f"EXPLAIN {statement.compile(database.engine, compile_kwargs={'literal_binds': True})}")
+            ).scalars().all()
+        print("uses ix_project_search:", any("ix_project_search" in line for line in plan))
+
+        with TestClient(app) as client:
+            for kind, query in kinds.items():
+                searches, requests, found = [], [], 0
+                for _ in range(args.queries):
+                    q = query()
+                    # a session per search, such that no transaction stays open in between
+                    with database.SessionLocal() as db_session:
+                        begin = time.perf_counter()
+                        found += len(service.search(db_session=db_session, q=q, items_per_page=20))
+                        searches.append(time.perf_counter() - begin)
+                    begin = time.perf_counter()
+                    response = client.get("/api/v1/projects/search", params={"q": q, "itemsPerPage": 20})
+                    requests.append(time.perf_counter() - begin)
+                    assert response.status_code == 200
+                print(
+                    f"{kind:10} search {percentiles(searches)} | request {percentiles(requests)} "
+                    f"| {found / args.queries:.1f} results"
+                )
+    finally:
+        if not args.keep:
+            cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the read throughput of the API without and with read replicas.
+The replicas are other local databases holding a copy of the seeded rows
+(they are not replicated to), the API is served by uvicorn and loaded with
+concurrent `GET /api/v1/projects/{id}` requests (cache disabled).
+
+On a single machine the replicas share the CPU with the primary, such that
+this measures the overhead of the routing rather than the scaling of the
+reads, which needs the replicas on their own servers.
+
+Usage:
+
+    ./run python benchmarks/read_replicas.py --replicas 0 1 2 --concurrency 20 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from app.config import SQLALCHEMY_DATABASE_URI
+from app.database.core import Base, engine
+from app.project.models import Project  # noqa: F401
+
+PREFIX = "benchmark-replica-"
+
+
+def replica_uri(index: int) -> str:
+    url = make_url(SQLALCHEMY_DATABASE_URI)
+    return str(url.set(database=f"{url.database}_replica{index}"))
+
+
+def seed(rows: int) -> list:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || g, 'Benchmark', now(), now() FROM generate_series(1, :rows) AS g"
+            ),
+            {"prefix": PREFIX, "rows": rows},
+        )
+        return connection.execute(
+            text("SELECT id FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"}
+        ).scalars().all()
+
+
+def create_replica(index: int, ids: list):
+    """Creates the database of a replica holding the seeded rows, with the same ids as on the primary."""
+    url = make_url(replica_uri(index))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"DROP DATABASE IF EXISTS {url.database}"))
+        connection.execute(text(f"CREATE DATABASE {url.database}"))
+    replica = create_engine(url)
+    Base.metadata.create_all(bind=replica)
+    with replica.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (id, name, description, created_at, updated_at) "
+                "SELECT g, :prefix || g, 'Benchmark', now(), now() FROM unnest(CAST(:ids AS integer[])) AS g"
+            ),
+            {"prefix": PREFIX, "ids": ids},
+        )
+    replica.dispose()
+
+
+def drop_replica(index: int):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"DROP DATABASE IF EXISTS {make_url(replica_uri(index)).database} WITH (FORCE)"))
+
+
+def start_server(port: int, workers: int, replicas: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        CACHE_BACKEND="none",
+        WEB_CONCURRENCY=str(workers),
+        DATABASE_REPLICA_URIS=",".join(replica_uri(index) for index in range(replicas)),
+    )
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+            "--workers", str(workers), "--log-level", "critical",
+        ],
+        env=env,
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/healthcheck")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def load(url: str, ids: list, concurrency: int, duration: float):
+    latencies = []
+    errors = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(f"{url}/{random.choice(ids)}")
+                status = response.status_code
+            except httpx.TransportError:
+                status = "transport"
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--replicas", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8769)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    ids = seed(args.rows)
+    for index in range(max(args.replicas)):
+        create_replica(index, ids)
+    url = f"http://127.0.0.1:{args.port}/api/v1/projects"
+
+    try:
+        for replicas in args.replicas:
+            server = start_server(args.port, args.workers, replicas)
+            try:
+                latencies, errors = asyncio.run(load(url, ids, args.concurrency, args.duration))
+                ok = len(latencies) - sum(errors.values())
+                quantiles = statistics.quantiles(latencies, n=100)
+                print(
+                    f"replicas={replicas:<3} {ok / args.duration:8.1f} ok/s "
+                    f"p50={quantiles[49] * 1000:8.1f}ms p99={quantiles[98] * 1000:8.1f}ms errors={errors}"
+                )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+        for index in range(max(args.replicas)):
+            drop_replica(index)
+
+
+if __name__ == "__main__":
+    main()
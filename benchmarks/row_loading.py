@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Compares loading projects as ORM instances with loading them as read-only
+rows (`Project.row_type()`) from a column-level query: rows per second, the
+memory kept per loaded row (traced by tracemalloc, the session holding the
+ORM instances included) and the cost of `dict()` and `repr()` per row.
+
+Usage:
+
+    ./run python benchmarks/row_loading.py --rows 100000 --repeat 3
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from typing import Callable, List
+
+from sqlalchemy import select, text
+
+from app.database import core as database
+from app.project.models import Project, ProjectRow
+
+PREFIX = "benchmark-rows-"
+
+
+def seed(rows: int):
+    database.Base.metadata.create_all(bind=database.engine, tables=[Project.__table__])
+    cleanup()
+    with database.engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || g, 'Benchmark', now(), now() FROM generate_series(1, :rows) AS g"
+            ),
+            {"prefix": PREFIX, "rows": rows},
+        )
+
+
+def cleanup():
+    with database.engine.begin() as connection:
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def load_orm(session) -> List[Project]:
+    return session.query(Project).filter(Project.name.like(PREFIX + "%")).all()
+
+
+def load_rows(session) -> List[ProjectRow]:
+    statement = select(*Project.__table__.columns).where(Project.name.like(PREFIX + "%"))
+    return [ProjectRow._make(row) for row in session.execute(statement)]
+
+
+def measure(load: Callable, repeat: int):
+    best = None
+    for _ in range(repeat):
+        with database.SessionLocal() as session:
+            gc.collect()
+            start = time.perf_counter()
+            items = load(session)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            del items
+
+    # the memory is traced apart, tracemalloc slows the loading down
+    with database.SessionLocal() as session:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        items = load(session)
+        kept = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for item in items:
+            item.dict()
+        dict_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for item in items:
+            repr(item)
+        repr_time = time.perf_counter() - start
+        count = len(items)
+        del items
+    return count, best, kept, dict_time, repr_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    try:
+        for name, load in (("orm", load_orm), ("rows", load_rows)):
+            count, elapsed, kept, dict_time, repr_time = measure(load, args.repeat)
+            print(
+                f"{name:5} {count / elapsed:10.0f} rows/s {kept / count:7.0f} bytes/row "
+                f"dict={dict_time / count * 1e6:5.2f}us repr={repr_time / count * 1e6:5.2f}us"
+            )
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
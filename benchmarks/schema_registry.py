@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Measures requests/sec through `db_session_middleware` with the schema names
+reflected on every request (the previous behaviour, emulated with a zero TTL)
+and with the cached schema registry.
+
+Usage:
+
+    ./run python benchmarks/schema_registry.py --requests 2000
+"""
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+
+from app.database.core import schema_registry
+from app.main import app
+
+
+def run(client: TestClient, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get("/api/v1/healthcheck")
+        assert response.status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    ttl = schema_registry.ttl
+    with TestClient(app) as client:
+        # warm up the pool and the route handlers
+        run(client, 100)
+
+        schema_registry.ttl = 0
+        before = run(client, args.requests)
+
+        schema_registry.ttl = ttl
+        schema_registry.invalidate()
+        after = run(client, args.requests)
+
+    print(f"reflect per request: {before:10.1f} req/s")
+    print(f"schema registry:     {after:10.1f} req/s")
+    print(f"speedup:             {after / before:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Compares rendering a page of projects through pydantic (`from_orm`,
+`jsonable_encoder` and `JSONResponse`, as FastAPI does for a `response_model`)
+with the fast path of the API (`dump_orm` and `ORJSONResponse`).
+
+The projects are ORM instances that are never flushed, so no database is
+needed.
+
+Usage:
+
+    ./run python benchmarks/serialization.py --items 50
+"""
+import argparse
+import timeit
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.project.models import Project, ProjectPagination
+from app.responses import ORJSONResponse
+
+
+def pydantic_path(pagination: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(ProjectPagination.parse_obj(pagination))).body
+
+
+def fast_path(pagination: dict) -> bytes:
+    return ORJSONResponse(ProjectPagination.dump_orm(pagination)).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    items = [
+        Project(id=i + 1, name=f"Project {i}", description="Benchmark", created_at=now, updated_at=now)
+        for i in range(args.items)
+    ]
+    pagination = {"items": items, "itemsPerPage": args.items, "page": 1, "total": args.items, "next": None}
+    assert pydantic_path(pagination) == fast_path(pagination)
+
+    for func in (pydantic_path, fast_path):
+        elapsed = min(timeit.repeat(lambda: func(pagination), number=args.repeat, repeat=5))
+        print(f"{func.__name__:14} {elapsed / args.repeat * 1e6:10.1f} µs per page of {args.items}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how the throughput of the launcher (run.py) scales with the number
+of workers, from 1 to the number of CPUs, with the plain asyncio/h11 stack
+and with uvloop/httptools. The API is loaded with concurrent
+`GET /api/v1/healthcheck` and `GET /api/v1/projects` requests, the load
+generator runs in this process and competes with the workers for the CPUs.
+
+Usage:
+
+    ./run python benchmarks/server_scaling.py --workers 1 2 4 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from sqlalchemy import text
+
+from app.database.core import Base, engine
+from app.project.models import Project  # noqa: F401
+from app.server import cpu_count
+
+PREFIX = "benchmark-scaling-"
+
+STACKS = {
+    "asyncio/h11": ["--loop", "asyncio", "--http", "h11"],
+    "uvloop/httptools": ["--loop", "uvloop", "--http", "httptools"],
+}
+
+
+def seed(rows: int):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || g, 'Benchmark', now(), now() FROM generate_series(1, :rows) AS g"
+            ),
+            {"prefix": PREFIX, "rows": rows},
+        )
+
+
+def cleanup():
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def start_server(port: int, workers: int, options: list) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable, "run.py", "--port", str(port), "--workers", str(workers),
+            "--max-requests", "0", "--log-level", "critical", *options,
+        ],
+        env=dict(os.environ, CACHE_BACKEND="none"),
+    )
+    url = f"http://127.0.0.1:{port}/api/v1/healthcheck"
+    for _ in range(300):
+        try:
+            httpx.get(url)
+            # gives the other workers the time to start as well
+            time.sleep(workers * 0.5)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("run.py did not start")
+
+
+async def load(url: str, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(url)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.TransportError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="defaults to 1 up to the CPUs")
+    parser.add_argument("--stacks", nargs="+", choices=list(STACKS), default=list(STACKS))
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8769)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    workers_counts = args.workers or list(range(1, cpu_count() + 1))
+    paths = ["/api/v1/healthcheck", "/api/v1/projects?itemsPerPage=10"]
+    print(f"{cpu_count()} CPUs")
+
+    seed(args.rows)
+    try:
+        for stack in args.stacks:
+            for workers in workers_counts:
+                server = start_server(args.port, workers, STACKS[stack])
+                try:
+                    for path in paths:
+                        url = f"http://127.0.0.1:{args.port}{path}"
+                        latencies, errors = asyncio.run(load(url, args.concurrency, args.duration))
+                        quantiles = statistics.quantiles(latencies, n=100)
+                        print(
+                            f"{stack:17} workers={workers:<3} {path:34} "
+                            f"{(len(latencies) - errors) / args.duration:8.1f} req/s "
+                            f"p50={quantiles[49] * 1000:7.1f}ms p99={quantiles[98] * 1000:7.1f}ms errors={errors}"
+                        )
+                finally:
+                    server.terminate()
+                    server.wait()
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the per-request cost of setting up and tearing down the database
+session, the way `db_session_middleware` used to do it (a new sessionmaker
+and scoped_session on every request) and with the per-schema session factory
+of the schema registry.
+
+Usage:
+
+    ./run python benchmarks/session_factory.py --requests 20000
+"""
+import argparse
+import time
+import tracemalloc
+from uuid import uuid1
+
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app.context import _request_id_ctx_var, get_request_id
+from app.database.core import schema_registry
+
+
+def per_request_factory(schema_engine):
+    session = scoped_session(sessionmaker(bind=schema_engine), scopefunc=get_request_id)
+    session().close()
+
+
+def cached_factory(schema_engine):
+    session = schema_registry.get_session("public")
+    session()
+    session.remove()
+
+
+def measure(func, schema_engine, requests: int):
+    # latency
+    start = time.perf_counter()
+    for _ in range(requests):
+        token = _request_id_ctx_var.set(str(uuid1()))
+        func(schema_engine)
+        _request_id_ctx_var.reset(token)
+    latency = (time.perf_counter() - start) / requests
+
+    # allocations
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+    for _ in range(requests):
+        token = _request_id_ctx_var.set(str(uuid1()))
+        func(schema_engine)
+        _request_id_ctx_var.reset(token)
+    stats = tracemalloc.take_snapshot().compare_to(snapshot, "filename")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in stats)
+    return latency, retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    schema_engine = schema_registry.get_engine("public")
+    for name, func in (
+        ("sessionmaker per request", per_request_factory),
+        ("cached session factory", cached_factory),
+    ):
+        func(schema_engine)  # warm up
+        latency, retained, peak = measure(func, schema_engine, args.requests)
+        print(
+            f"{name:26} {latency * 1e6:8.2f} us/request "
+            f"{retained / 1024:10.1f} KiB retained {peak / 1024:10.1f} KiB peak"
+        )
+
+
+if __name__ == "__main__":
+    main()
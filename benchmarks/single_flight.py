@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Measures a thundering herd on one project: bursts of concurrent
+`GET /api/v1/projects/{id}` requests for the same project (cache disabled,
+served by the sync handlers in the threadpool), with and without the
+coalescing of identical lookups. Reports the SQL statements per request and
+the request latencies.
+
+Usage:
+
+    ./run python benchmarks/single_flight.py --bursts 50 --burst-size 40
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from sqlalchemy import event
+
+from app.cache import NullCache, SingleFlight
+from app.database import core as database
+from app.main import app
+from app.project import service
+from app.project.models import Project
+
+
+class NoFlight(SingleFlight):
+    """Makes every call, as before the lookups were coalesced."""
+
+    def do(self, key, fn):
+        self.calls += 1
+        return fn()
+
+
+async def run(project_id: int, bursts: int, burst_size: int):
+    latencies = []
+
+    async def request(client: httpx.AsyncClient):
+        start = time.perf_counter()
+        response = await client.get(f"/api/v1/projects/{project_id}")
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for _ in range(bursts):
+            await asyncio.gather(*[request(client) for _ in range(burst_size)])
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bursts", type=int, default=50)
+    parser.add_argument("--burst-size", type=int, default=40)
+    args = parser.parse_args()
+
+    database.create_engines()
+    database.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as db_session:
+        project = Project(name="benchmark-single-flight", description="Benchmark")
+        db_session.add(project)
+        db_session.commit()
+        project_id = project.id
+
+    statements = 0
+
+    def before_cursor_execute(*args):
+        nonlocal statements
+        statements += 1
+
+    service.project_cache = NullCache()
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        for name, flight in (("no coalescing", NoFlight()), ("single-flight", SingleFlight())):
+            service.project_flight = flight
+            asyncio.run(run(project_id, 2, args.burst_size))  # warm up
+            statements = 0
+            latencies = asyncio.run(run(project_id, args.bursts, args.burst_size))
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{name:14} statements/request={statements / len(latencies):5.2f} "
+                f"p50={quantiles[49] * 1000:7.2f}ms p99={quantiles[98] * 1000:7.2f}ms"
+            )
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
+        with database.SessionLocal() as db_session:
+            db_session.query(Project).filter(Project.id == project_id).delete()
+            db_session.commit()
+
+
+if __name__ == "__main__":
+    main()
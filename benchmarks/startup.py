@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the cold start of a worker: the time to import `app.main` and the
+time the lifespan takes until the app is ready to serve (engines created,
+schema names reflected, warm-up done), each in a fresh interpreter. It
+then prints an `-X importtime` report of the packages and modules that
+take the longest to import.
+
+Usage:
+
+    ./run python benchmarks/startup.py --runs 10 --top 15
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+STARTUP = """
+import asyncio
+import json
+import time
+
+start = time.perf_counter()
+from app.main import app, lifespan
+imported = time.perf_counter()
+
+
+async def main():
+    context = lifespan(app)
+    await context.__aenter__()
+    ready = time.perf_counter()
+    await context.__aexit__(None, None, None)
+    return ready
+
+
+ready = asyncio.run(main())
+print(json.dumps({"import": imported - start, "lifespan": ready - imported}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importtime(module: str) -> list:
+    """Returns (self µs, cumulative µs, depth, name) of every module imported by `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP], capture_output=True, text=True, check=True, env=dict(os.environ)
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    for phase in ("import", "lifespan"):
+        timings = [run[phase] * 1000 for run in runs]
+        print(f"{phase:9} median={statistics.median(timings):7.1f}ms min={min(timings):7.1f}ms")
+
+    times = importtime("app.main")
+    packages = sorted((t for t in times if t[2] == 1), key=lambda t: t[1], reverse=True)
+    print("\nslowest packages imported by app.main (cumulative)")
+    for _, cumulative_us, _, name in packages[: args.top]:
+        print(f"{cumulative_us / 1000:8.1f}ms {name}")
+    modules = sorted((t for t in times if t[3] == "app" or t[3].startswith("app.")), reverse=True)
+    print("\nslowest modules of the app (self)")
+    for self_us, _, _, name in modules[: args.top]:
+        print(f"{self_us / 1000:8.1f}ms {name}")
+
+
+if __name__ == "__main__":
+    main()
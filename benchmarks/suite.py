@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+The benchmark suite of the API, whose results are compared with a baseline
+to catch performance regressions.
+
+It has three parts:
+
+- micro: `resolve_table_name`, `CustomBase.dict`/`__repr__` and the
+  serialization of a `ProjectRead`, in microseconds per call (the best of
+  several repeats, with the garbage collector disabled by timeit)
+- asgi: every project endpoint called in-process through the whole
+  middleware stack, p50/p95/p99 in milliseconds
+- load: a uvicorn server (started by run.py) loaded with concurrent
+  requests per scenario, requests per second and p50/p95/p99
+
+The asgi and load parts run against the database configured for the app,
+e.g. a local PostgreSQL, seeded with the same rows on every run. The
+results are written as JSON. Given a baseline (the JSON of an earlier run),
+every metric is compared with it and the suite exits with 1 when one
+regressed by more than the tolerance.
+
+Usage:
+
+    ./run python benchmarks/suite.py --output results.json
+    ./run python benchmarks/suite.py --parts micro asgi --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import httpx
+
+PREFIX = "benchmark-suite-"
+PARTS = ("micro", "asgi", "load")
+# metrics whose larger values are better, all others are better when smaller
+HIGHER_IS_BETTER = ("rps",)
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """The p50/p95/p99 of latencies in seconds, in milliseconds."""
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {f"p{n}": round(quantiles[n - 1] * 1000, 3) for n in (50, 95, 99)}
+
+
+def run_micro(number: int) -> Dict[str, float]:
+    from app.database.core import resolve_table_name
+    from app.project.models import Project, ProjectRead
+    from app.responses import ORJSONResponse
+
+    now = datetime(2024, 1, 1)
+    project = Project(id=1, name="Benchmark", description="x" * 100, created_at=now, updated_at=now)
+
+    benchmarks: Dict[str, Callable] = {
+        "resolve_table_name": lambda: resolve_table_name("ProjectBulkRead"),
+        "custom_base_dict": project.dict,
+        "custom_base_repr": lambda: repr(project),
+        "project_read_pydantic": lambda: ProjectRead.from_orm(project).json(),
+        "project_read_dump_orm": lambda: ORJSONResponse(ProjectRead.dump_orm(project)).body,
+    }
+    results = {}
+    for name, benchmark in benchmarks.items():
+        best = min(timeit.repeat(benchmark, number=number, repeat=5))
+        results[f"micro.{name}.us"] = round(best / number * 1_000_000, 3)
+    return results
+
+
+def seed(rows: int) -> List[int]:
+    from sqlalchemy import text
+
+    from app.database import core as database
+    from app.project.models import Project  # noqa: F401
+
+    database.create_engines()
+    database.Base.metadata.create_all(bind=database.engine)
+    cleanup()
+    with database.engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO project (name, description, created_at, updated_at) "
+                "SELECT :prefix || g, 'Benchmark', now(), now() FROM generate_series(1, :rows) AS g"
+            ),
+            {"prefix": PREFIX, "rows": rows},
+        )
+        return connection.execute(
+            text("SELECT id FROM project WHERE name LIKE :prefix ORDER BY id"), {"prefix": PREFIX + "%"}
+        ).scalars().all()
+
+
+def cleanup():
+    from sqlalchemy import text
+
+    from app.database import core as database
+
+    with database.engine.begin() as connection:
+        connection.execute(text("DELETE FROM project WHERE name LIKE :prefix"), {"prefix": PREFIX + "%"})
+
+
+def asgi_requests(ids: List[int], etag: str) -> Dict[str, Callable[[httpx.Client, int], httpx.Response]]:
+    """The request of every endpoint, given a client and the number of the call."""
+
+    def bulk(i: int) -> list:
+        return [{"name": f"{PREFIX}bulk-{i}-{j}"} for j in range(10)]
+
+    return {
+        "healthcheck": lambda client, i: client.get("/api/v1/healthcheck"),
+        "get_project": lambda client, i: client.get(f"/api/v1/projects/{random.choice(ids)}"),
+        "get_project_not_modified": lambda client, i: client.get(
+            f"/api/v1/projects/{ids[0]}", headers={"If-None-Match": etag}
+        ),
+        "list_projects": lambda client, i: client.get("/api/v1/projects", params={"itemsPerPage": 50}),
+        "list_projects_exact": lambda client, i: client.get(
+            "/api/v1/projects", params={"itemsPerPage": 50, "total": "exact"}
+        ),
+        "create_project": lambda client, i: client.post(
+            "/api/v1/projects", json={"name": f"{PREFIX}new-{i}"}
+        ),
+        "bulk_create_projects": lambda client, i: client.post("/api/v1/projects/bulk", json=bulk(i)),
+        "export_projects": lambda client, i: client.get("/api/v1/projects/export"),
+    }
+
+
+def run_asgi(ids: List[int], requests: int) -> Dict[str, float]:
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    results = {}
+    with TestClient(app) as client:
+        etag = client.get(f"/api/v1/projects/{ids[0]}").headers["etag"]
+        for name, request in asgi_requests(ids, etag).items():
+            for i in range(min(requests // 10, 50)):
+                # warm up, the calls of the measurement are numbered after these
+                request(client, -i - 1)
+            latencies = []
+            for i in range(requests):
+                start = time.perf_counter()
+                response = request(client, i)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code < 400, (name, response.status_code)
+            for key, value in percentiles(latencies).items():
+                results[f"asgi.{name}.{key}"] = value
+            # keeps the rows created by one endpoint out of the following ones
+            cleanup_created()
+    return results
+
+
+def cleanup_created():
+    from sqlalchemy import text
+
+    from app.database import core as database
+    from app.project.service import project_cache
+
+    with database.engine.begin() as connection:
+        connection.execute(
+            text("DELETE FROM project WHERE name LIKE :new OR name LIKE :bulk"),
+            {"new": PREFIX + "new-%", "bulk": PREFIX + "bulk-%"},
+        )
+    project_cache.clear()
+
+
+LOAD_SCENARIOS = {
+    "get_project": lambda ids: f"/api/v1/projects/{random.choice(ids)}",
+    "list_projects": lambda ids: "/api/v1/projects?itemsPerPage=50",
+}
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable, "run.py", "--port", str(port), "--workers", str(workers),
+            "--log-level", "critical",
+        ],
+        env=dict(os.environ, PYTHONPATH=os.getcwd()),
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/healthcheck")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("the server did not start")
+
+
+async def load(base_url: str, path: Callable[[], str], concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path())
+                ok = response.status_code == 200
+            except httpx.TransportError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return latencies, errors
+
+
+def run_load(ids: List[int], port: int, workers: int, concurrency: int, duration: float) -> Dict[str, float]:
+    results = {}
+    server = start_server(port, workers)
+    try:
+        for name, scenario in LOAD_SCENARIOS.items():
+            base_url = f"http://127.0.0.1:{port}"
+            asyncio.run(load(base_url, lambda: scenario(ids), concurrency, min(duration, 2)))  # warm up
+            latencies, errors = asyncio.run(load(base_url, lambda: scenario(ids), concurrency, duration))
+            results[f"load.{name}.rps"] = round((len(latencies) - errors) / duration, 1)
+            results[f"load.{name}.errors"] = errors
+            for key, value in percentiles(latencies).items():
+                results[f"load.{name}.{key}"] = value
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """
+    Returns the regressions of the results against the baseline, one line each.
+
+    A metric regressed when it is worse than its baseline by more than
+    `tolerance` (a fraction of the baseline). Metrics missing on either
+    side are not compared.
+    """
+    regressions = []
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if name.endswith(".errors"):
+            regressed = value > base
+        elif name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER:
+            regressed = value < base * (1 - tolerance)
+        else:
+            regressed = value > base * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{name}: {value} (baseline {base})")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--parts", nargs="+", choices=PARTS, default=list(PARTS))
+    parser.add_argument("--output", help="writes the results to this JSON file")
+    parser.add_argument("--baseline", help="compares the results with the ones of this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="the allowed regression, as a fraction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--number", type=int, default=10000, help="calls per repeat of a micro-benchmark")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint of the asgi part")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    results = {}
+    if "micro" in args.parts:
+        results.update(run_micro(args.number))
+    if "asgi" in args.parts or "load" in args.parts:
+        ids = seed(args.rows)
+        try:
+            if "asgi" in args.parts:
+                gc.collect()
+                results.update(run_asgi(ids, args.requests))
+            if "load" in args.parts:
+                results.update(run_load(ids, args.port, args.workers, args.concurrency, args.duration))
+        finally:
+            cleanup()
+
+    for name, value in results.items():
+        print(f"{name:45} {value}")
+
+    if args.output:
+        document = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regression beyond {args.tolerance:.0%} of {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
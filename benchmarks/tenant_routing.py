@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the overhead of routing the requests by tenant with 10k tenant
+schemas: the lookups of the schema registry (uniform and skewed tenants,
+with room for all tenants or only some of them) and the memory they keep,
+then requests/sec through `db_session_middleware` without tenants, with a
+tenant header and for unknown tenants.
+
+Usage:
+
+    ./run python benchmarks/tenant_routing.py --tenants 10000 --lookups 200000 --requests 2000
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import main as app_main
+from app.database.core import engine, get_request_id
+from app.database.registry import SchemaRegistry
+from app.tenant import TenantResolver
+
+PREFIX = "bench_tenant_"
+
+
+def create_schemas(count: int):
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "DO $$ BEGIN FOR i IN 1..%d LOOP "
+                "EXECUTE format('CREATE SCHEMA IF NOT EXISTS %s%%s', i); END LOOP; END $$" % (count, PREFIX)
+            )
+        )
+
+
+def drop_schemas(count: int):
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "DO $$ BEGIN FOR i IN 1..%d LOOP "
+                "EXECUTE format('DROP SCHEMA IF EXISTS %s%%s', i); END LOOP; END $$" % (count, PREFIX)
+            )
+        )
+
+
+def tenant_names(count: int, lookups: int, skewed: bool) -> list:
+    population = [f"{PREFIX}{i}" for i in range(1, count + 1)]
+    # with a Zipf-like skew a few tenants send most of the requests
+    weights = [1 / rank for rank in range(1, count + 1)] if skewed else None
+    return random.choices(population, weights=weights, k=lookups)
+
+
+def lookups(max_size: int, names: list, trace: bool = False) -> tuple:
+    """Returns the time per lookup in µs, the hit rate and the memory kept by the registry (if traced)."""
+    registry = SchemaRegistry(engine, ttl=3600, scopefunc=get_request_id, max_size=max_size)
+    registry.load()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for name in names:
+        registry.get_session(name)
+    elapsed = time.perf_counter() - start
+    memory = 0
+    if trace:
+        gc.collect()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    stats = registry.stats()
+    return elapsed / len(names) * 1e6, stats["hits"] / (stats["hits"] + stats["misses"]), memory
+
+
+def requests(client: TestClient, count: int, names: list) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        headers = {"X-Tenant": names[i % len(names)]} if names else {}
+        client.get("/api/v1/healthcheck", headers=headers)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tenants", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-sizes", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+
+    create_schemas(args.tenants)
+    try:
+        for skewed in (False, True):
+            names = tenant_names(args.tenants, args.lookups, skewed)
+            for max_size in args.max_sizes:
+                # tracemalloc slows the lookups down, they are timed once more without it
+                _, _, memory = lookups(max_size, names, trace=True)
+                per_lookup, hit_rate, _ = lookups(max_size, names)
+                print(
+                    f"{'skewed' if skewed else 'uniform':7} max_size={max_size:<6} "
+                    f"{per_lookup:6.2f} µs/lookup  hit rate {hit_rate:6.1%}  kept {memory / 2 ** 20:6.1f} MiB"
+                )
+
+        names = tenant_names(args.tenants, args.requests, skewed=True)
+        resolver = app_main.tenant_resolver
+        with TestClient(app_main.app) as client:
+            requests(client, 100, [])
+            no_tenants = requests(client, args.requests, [])
+            app_main.tenant_resolver = TenantResolver("header", default="")
+            try:
+                tenants = requests(client, args.requests, names)
+                unknown = requests(client, args.requests, ["unknown"])
+            finally:
+                app_main.tenant_resolver = resolver
+        print(f"no tenants:       {no_tenants:8.1f} req/s")
+        print(f"tenant header:    {tenants:8.1f} req/s")
+        print(f"unknown tenant:   {unknown:8.1f} req/s")
+    finally:
+        drop_schemas(args.tenants)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
-import uvicorn
+import sys
+
+from app.server import main
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=80)
+    sys.exit(main())
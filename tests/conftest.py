@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database.core import Base
+from app.config import SQLALCHEMY_DATABASE_URI
+from app.project.service import project_cache
+
+# Create test database engine
+engine = create_engine(SQLALCHEMY_DATABASE_URI)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def test_db():
+    # Create the test database and tables
+    Base.metadata.create_all(bind=engine)
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+        # Clean up the test database
+        Base.metadata.drop_all(bind=engine)
+        project_cache.clear()
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from benchmarks.suite import compare
+
+
+def test_compare_with_baseline():
+    baseline = {"asgi.get_project.p99": 10.0, "load.get_project.rps": 100.0, "load.get_project.errors": 0}
+
+    assert compare({"asgi.get_project.p99": 12.0, "load.get_project.rps": 80.0}, baseline, 0.25) == []
+    assert compare(
+        {"asgi.get_project.p99": 13.0, "load.get_project.rps": 70.0, "load.get_project.errors": 1, "new": 1},
+        baseline,
+        0.25,
+    ) == [
+        "asgi.get_project.p99: 13.0 (baseline 10.0)",
+        "load.get_project.errors: 1 (baseline 0)",
+        "load.get_project.rps: 70.0 (baseline 100.0)",
+    ]
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import fnmatch
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+
+from app.cache import LRUCache, RedisCache, SingleFlight
+from app.database.core import SessionLocal, engine
+from app.project.models import ProjectCreate
+from app.project import service
+from app.project.service import create, get, get_by_name, project_cache
+
+
+class FakeRedis:
+    """Stands in for `redis.Redis` in tests."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if fnmatch.fnmatch(key, match)]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"hits": 3, "misses": 1, "evictions": 1, "size": 2, "maxsize": 2}
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=2, ttl=0)
+    cache.set("a", 1)
+    time.sleep(0.001)
+    assert cache.get("a") is None
+
+
+def test_redis_cache():
+    cache = RedisCache(FakeRedis(), prefix="test:")
+    cache.set("a", {"id": 1})
+    assert cache.get("a") == {"id": 1}
+
+    cache.delete("a")
+    assert cache.get("a") is None
+
+    cache.set("b", 2)
+    cache.clear()
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_async_methods_do_not_block_the_event_loop():
+    threads = []
+
+    class RecordingRedis(FakeRedis):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+    async def main():
+        redis_cache, lru_cache = RedisCache(RecordingRedis()), LRUCache()
+        for cache in (redis_cache, lru_cache):
+            await cache.async_set("a", 1)
+            assert await cache.async_get("a") == 1
+            await cache.async_delete("a")
+            assert await cache.async_get("a") is None
+        return threading.get_ident()
+
+    # the Redis calls run in the thread pool, the in-process cache is used from the event loop
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 2 and loop_thread not in threads
+
+
+def test_get_is_read_through(test_db):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with SessionLocal() as db_session:
+        project = create(
+            db_session=db_session,
+            project_in=ProjectCreate(name="Test Project", description="Test Description"),
+        )
+        project_id = project.id
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with SessionLocal() as db_session:
+            assert get(db_session=db_session, project_id=project_id).name == "Test Project"
+            assert len(statements) == 1
+
+            project = get(db_session=db_session, project_id=project_id)
+            assert project.description == "Test Description"
+            assert get_by_name(db_session=db_session, name="Test Project") == project
+            assert len(statements) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_create_invalidates_cache(test_db):
+    project_cache.set("public:project:name:Test Project", {"id": 1, "name": "Stale"})
+
+    with SessionLocal() as db_session:
+        project = create(db_session=db_session, project_in=ProjectCreate(name="Test Project"))
+
+        assert project_cache.get("public:project:name:Test Project") is None
+        assert get_by_name(db_session=db_session, name="Test Project").id == project.id
+
+
+def test_single_flight_shares_calls():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def call():
+        started.set()
+        release.wait(5)
+        return {"id": 1}
+
+    with ThreadPoolExecutor(4) as executor:
+        leader = executor.submit(flight.do, "key", call)
+        started.wait(5)
+        followers = [executor.submit(flight.do, "key", call) for _ in range(3)]
+        while flight.shared < 3:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [follower.result() for follower in followers]
+
+    assert results == [{"id": 1}] * 4
+    assert flight.stats() == {"calls": 1, "shared": 3}
+    # the key is free again once the call is done
+    assert flight.do("key", lambda: 2) == 2
+
+
+def test_single_flight_shares_exceptions():
+    flight = SingleFlight()
+
+    async def lookup(fail):
+        await asyncio.sleep(0.01)
+        if fail:
+            raise ValueError("failed")
+        return "value"
+
+    async def main():
+        results = await asyncio.gather(
+            *[flight.async_do("key", lambda: lookup(True)) for _ in range(3)], return_exceptions=True
+        )
+        assert [str(result) for result in results] == ["failed"] * 3
+        assert await flight.async_do("key", lambda: lookup(False)) == "value"
+
+        # the waiting callers make the call again when the caller making it is cancelled
+        leader = asyncio.ensure_future(flight.async_do("other", lambda: lookup(False)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.async_do("other", lambda: lookup(False)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "value"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
+    assert flight.stats() == {"calls": 4, "shared": 3}
+
+
+def test_concurrent_gets_share_one_query(test_db, monkeypatch):
+    project = create(db_session=test_db, project_in=ProjectCreate(name="Popular"))
+    project_cache.clear()
+    monkeypatch.setattr(service, "project_flight", SingleFlight())
+
+    statements = []
+    barrier = threading.Barrier(8)
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+        # holds the query until every lookup started, such that they overlap
+        time.sleep(0.2)
+
+    def lookup(_):
+        with SessionLocal() as db_session:
+            barrier.wait(5)
+            return get(db_session=db_session, project_id=project.id).name
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            names = list(executor.map(lookup, range(8)))
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    assert names == ["Popular"] * 8
+    assert len(statements) == 1
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import Response, StreamingResponse
+
+from app.compression import CompressionMiddleware, available_encodings, negotiate
+from app.main import app as main_app
+
+BODY = b'{"name": "Test Project", "description": "Test Description"}' * 100
+
+
+def create_app(**kwargs):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, **kwargs)
+
+    @app.get("/json")
+    def json():
+        return Response(BODY, media_type="application/json")
+
+    @app.get("/small")
+    def small():
+        return Response(b"{}", media_type="application/json")
+
+    @app.get("/image")
+    def image():
+        return Response(BODY, media_type="image/png")
+
+    @app.get("/encoded")
+    def encoded():
+        return Response(gzip.compress(BODY), media_type="application/json", headers={"Content-Encoding": "gzip"})
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([BODY] * 10), media_type="application/x-ndjson")
+
+    return app
+
+
+def test_negotiate():
+    encodings = ["br", "zstd", "gzip"]
+    assert negotiate("gzip, deflate, br, zstd", encodings) == "br"
+    assert negotiate("gzip, br;q=0.5", encodings) == "gzip"
+    assert negotiate("br;q=0, *", encodings) == "zstd"
+    assert negotiate("identity", encodings) is None
+    assert negotiate("", encodings) is None
+
+
+@pytest.mark.parametrize("encoding", list(available_encodings()))
+def test_compress(encoding):
+    client = TestClient(create_app(threadpool_size=1024))
+
+    response = client.get("/json", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(BODY)
+    assert response.content == BODY
+
+    response = client.get("/stream", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert "content-length" not in response.headers
+    assert response.content == BODY * 10
+
+
+def test_compress_skipped():
+    client = TestClient(create_app())
+
+    for path in ("/small", "/image"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    response = client.get("/encoded", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == BODY
+
+    response = client.get("/json", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.content == BODY
+
+
+def test_single_compression_layer():
+    # Test that the API is only wrapped by one compression middleware
+    def compression_layers(app):
+        return [m for m in app.user_middleware if m.cls is CompressionMiddleware]
+
+    api = next(route.app for route in main_app.routes if getattr(route, "path", None) == "/api/v1")
+    assert len(compression_layers(main_app)) == 1
+    assert compression_layers(api) == []
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, exc, select
+
+from app import config
+from app.database.core import engine, schema_registry
+from app.database.pool import AdaptiveQueuePool, PoolSaturatedError, split_budget
+from app.database.registry import SchemaRegistry
+from app.main import app
+from app.project.models import Project, ProjectRow
+
+
+def test_schema_registry_caches_engine_per_schema():
+    registry = SchemaRegistry(engine, ttl=300)
+
+    schema_engine = registry.get_engine("public")
+    assert schema_engine is not None
+    assert schema_engine is registry.get_engine("public")
+    assert schema_engine.get_execution_options()["schema_translate_map"] == {None: "public"}
+
+
+def test_schema_registry_rejects_unknown_schema():
+    registry = SchemaRegistry(engine, ttl=300)
+    assert registry.get_engine("does_not_exist") is None
+
+
+def test_schema_registry_reloads_when_expired_or_invalidated():
+    registry = SchemaRegistry(engine, ttl=300)
+    assert registry.expired
+
+    registry.load()
+    assert not registry.expired
+
+    registry.invalidate()
+    assert registry.expired
+    assert "public" in registry.schema_names
+    assert not registry.expired
+
+
+def test_schema_registry_without_ttl_always_expires():
+    registry = SchemaRegistry(engine, ttl=0)
+    registry.load()
+    assert registry.expired
+
+
+def test_schema_registry_reuses_session_factory():
+    registry = SchemaRegistry(engine, ttl=300)
+
+    session = registry.get_session("public")
+    assert session is registry.get_session("public")
+    assert registry.get_session("does_not_exist") is None
+
+
+def test_healthcheck_does_not_check_out_a_connection():
+    checkouts = []
+
+    def on_checkout(*args):
+        checkouts.append(args)
+
+    client = TestClient(app)
+    client.get("/api/v1/healthcheck")  # loads the schema names
+
+    event.listen(engine, "checkout", on_checkout)
+    try:
+        response = client.get("/api/v1/healthcheck")
+        assert response.status_code == 200
+        response = client.get("/api/v1/projects/0")
+        assert response.status_code == 422
+    finally:
+        event.remove(engine, "checkout", on_checkout)
+
+    assert checkouts == []
+
+
+def test_request_sessions_are_removed(test_db):
+    client = TestClient(app)
+    client.get("/api/v1/projects/999")
+
+    session = schema_registry.get_session("public")
+    assert session.registry.registry == {}
+
+
+def test_split_budget():
+    # sync mode: the budget is split between the workers, the threadpool caps the pool
+    assert split_budget(90, 3, False, 40) == (30, 0)
+    assert split_budget(90, 1, False, 40) == (40, 0)
+    # async mode: the sync endpoints get half of the share of the worker
+    assert split_budget(90, 3, True, 40) == (15, 15)
+    assert split_budget(1, 4, True, 40) == (1, 1)
+
+
+def create_pool_engine(**kwargs):
+    return create_engine(config.SQLALCHEMY_DATABASE_URI, poolclass=AdaptiveQueuePool, max_overflow=0, **kwargs)
+
+
+def test_pool_grows_and_shrinks():
+    pool_engine = create_pool_engine(pool_size=3, pool_min_size=1, pool_idle_timeout=0.05)
+    pool = pool_engine.pool
+
+    connections = [pool_engine.connect() for _ in range(3)]
+    assert pool.checkedout() == 3
+    for connection in connections:
+        connection.close()
+    assert pool.checkedin() == 3
+
+    # nothing is closed before the idle timeout
+    assert pool.trim() == 0
+    time.sleep(0.1)
+    assert pool.trim() == 2
+    assert pool.checkedin() == 1
+
+    # the pool grows again up to its size
+    connections = [pool_engine.connect() for _ in range(3)]
+    assert pool.checkedout() == 3
+    for connection in connections:
+        connection.close()
+    pool_engine.dispose()
+
+
+def test_saturated_pool_fails_fast():
+    pool_engine = create_pool_engine(pool_size=1, pool_timeout=0.2, pool_max_waiters=1)
+
+    with pool_engine.connect():
+        # the first caller waits, up to the pool timeout
+        start = time.perf_counter()
+        with pytest.raises(exc.TimeoutError) as e:
+            pool_engine.connect()
+        assert time.perf_counter() - start >= 0.2
+        assert not isinstance(e.value, PoolSaturatedError)
+
+        pool_engine.pool._waiters = 1
+        with pytest.raises(PoolSaturatedError):
+            pool_engine.connect()
+        pool_engine.pool._waiters = 0
+    pool_engine.dispose()
+
+
+def test_pool_timeout_is_a_503(monkeypatch):
+    schema_registry.load()
+    monkeypatch.setattr(engine.pool, "_max_waiters", 0)
+    monkeypatch.setattr(AdaptiveQueuePool, "_saturated", lambda self: True)
+
+    response = TestClient(app).get("/api/v1/projects/1")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_schema_registry_keeps_the_most_recently_used_schemas():
+    registry = SchemaRegistry(engine, ttl=300, max_size=1)
+    registry.load()
+    # no catalog query is needed to route the requests, the schema names are given here
+    registry._schema_names = frozenset({"public", "other"})
+
+    public = registry.get_session("public")
+    assert registry.get_session("public") is public
+    registry.get_session("other")
+    assert registry.get_session("public") is not public
+    assert registry.stats()["evictions"] == 2
+
+
+def test_rows_have_the_dict_of_the_model(test_db):
+    project = Project(name="Row Project", description="A description")
+    test_db.add(project)
+    test_db.commit()
+
+    row = ProjectRow._make(test_db.execute(select(*Project.__table__.columns)).one())
+    assert row == ProjectRow(**project.dict())
+    assert row.dict() == project.dict()
+    assert row.name == "Row Project"
+    assert repr(row) == f"<ProjectRow #{project.id}>"
+    assert not hasattr(row, "__dict__")
+    with pytest.raises(AttributeError):
+        row.name = "Renamed"
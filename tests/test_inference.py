@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.inference.engine import BatchingEngine, InferenceOverloadedError
+from app.inference.toy import ToyModel
+from app.main import app
+
+MODEL = "app.inference.toy:ToyModel"
+
+
+def test_predict(test_db):
+    with TestClient(app) as client:
+        response = client.post("/api/v1/inference/predict", json={"inputs": [0.5] * 16})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["probabilities"] == pytest.approx(ToyModel().predict([[0.5] * 16])[0])
+        assert data["label"] == data["probabilities"].index(max(data["probabilities"]))
+
+        response = client.post("/api/v1/inference/predict", json={"inputs": [0.5] * 3})
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["msg"] == "The model expects 16 inputs, got 3."
+
+
+def test_concurrent_predictions_are_batched():
+    engine = BatchingEngine(MODEL, max_batch_size=8, max_wait=0.05)
+    inputs = [[i / 10] * 16 for i in range(20)]
+
+    async def main():
+        try:
+            return await asyncio.gather(*[engine.predict(item) for item in inputs])
+        finally:
+            await engine.stop()
+
+    assert asyncio.run(main()) == ToyModel().predict(inputs)
+    # at most eight inputs per batch, in order
+    assert engine.stats() == {"batches": 3, "predictions": 20}
+
+
+def test_predictions_are_rejected_when_too_many_wait():
+    engine = BatchingEngine(MODEL, max_wait=0.05, max_pending=2)
+
+    async def main():
+        await engine.start()
+        try:
+            return await asyncio.gather(*[engine.predict([0.0] * 16) for _ in range(3)], return_exceptions=True)
+        finally:
+            await engine.stop()
+
+    results = asyncio.run(main())
+    assert [type(result) for result in results[:2]] == [list, list]
+    assert isinstance(results[2], InferenceOverloadedError)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session
+
+from app.database.core import Base
+from app.job.enums import JobStatus
+from app.job.models import Job, JobCreate
+from app.job.service import claim, complete, fail, submit
+from app.job.tasks import task
+from app.job.worker import JobWorker
+from app.main import app
+
+from .conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def flaky_task():
+    calls = []
+
+    @task("test.flaky")
+    def flaky(*, db_session, payload):
+        calls.append(payload)
+        if len(calls) < payload["fails"] + 1:
+            raise RuntimeError("Try again.")
+        return {"calls": len(calls)}
+
+    return calls
+
+
+def _make_due(db_session: Session, job_id: int):
+    db_session.execute(update(Job.__table__).where(Job.id == job_id).values(run_at=datetime.utcnow()))
+    db_session.commit()
+
+
+def test_submit_and_run_job(test_db):
+    with TestClient(app) as client:
+        projects = [{"name": "job-project-1"}, {"name": "job-project-2"}, {"name": "job-project-1"}]
+        response = client.post(
+            "/api/v1/jobs", json={"kind": "project.import", "payload": {"projects": projects}}
+        )
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "queued"
+
+        assert JobWorker(name="test").run_once()
+        assert not JobWorker(name="test").run_once()
+
+        response = client.get(f"/api/v1/jobs/{job['id']}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "succeeded"
+        assert data["attempts"] == 1
+        assert data["result"] == {"created": 2, "exists": 1}
+        assert client.get("/api/v1/projects", params={"total": "exact"}).json()["total"] == 2
+
+        response = client.post("/api/v1/jobs", json={"kind": "unknown", "payload": {}})
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["msg"] == "Unknown job kind: unknown"
+
+        assert client.get("/api/v1/jobs/999999").status_code == 404
+
+
+def test_failed_job_is_retried_with_backoff(test_db, flaky_task):
+    job_in = JobCreate(kind="test.flaky", payload={"fails": 1})
+    job = submit(db_session=test_db, job_in=job_in, tenant="public")
+    worker = JobWorker(name="test")
+
+    assert worker.run_once()
+    test_db.refresh(job)
+    assert job.status == JobStatus.queued
+    assert job.error == "Try again."
+    # the retry waits for its backoff
+    assert job.run_at > datetime.utcnow()
+    assert not worker.run_once()
+
+    _make_due(test_db, job.id)
+    assert worker.run_once()
+    test_db.refresh(job)
+    assert job.status == JobStatus.succeeded
+    assert job.attempts == 2
+    assert job.result == {"calls": 2}
+
+
+def test_job_fails_once_out_of_attempts(test_db, flaky_task):
+    job_in = JobCreate(kind="test.flaky", payload={"fails": 5})
+    job = submit(db_session=test_db, job_in=job_in, tenant="public")
+    worker = JobWorker(name="test")
+    for _ in range(job.max_attempts):
+        _make_due(test_db, job.id)
+        assert worker.run_once()
+    test_db.refresh(job)
+    assert job.status == JobStatus.failed
+    assert job.attempts == job.max_attempts
+
+    # an invalid payload is not retried
+    job = submit(
+        db_session=test_db,
+        job_in=JobCreate(kind="project.import", payload={"projects": [{"name": ""}]}),
+        tenant="public",
+    )
+    assert worker.run_once()
+    test_db.refresh(job)
+    assert job.status == JobStatus.failed
+    assert job.attempts == 1
+
+
+def test_expired_lease_is_claimed_again(test_db):
+    job = submit(db_session=test_db, job_in=JobCreate(kind="project.import"), tenant="public")
+    assert claim(db_session=test_db, worker="dead").id == job.id
+    assert claim(db_session=test_db, worker="other") is None
+
+    test_db.execute(
+        update(Job.__table__).where(Job.id == job.id).values(locked_at=datetime.utcnow() - timedelta(days=1))
+    )
+    test_db.commit()
+    row = claim(db_session=test_db, worker="other")
+    assert (row.id, row.attempts, row.locked_by) == (job.id, 2, "other")
+    # the dead worker no longer owns the job
+    assert not complete(db_session=test_db, job_id=job.id, worker="dead", result=None)
+    assert not fail(db_session=test_db, job=row, worker="dead", error="")
+    assert complete(db_session=test_db, job_id=job.id, worker="other", result=None)
+
+
+def test_concurrent_claims(test_db):
+    jobs = 40
+    for _ in range(jobs):
+        submit(db_session=test_db, job_in=JobCreate(kind="project.import"), tenant="public")
+
+    claimed = []
+
+    def claim_all(worker: str):
+        with TestingSessionLocal() as db_session:
+            while True:
+                row = claim(db_session=db_session, worker=worker)
+                if row is None:
+                    return
+                claimed.append(row.id)
+
+    threads = [threading.Thread(target=claim_all, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # every job is claimed by exactly one worker
+    assert sorted(claimed) == sorted(set(claimed))
+    assert len(claimed) == jobs
+
+
+def test_claim_on_sqlite(tmp_path):
+    sqlite_engine = create_engine(f"sqlite:///{tmp_path}/jobs.db")
+    Base.metadata.create_all(bind=sqlite_engine, tables=[Job.__table__])
+    with Session(sqlite_engine) as db_session:
+        job = submit(db_session=db_session, job_in=JobCreate(kind="project.import"), tenant="public")
+        row = claim(db_session=db_session, worker="test")
+        assert (row.id, row.status, row.attempts) == (job.id, JobStatus.running, 1)
+        assert claim(db_session=db_session, worker="test") is None
+        assert fail(db_session=db_session, job=row, worker="test", error="Try again.")
+        db_session.refresh(job)
+        assert job.status == JobStatus.queued
+    sqlite_engine.dispose()
+
+
+def test_tenant_jobs_are_isolated(test_db):
+    job = submit(db_session=test_db, job_in=JobCreate(kind="project.import"), tenant="other")
+    with TestClient(app) as client:
+        assert client.get(f"/api/v1/jobs/{job.id}").status_code == 404
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import logging
+import queue
+
+from app.context import _request_id_ctx_var
+from app.logging import JSONFormatter, LogWriter, NonBlockingQueueHandler
+
+
+def pipeline(maxsize: int = 100, sample_rate: int = 10):
+    log_queue = queue.Queue(maxsize=maxsize)
+    handler = NonBlockingQueueHandler(log_queue, sample_rate=sample_rate)
+    stream = io.StringIO()
+    writer = LogWriter(log_queue, handler, JSONFormatter(), stream=stream, batch_size=10)
+
+    logger = logging.getLogger("tests.logging")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.handlers = [handler]
+    return logger, handler, writer, stream
+
+
+def test_records_are_written_as_json():
+    logger, handler, writer, stream = pipeline()
+    writer.start()
+
+    token = _request_id_ctx_var.set("request-1")
+    try:
+        logger.info("Hello %s", "world")
+        try:
+            raise ValueError("failed")
+        except ValueError:
+            logger.exception("Something failed")
+    finally:
+        _request_id_ctx_var.reset(token)
+    logger.warning("Outside of a request")
+    writer.stop()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["message"] for record in records] == ["Hello world", "Something failed", "Outside of a request"]
+    assert records[0]["level"] == "INFO"
+    assert records[0]["logger"] == "tests.logging"
+    assert records[0]["request_id"] == "request-1"
+    assert "ValueError: failed" in records[1]["exc_info"]
+    assert "request_id" not in records[2]
+
+
+def test_records_are_sampled_and_dropped_under_backpressure():
+    # the writer is not started yet, such that the queue fills up
+    logger, handler, writer, stream = pipeline(maxsize=10, sample_rate=5)
+
+    for i in range(8):
+        logger.info("Filling %d", i)
+    # the queue is under backpressure, the warnings are kept and one in five records below WARNING
+    logger.warning("Kept")
+    for i in range(10):
+        logger.info("Sampled %d", i)
+    # once the queue is full every record is dropped
+    logger.warning("Dropped")
+    assert handler.queue.qsize() == 10
+    assert handler.dropped == 8 + 1 + 1
+
+    writer.start()
+    writer.stop()
+    messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+    assert messages[8:] == ["Kept", "Sampled 4", "10 log records were dropped, the log queue was full."]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import gc
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.database.core import SessionLocal
+from app.main import app
+from app.metrics import Counter, Histogram, MetricsMiddleware, MetricsRegistry, registry
+
+
+def test_counter_from_many_threads():
+    counter = Counter("test_total", "Test.", ("route",))
+
+    def inc(_):
+        for _ in range(1000):
+            counter.inc("/a")
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(inc, range(8)))
+
+    assert counter.samples() == [("test_total", '{route="/a"}', 8000)]
+
+
+def test_shards_of_finished_threads_are_folded():
+    counter = Counter("test_total", "Test.")
+
+    for _ in range(5):
+        thread = threading.Thread(target=counter.inc)
+        thread.start()
+        thread.join()
+    counter.inc()
+    del thread
+    gc.collect()
+
+    # only the shard of the running thread is left
+    assert len(counter._shards) == 1
+    assert counter.samples() == [("test_total", "", 6)]
+    counter.clear()
+    assert counter.samples() == []
+
+
+def test_render():
+    metrics = MetricsRegistry()
+    histogram = metrics.register(Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1)))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+    metrics.gauge("test_size", "Test.", lambda: 3)
+
+    assert metrics.render().splitlines() == [
+        "# HELP test_seconds Test.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_seconds_bucket{route="/a",le="1"} 2',
+        'test_seconds_bucket{route="/a",le="+Inf"} 3',
+        'test_seconds_sum{route="/a"} 5.55',
+        'test_seconds_count{route="/a"} 3',
+        "# HELP test_size Test.",
+        "# TYPE test_size gauge",
+        "test_size 3",
+    ]
+
+
+def test_metrics_endpoint(test_db):
+    registry.clear()
+    client = TestClient(app)
+    project_id = client.post("/api/v1/projects", json={"name": "Test Project"}).json()["id"]
+    client.get(f"/api/v1/projects/{project_id}")
+    client.get("/api/v1/unknown")
+
+    response = client.get("/api/v1/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    assert 'http_requests_total{method="POST",route="/projects",status="200"} 1' in lines
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="/projects/{project_id}"} 1' in lines
+    assert any(line.startswith('http_request_db_queries_sum{method="POST",route="/projects"}') for line in lines)
+    assert 'db_pool_checked_out{driver="psycopg2"} 0' in lines
+
+
+def test_n_plus_one(caplog):
+    registry.clear()
+    n_plus_one_app = FastAPI()
+    n_plus_one_app.add_middleware(MetricsMiddleware, n_plus_one_threshold=2)
+
+    @n_plus_one_app.get("/queries/{count}")
+    def queries(count: int):
+        with SessionLocal() as db_session:
+            for _ in range(count):
+                db_session.execute(text("SELECT 1"))
+
+    client = TestClient(n_plus_one_app)
+    with caplog.at_level(logging.WARNING, logger="app.metrics"):
+        client.get("/queries/2")
+        assert not caplog.records
+        client.get("/queries/3")
+
+    assert "executed 3 SQL statements" in caplog.records[0].getMessage()
+    samples = registry.get("http_requests_n_plus_one_total").samples()
+    assert samples == [("http_requests_n_plus_one_total", '{method="GET",route="/queries/{count}"}', 1)]
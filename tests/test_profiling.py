@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import signal
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from starlette.datastructures import Secret
+
+from app.database.core import SessionLocal, engine
+from app.main import app
+from app.profiling import Profiler, ProfilingMiddleware, profiler
+
+
+def busy_endpoint():
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        pass
+
+
+def create_app(profiler):
+    profiled_app = FastAPI()
+    profiled_app.add_middleware(ProfilingMiddleware, profiler=profiler)
+    profiled_app.get("/busy")(busy_endpoint)
+    profiled_app.get("/other")(lambda: None)
+    return profiled_app
+
+
+def test_profiling_disabled():
+    profiler = Profiler(sample_rate=1)
+    profiler.add_engine(engine)
+    assert not event.contains(engine, "after_cursor_execute", profiler._after_cursor_execute)
+
+    TestClient(create_app(profiler)).get("/busy")
+    assert profiler.profiles == {}
+    assert profiler.sampler._thread is None
+
+
+def test_sampled_profile(tmp_path):
+    profiler = Profiler(sample_rate=1, interval=0.005, output_dir=str(tmp_path))
+    profiler.configure(enabled=True)
+    try:
+        TestClient(create_app(profiler)).get("/busy")
+    finally:
+        profiler.configure(enabled=False)
+
+    collapsed = profiler.collapsed("/busy")
+    assert "busy_endpoint (" in collapsed
+    # one line per stack: the frames outermost first and the number of samples
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+    # the profiles are written once profiling is disabled
+    assert os.listdir(tmp_path) == ["busy.collapsed"]
+
+
+def test_slow_queries():
+    profiler = Profiler(slow_query_threshold=0)
+    profiler.add_engine(engine)
+    profiler.configure(enabled=True)
+    try:
+        with SessionLocal() as db_session:
+            db_session.execute(text("SELECT :value AS value"), {"value": 1})
+    finally:
+        profiler.configure(enabled=False)
+
+    assert not event.contains(engine, "after_cursor_execute", profiler._after_cursor_execute)
+    slow_query = profiler.slow_queries[-1]
+    assert slow_query["statement"] == "SELECT %(value)s AS value"
+    assert "Plan" in slow_query["plan"][0]
+
+
+def test_failed_explain_keeps_the_transaction():
+    profiler = Profiler(slow_query_threshold=0)
+    profiler.add_engine(engine)
+    profiler.configure(enabled=True)
+    try:
+        with SessionLocal() as db_session:
+            # the EXPLAIN fails since the statement created the table
+            db_session.execute(text("SELECT 1 AS value INTO TEMP profiling_explained"))
+            assert db_session.execute(text("SELECT value FROM profiling_explained")).scalar() == 1
+            db_session.rollback()
+    finally:
+        profiler.configure(enabled=False)
+
+    plans = [slow_query["plan"] for slow_query in profiler.slow_queries]
+    assert plans[0].startswith("EXPLAIN failed: ")
+    assert "Plan" in plans[1][0]
+
+
+def test_admin_token(monkeypatch):
+    client = TestClient(app)
+    # without a token the endpoints are disabled
+    assert client.get("/api/v1/profiling", headers={"X-Admin-Token": ""}).status_code == 403
+
+    monkeypatch.setattr("app.api.PROFILING_ADMIN_TOKEN", Secret("admin"))
+    for method, path in [
+        ("get", "/api/v1/profiling"),
+        ("put", "/api/v1/profiling"),
+        ("get", "/api/v1/profiling/profiles"),
+        ("post", "/api/v1/profiling/profiles"),
+        ("get", "/api/v1/profiling/slow-queries"),
+    ]:
+        assert client.request(method, path, json={}).status_code == 403
+        assert client.request(method, path, json={}, headers={"X-Admin-Token": "other"}).status_code == 403
+    assert client.get("/api/v1/profiling", headers={"X-Admin-Token": "admin"}).status_code == 200
+
+
+def test_switch_at_runtime(monkeypatch):
+    monkeypatch.setattr("app.api.PROFILING_ADMIN_TOKEN", Secret("admin"))
+    client = TestClient(app, headers={"X-Admin-Token": "admin"})
+    try:
+        response = client.put("/api/v1/profiling", json={"enabled": True, "sample_rate": 0.5})
+        assert response.json()["enabled"] is True
+        assert profiler.sample_rate == 0.5
+        assert client.put("/api/v1/profiling", json={"sample_rate": 2}).status_code == 422
+
+        # the signal handler is installed by the lifespan, tests do the same from the main thread
+        if hasattr(signal, "SIGUSR2"):
+            assert profiler.install_signal_handler()
+            os.kill(os.getpid(), signal.SIGUSR2)
+            assert client.get("/api/v1/profiling").json()["enabled"] is False
+        else:
+            assert not profiler.install_signal_handler()
+    finally:
+        profiler.configure(enabled=False, sample_rate=0.01)
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, signal.SIG_DFL)
@@ -1,33 +1,23 @@
 # -*- coding: utf-8 -*-
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
 
 from app.main import app
-from app.database.core import Base
-from app.config import SQLALCHEMY_DATABASE_URI
+from app.project import service
+from app.project.models import Project
+from app.project.service import search
 
-# Create test database engine
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-@pytest.fixture
-def test_db():
-    # Create the test database and tables
-    Base.metadata.create_all(bind=engine)
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-        # Clean up the test database
-        Base.metadata.drop_all(bind=engine)
 
 @pytest.fixture
 def client():
     return TestClient(app)
 
+
 def test_create_project(client, test_db):
     # Test creating a new project
     response = client.post(
@@ -39,19 +29,33 @@ def test_create_project(client, test_db):
     assert data["name"] == "Test Project"
     assert data["description"] == "Test Description"
 
+
 def test_create_duplicate_project(client, test_db):
     # Test creating a project with duplicate name
     project_data = {"name": "Test Project", "description": "Test Description"}
-    
+
     # Create first project
     response = client.post("/api/v1/projects/", json=project_data)
     assert response.status_code == 200
-    
+
     # Try to create duplicate project
     response = client.post("/api/v1/projects/", json=project_data)
     assert response.status_code == 422
     assert "already exists" in response.json()["detail"][0]["msg"]
 
+
+def test_create_duplicate_project_concurrently(client, test_db):
+    # Test that only one of many concurrent creates with the same name succeeds
+    project_data = {"name": "Test Project", "description": "Test Description"}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(
+            executor.map(lambda _: client.post("/api/v1/projects/", json=project_data), range(8))
+        )
+
+    assert sorted(response.status_code for response in responses) == [200] + [422] * 7
+
+
 def test_get_project(client, test_db):
     # Create a project first
     create_response = client.post(
@@ -59,7 +63,7 @@ def test_get_project(client, test_db):
         json={"name": "Test Project", "description": "Test Description"}
     )
     project_id = create_response.json()["id"]
-    
+
     # Test getting the project
     response = client.get(f"/api/v1/projects/{project_id}")
     assert response.status_code == 200
@@ -67,14 +71,326 @@ def test_get_project(client, test_db):
     assert data["name"] == "Test Project"
     assert data["description"] == "Test Description"
 
+
 def test_get_nonexistent_project(client, test_db):
     # Test getting a project that doesn't exist
     response = client.get("/api/v1/projects/999")
     assert response.status_code == 404
     assert "does not exist" in response.json()["detail"][0]["msg"]
 
+
 def test_healthcheck(client):
     # Test the healthcheck endpoint
     response = client.get("/api/v1/healthcheck")
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
\ No newline at end of file
+    assert response.json() == {"status": "ok"}
+
+
+def test_bulk_create_projects(client, test_db):
+    client.post("/api/v1/projects/", json={"name": "Existing Project"})
+
+    response = client.post(
+        "/api/v1/projects/bulk",
+        json=[
+            {"name": "Project One", "description": "One"},
+            {"name": "Existing Project"},
+            {"name": "Project Two"},
+            {"name": "Project One"},
+        ]
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["status"] for item in data] == ["created", "exists", "created", "exists"]
+    assert data[0]["project"]["name"] == "Project One"
+    assert data[0]["project"]["description"] == "One"
+    assert "already exists" in data[1]["msg"]
+
+    response = client.get(f"/api/v1/projects/{data[2]['project']['id']}")
+    assert response.json()["name"] == "Project Two"
+
+
+def test_bulk_create_projects_in_batches(test_db):
+    from sqlalchemy import event
+
+    from app.database.core import SessionLocal, engine
+    from app.project.models import ProjectCreate
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    projects_in = [ProjectCreate(name=f"Project {i}") for i in range(5)] + [ProjectCreate(name="Project 0")]
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with SessionLocal() as db_session:
+            rows = service.create_all(db_session=db_session, projects_in=projects_in, batch_size=2)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    assert len([statement for statement in statements if statement.startswith("INSERT")]) == 3
+    assert [row.name if row else None for row in rows] == [f"Project {i}" for i in range(5)] + [None]
+
+
+def test_bulk_create_projects_ndjson(client, test_db):
+    lines = [
+        '{"name": "Project One"}',
+        '{"name": ""}',
+        '',
+        '{"name": "Project One"}',
+        '{"name": "Project Two", "description": "Two"}',
+    ]
+    response = client.post(
+        "/api/v1/projects/bulk/ndjson",
+        content="\n".join(lines).encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    data = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["status"] for item in data] == ["created", "invalid", "exists", "created"]
+    assert data[3]["project"]["description"] == "Two"
+
+
+def test_list_projects(client, test_db):
+    # Test the offset pagination, filtering and sorting of the listing
+    client.post("/api/v1/projects/bulk", json=[{"name": f"Project {i}"} for i in range(5)])
+
+    response = client.get("/api/v1/projects", params={"itemsPerPage": 2, "page": 2, "total": "exact"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 5
+    assert [item["name"] for item in data["items"]] == ["Project 2", "Project 3"]
+
+    response = client.get(
+        "/api/v1/projects",
+        params={
+            "filter": json.dumps([{"field": "name", "op": "in", "value": ["Project 1", "Project 3"]}]),
+            "sortBy": "name",
+            "descending": "true",
+            "total": "none",
+        },
+    )
+    data = response.json()
+    assert data["total"] is None
+    assert data["next"] is None
+    assert [item["name"] for item in data["items"]] == ["Project 3", "Project 1"]
+
+    response = client.get(
+        "/api/v1/projects", params={"filter": json.dumps([{"field": "nope", "op": "==", "value": 1}])}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["filter"]
+
+    # values the database can not cast to the type of the column
+    for total in ("exact", "estimate", "none"):
+        response = client.get(
+            "/api/v1/projects",
+            params={"filter": json.dumps([{"field": "id", "op": ">", "value": "abc"}]), "total": total},
+        )
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["filter"]
+    # the session is still usable afterwards
+    assert client.get("/api/v1/projects").status_code == 200
+
+    response = client.get("/api/v1/projects", params={"sortBy": ["name", "nope"]})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["sortBy"]
+
+
+def test_list_projects_with_cursor(client, test_db):
+    # Test that following the cursors walks through every project exactly once
+    client.post("/api/v1/projects/bulk", json=[{"name": f"Project {i}"} for i in range(5)])
+
+    for sort_by in ("id", "created_at"):
+        names, cursor = [], None
+        while True:
+            params = {"itemsPerPage": 2, "sortBy": sort_by, "descending": "true"}
+            if cursor:
+                params["cursor"] = cursor
+            data = client.get("/api/v1/projects", params=params).json()
+            names += [item["name"] for item in data["items"]]
+            cursor = data["next"]
+            if not cursor:
+                break
+        assert names == [f"Project {i}" for i in reversed(range(5))]
+
+    response = client.get("/api/v1/projects", params={"cursor": "garbage"})
+    assert response.status_code == 422
+    response = client.get("/api/v1/projects", params={"cursor": cursor or "x", "sortBy": "name"})
+    assert response.status_code == 422
+
+
+def test_export_projects(client, test_db):
+    # Test exporting all projects as NDJSON and CSV
+    client.post("/api/v1/projects/bulk", json=[{"name": f"Project {i}"} for i in range(3)])
+
+    response = client.get("/api/v1/projects/export", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["name"] for row in rows] == ["Project 0", "Project 1", "Project 2"]
+    assert rows[0]["created_at"].endswith("Z")
+
+    response = client.get(
+        "/api/v1/projects/export", params={"format": "csv"}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-encoding"] == "gzip"
+    lines = response.text.splitlines()
+    assert lines[0] == "id,name,description,created_at,updated_at"
+    assert len(lines) == 4
+
+
+def test_fast_serialization_matches_pydantic(client, test_db):
+    # Test that responses rendered without validation equal the ones of the pydantic path
+    from fastapi.encoders import jsonable_encoder
+    from starlette.responses import JSONResponse
+
+    from app.database.core import SessionLocal
+    from app.project.models import Project, ProjectPagination, ProjectRead
+    from app.responses import ORJSONResponse
+
+    client.post("/api/v1/projects/", json={"name": "Test Project"})
+    client.post("/api/v1/projects/", json={"name": "Other Project", "description": "Test Description"})
+
+    with SessionLocal() as db_session:
+        projects = db_session.query(Project).order_by(Project.id).all()
+        pagination = {"items": projects, "itemsPerPage": 10, "page": 1, "total": 2, "next": None}
+
+        for model, obj in [(ProjectRead, projects[0]), (ProjectRead, projects[1]), (ProjectPagination, pagination)]:
+            expected = JSONResponse(jsonable_encoder(model.parse_obj(obj) if obj is pagination else model.from_orm(obj))).body
+            assert ORJSONResponse(model.dump_orm(obj)).body == expected
+
+    response = client.get(f"/api/v1/projects/{projects[0].id}")
+    assert response.content == JSONResponse(jsonable_encoder(ProjectRead.from_orm(projects[0]))).body
+
+
+def test_get_project_conditionally(client, test_db):
+    # Test that clients with an up to date copy of a project get a 304 without a body
+    from sqlalchemy import event, text
+
+    from app.database.core import engine
+    from app.project.service import invalidate, project_cache
+
+    project_id = client.post("/api/v1/projects/", json={"name": "Test Project"}).json()["id"]
+
+    response = client.get(f"/api/v1/projects/{project_id}")
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+    assert response.headers["cache-control"] == "private, no-cache"
+    # weak, the compressed bodies share it
+    assert etag.startswith('W/"')
+
+    # the version is read without loading the project
+    project_cache.clear()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(f"/api/v1/projects/{project_id}", headers={"If-None-Match": etag})
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert len(statements) == 1 and "project.name" not in statements[0]
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["last-modified"] == last_modified
+
+    response = client.get(f"/api/v1/projects/{project_id}", headers={"If-None-Match": f'"other", {etag[2:]}'})
+    assert response.status_code == 304
+    response = client.get(f"/api/v1/projects/{project_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    response = client.get(f"/api/v1/projects/{project_id}", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+    # an update changes the version
+    with engine.begin() as connection:
+        connection.execute(
+            text("UPDATE project SET updated_at = updated_at + interval '1 second' WHERE id = :id"),
+            {"id": project_id},
+        )
+    invalidate(project_id=project_id, name="Test Project")
+    response = client.get(f"/api/v1/projects/{project_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    response = client.get(f"/api/v1/projects/{project_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+
+
+SEARCH_PROJECTS = [
+    {"name": "Apollo Guidance", "description": "Apollo navigation software"},
+    {"name": "Gemini", "description": "Apollo precursor"},
+    {"name": "Mercury", "description": "First flights"},
+    {"name": "Apollo Soyuz", "description": None},
+]
+
+
+def test_search_projects(client, test_db, monkeypatch):
+    # the fuzzy matches depend on pg_trgm, they are left out here
+    monkeypatch.setattr(service, "_has_trigram", lambda db_session: False)
+    client.post("/api/v1/projects/bulk", json=SEARCH_PROJECTS)
+
+    response = client.get("/api/v1/projects/search", params={"q": "apollo"})
+    assert response.status_code == 200
+    data = response.json()
+    # the project naming it twice ranks first
+    assert [item["name"] for item in data["items"]] == ["Apollo Guidance", "Gemini", "Apollo Soyuz"]
+    assert data["total"] is None
+
+    # the words match the words starting with them, all of them
+    def names(params):
+        return [item["name"] for item in client.get("/api/v1/projects/search", params=params).json()["items"]]
+
+    assert names({"q": "apol sOy"}) == ["Apollo Soyuz"]
+    assert names({"q": "flight"}) == ["Mercury"]
+    assert names({"q": "apollo", "itemsPerPage": 2, "page": 2}) == ["Apollo Soyuz"]
+    assert names({"q": "voyager"}) == []
+    assert names({"q": "!?"}) == []
+    assert client.get("/api/v1/projects/search", params={"q": ""}).status_code == 422
+
+
+def test_search_projects_fuzzily(client, test_db):
+    if not service._has_trigram(test_db):
+        pytest.skip("pg_trgm is not installed")
+    client.post("/api/v1/projects/bulk", json=SEARCH_PROJECTS)
+
+    def names(q):
+        response = client.get("/api/v1/projects/search", params={"q": q})
+        return [item["name"] for item in response.json()["items"]]
+
+    # parts of names and names with typos
+    assert names("soyu") == ["Apollo Soyuz"]
+    assert names("Merkury") == ["Mercury"]
+
+
+def test_search_projects_on_sqlite(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/projects.db")
+    Project.__table__.create(engine)
+    with Session(engine) as db_session:
+        db_session.execute(
+            Project.__table__.insert(),
+            [
+                {"name": "Apollo Guidance", "description": "Navigation software"},
+                {"name": "Gemini", "description": "Apollo precursor"},
+                {"name": "Mercury", "description": "First flights"},
+            ],
+        )
+        db_session.commit()
+
+        # any part of a word matches
+        assert {row.name for row in search(db_session=db_session, q="pollo")} == {"Apollo Guidance", "Gemini"}
+        assert [row.name for row in search(db_session=db_session, q="pollo soft")] == ["Apollo Guidance"]
+        assert search(db_session=db_session, q="ap") == []
+
+        # the index follows the changes of the projects
+        db_session.execute(Project.__table__.update().where(Project.name == "Mercury").values(name="Vostok"))
+        db_session.execute(Project.__table__.delete().where(Project.name == "Gemini"))
+        db_session.commit()
+        assert [row.name for row in search(db_session=db_session, q="vost")] == ["Vostok"]
+        assert [row.name for row in search(db_session=db_session, q="pollo")] == ["Apollo Guidance"]
+    Project.__table__.drop(engine)
+    engine.dispose()
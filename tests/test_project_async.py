@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic.error_wrappers import ValidationError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import SQLALCHEMY_ASYNC_DATABASE_URI
+from app.database.core import engine
+from app.database.registry import SchemaRegistry
+from app.main import validation_error
+from app.project.service import project_cache
+from app.project.views import async_router
+
+
+@pytest.fixture
+def client():
+    # connections can not be shared between the event loops of different test clients
+    async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URI, poolclass=NullPool)
+    registry = SchemaRegistry(engine, async_engine=async_engine)
+
+    app = FastAPI()
+    app.add_exception_handler(ValidationError, validation_error)
+    app.include_router(async_router, prefix="/projects")
+
+    @app.middleware("http")
+    async def db_session_middleware(request, call_next):
+        request.state.async_db = registry.get_async_session("public")
+        return await call_next(request)
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_create_project(client, test_db):
+    response = client.post(
+        "/projects", json={"name": "Test Project", "description": "Test Description"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["id"]
+    assert data["name"] == "Test Project"
+    assert data["description"] == "Test Description"
+
+
+def test_create_duplicate_project(client, test_db):
+    project_data = {"name": "Test Project", "description": "Test Description"}
+
+    response = client.post("/projects", json=project_data)
+    assert response.status_code == 200
+
+    response = client.post("/projects", json=project_data)
+    assert response.status_code == 422
+    assert "already exists" in response.json()["detail"][0]["msg"]
+
+
+def test_get_project(client, test_db):
+    create_response = client.post(
+        "/projects", json={"name": "Test Project", "description": "Test Description"}
+    )
+    project_id = create_response.json()["id"]
+
+    response = client.get(f"/projects/{project_id}")
+    assert response.status_code == 200
+    assert response.json() == create_response.json()
+
+
+def test_get_is_read_through(client, test_db):
+    project_id = client.post("/projects", json={"name": "Test Project"}).json()["id"]
+
+    response = client.get(f"/projects/{project_id}")
+    assert project_cache.get(f"public:project:id:{project_id}")["name"] == "Test Project"
+    hits = project_cache.stats()["hits"]
+    # the version of the conditional request and the project are then read from the cache
+    etag = response.headers["etag"]
+    assert client.get(f"/projects/{project_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/projects/{project_id}").json() == response.json()
+    assert project_cache.stats()["hits"] - hits == 2
+
+
+def test_get_nonexistent_project(client, test_db):
+    response = client.get("/projects/999")
+    assert response.status_code == 404
+    assert "does not exist" in response.json()["detail"][0]["msg"]
+
+
+def test_get_project_conditionally(client, test_db):
+    project_id = client.post("/projects", json={"name": "Test Project"}).json()["id"]
+    etag = client.get(f"/projects/{project_id}").headers["etag"]
+
+    response = client.get(f"/projects/{project_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert client.get("/projects/999", headers={"If-None-Match": etag}).status_code == 404
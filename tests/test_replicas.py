@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from app.config import SQLALCHEMY_DATABASE_URI
+from app.context import get_request_id
+from app.database import core
+from app.database.core import Base, engine
+from app.database.registry import SchemaRegistry
+from app.database.replicas import ReplicaSet
+from app.main import app
+from app.project.service import project_cache
+
+REPLICA_DATABASE = "inference_replica"
+
+
+@pytest.fixture
+def replica(test_db, monkeypatch):
+    """A second local database standing in for a replica, it is not replicated to."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if not connection.execute(
+            text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": REPLICA_DATABASE}
+        ).scalar():
+            connection.execute(text(f"CREATE DATABASE {REPLICA_DATABASE}"))
+
+    replica_engine = create_engine(make_url(SQLALCHEMY_DATABASE_URI).set(database=REPLICA_DATABASE))
+    Base.metadata.create_all(bind=replica_engine)
+    replica_set = ReplicaSet([replica_engine])
+    registry = SchemaRegistry(engine, scopefunc=get_request_id, replica_set=replica_set)
+    monkeypatch.setattr(core, "schema_registry", registry)
+    try:
+        yield replica_engine
+    finally:
+        Base.metadata.drop_all(bind=replica_engine)
+        replica_engine.dispose()
+
+
+def test_reads_go_to_the_replica(replica):
+    with replica.begin() as connection:
+        connection.execute(text("INSERT INTO project (id, name) VALUES (1, 'On the replica')"))
+
+    response = TestClient(app).get("/api/v1/projects/1")
+    assert response.status_code == 200
+    assert response.json()["name"] == "On the replica"
+
+
+def test_clients_read_their_writes(replica):
+    client = TestClient(app)
+    response = client.post("/api/v1/projects", json={"name": "On the primary"})
+    assert response.status_code == 200
+    assert "read_primary" in response.cookies
+    project_id = response.json()["id"]
+
+    # the client that wrote reads from the primary for a while, the other ones from the replica
+    project_cache.clear()
+    assert client.get(f"/api/v1/projects/{project_id}").status_code == 200
+    project_cache.clear()
+    assert TestClient(app).get(f"/api/v1/projects/{project_id}").status_code == 404
+
+
+def test_reads_go_to_the_primary_without_healthy_replica(replica):
+    core.schema_registry.replica_set.engines.append(create_engine("postgresql+psycopg2://nobody@127.0.0.1:1/none"))
+    assert core.schema_registry.replica_set.check() == [0]
+    core.schema_registry.replica_set.mark_down(0)
+    assert core.schema_registry.replica_set.choose() is None
+
+    client = TestClient(app)
+    project_id = client.post("/api/v1/projects", json={"name": "On the primary"}).json()["id"]
+    project_cache.clear()
+    assert TestClient(app).get(f"/api/v1/projects/{project_id}").status_code == 200
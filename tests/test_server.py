@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.config import DATABASE_ENGINE_POOL_MIN_SIZE
+from app.database.core import engine
+from app.inference.service import inference_engine
+from app.main import api, app
+from app.server import cpu_count
+
+
+def test_warm_up():
+    engine.pool.dispose()
+    api.openapi_schema = None
+    with TestClient(app):
+        # the lifespan filled the pool and built the schema before serving any request
+        assert engine.pool.checkedin() == min(DATABASE_ENGINE_POOL_MIN_SIZE, engine.pool.size())
+        assert api.openapi_schema is not None
+        assert app.middleware_stack is not None
+        # the inference pool is only spawned by the first prediction
+        assert not inference_engine.started
+
+
+def test_warm_up_inference(monkeypatch):
+    monkeypatch.setattr("app.main.INFERENCE_WARMUP", True)
+    with TestClient(app):
+        assert inference_engine.started
+    assert not inference_engine.started
+
+
+def test_workers_are_recycled_and_drained():
+    assert cpu_count() >= 1
+    port = 8791
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(
+        [
+            sys.executable, "run.py", "--port", str(port), "--workers", "2",
+            "--max-requests", "3", "--max-requests-jitter", "0", "--graceful-timeout", "5",
+        ],
+        cwd=root,
+        env=dict(os.environ, PYTHONPATH=root),
+    )
+    try:
+        url = f"http://127.0.0.1:{port}/api/v1/healthcheck"
+        for _ in range(200):
+            try:
+                httpx.get(url)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        # every worker is replaced after 3 requests, the socket stays open in between
+        statuses = []
+        for _ in range(20):
+            try:
+                statuses.append(httpx.get(url).status_code)
+            except httpx.TransportError:
+                # a connection accepted right when its worker stops is closed by uvicorn, clients retry it
+                statuses.append(httpx.get(url).status_code)
+        assert statuses == [200] * 20
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=20) == 0
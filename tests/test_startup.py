@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import re
+import subprocess
+import sys
+
+import app
+
+# cumulative import time of app.main in microseconds, as reported by `python -X importtime`
+IMPORT_BUDGET = 1_500_000
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| *(\S+)")
+
+
+def import_times(module: str) -> dict:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    return {name: int(cumulative) for cumulative, name in IMPORTTIME_LINE.findall(stderr)}
+
+
+def test_import_budget():
+    # the best of a few runs, the first one may read the modules from disk
+    times = min((import_times("app.main") for _ in range(3)), key=lambda times: times["app.main"])
+    assert times["app.main"] < IMPORT_BUDGET
+    # the database drivers are loaded by the lifespan and the version only when asked for
+    assert "psycopg2" not in times
+    assert "pkg_resources" not in times
+
+
+def test_version():
+    assert app.__build__ == app.get_revision()
+    assert app.get_version().startswith(app.__version__)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from starlette.datastructures import Headers
+
+from app import main
+from app.database.core import Base, engine, schema_registry
+from app.main import app
+from app.project.models import Project  # noqa: F401
+from app.tenant import TenantResolver, decode_token
+
+SECRET = "secret"
+
+
+def token(claims: dict, secret: str = SECRET) -> str:
+    def encode(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+    signing_input = encode(json.dumps({"alg": "HS256", "typ": "JWT"}).encode()) + "." + encode(
+        json.dumps(claims).encode()
+    )
+    signature = hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return signing_input + "." + encode(signature)
+
+
+def test_resolve_from_header():
+    resolver = TenantResolver("header")
+    assert resolver.resolve(Headers({"x-tenant": "acme"})) == "acme"
+    assert resolver.resolve(Headers({})) == "public"
+    assert TenantResolver("header", default="").resolve(Headers({})) is None
+
+
+def test_resolve_from_subdomain():
+    resolver = TenantResolver("subdomain", domain="example.com", default="")
+    assert resolver.resolve(Headers({"host": "Acme.example.com:8000"})) == "acme"
+    assert resolver.resolve(Headers({"host": "example.com"})) is None
+    assert resolver.resolve(Headers({"host": "a.b.example.com"})) is None
+    assert resolver.resolve(Headers({"host": "acme.example.org"})) is None
+    with pytest.raises(ValueError):
+        TenantResolver("subdomain")
+
+
+def test_resolve_from_token():
+    resolver = TenantResolver("token", secret=SECRET)
+    assert resolver.resolve(Headers({"authorization": f"Bearer {token({'tenant': 'acme'})}"})) == "acme"
+    assert resolver.resolve(Headers({})) == "public"
+    for invalid in (
+        token({"tenant": "acme"}, secret="other"),
+        token({"tenant": "acme", "exp": time.time() - 1}),
+        token({"sub": "user"}),
+        "not.a.token",
+    ):
+        assert resolver.resolve(Headers({"authorization": f"Bearer {invalid}"})) is None
+    assert decode_token(token({"tenant": "acme", "exp": time.time() + 60}), SECRET.encode())["tenant"] == "acme"
+
+
+@pytest.fixture
+def tenants(test_db):
+    with engine.begin() as connection:
+        for schema in ("tenant_a", "tenant_b"):
+            connection.execute(text(f"CREATE SCHEMA {schema}"))
+            Base.metadata.create_all(bind=connection.execution_options(schema_translate_map={None: schema}))
+    schema_registry.invalidate()
+    resolver, main.tenant_resolver = main.tenant_resolver, TenantResolver("header", default="")
+    try:
+        yield
+    finally:
+        main.tenant_resolver = resolver
+        with engine.begin() as connection:
+            connection.execute(text("DROP SCHEMA tenant_a, tenant_b CASCADE"))
+        schema_registry.invalidate()
+
+
+def test_requests_are_routed_by_tenant(tenants):
+    client = TestClient(app)
+    response = client.post("/api/v1/projects", json={"name": "Project A"}, headers={"X-Tenant": "tenant_a"})
+    assert response.status_code == 200
+    project_id = response.json()["id"]
+
+    # the same id in the other tenant is another (missing) project, not the cached one of tenant_a
+    assert client.get(f"/api/v1/projects/{project_id}", headers={"X-Tenant": "tenant_a"}).status_code == 200
+    assert client.get(f"/api/v1/projects/{project_id}", headers={"X-Tenant": "tenant_b"}).status_code == 404
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM tenant_a.project")).scalar() == 1
+        assert connection.execute(text("SELECT count(*) FROM public.project")).scalar() == 0
+
+
+def test_unknown_tenants_are_rejected_without_a_query(tenants):
+    client = TestClient(app)
+    client.get("/api/v1/healthcheck", headers={"X-Tenant": "tenant_a"})  # loads the schema names
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        for tenant in ("unknown", "pg_catalog", "information_schema"):
+            response = client.get("/api/v1/projects", headers={"X-Tenant": tenant})
+            assert response.status_code == 404
+            assert response.json() == {"detail": [{"msg": f"Unknown tenant: {tenant}"}]}
+        assert client.get("/api/v1/projects").status_code == 400
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert statements == []